@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+
+"""
+GAMBY Graphics Tool Benchmarks
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Part of the GAMBY toolset: https://github.com/logicalzero/gamby.tools
+
+Measures the throughput of the conversion code in `gamby`, one stage at a
+time, using synthesized images: decoding, dithering, packing bits,
+creating masks, the complete conversion, generating code, converting the
+code back into images ('undo'), and drawing the data on an emulated
+screen ('preview'). The images are generated from a fixed seed, so
+results can be compared from run to run, and against a saved baseline.
+The 'dither' stage converts the decoded frames with the 'stable' method,
+the one that does the most work per frame.
+
+@var CASES: The images to benchmark: a list of `(name, mode, width,
+    height, frames, transparent)` tuples.
+@var STAGES: The names of the stages, in the order they are run.
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+
+from io import BytesIO
+
+import gamby
+from gamby import Image, ImageSequence
+
+CASES = [
+    ('sprite_8x8', 'sprite', 8, 8, 1, False),
+    ('sprite_16x16_mask', 'sprite', 16, 16, 1, True),
+    ('sprite_13x11_mask', 'sprite', 13, 11, 1, True),
+    ('anim_24x16x8_mask', 'sprite', 24, 16, 8, True),
+    ('anim_32x32x16', 'sprite', 32, 32, 16, False),
+    ('icon_64x8', 'icon', 64, 8, 1, False),
+    ('splash_96x64', 'splash', 96, 64, 1, False),
+    ('tileset_16x16', 'tileset', 16, 16, 1, False),
+]
+
+STAGES = ['decode', 'dither', 'pack', 'mask', 'convert', 'emit', 'undo',
+          'preview']
+
+##############################################################################
+
+def makeImage(width, height, frames=1, transparent=False, seed=0):
+    """ Synthesize a GIF image: random blocks of black and white (and
+        transparency, if `transparent`), so the data has runs as well as
+        noise. The same arguments always produce the same image.
+
+        @param width: The image's width.
+        @param height: The image's height.
+        @param frames: The number of frames.
+        @param transparent: If `True`, the image has a transparent color.
+        @param seed: The random seed.
+        @return: The encoded GIF.
+        @rtype: bytes
+    """
+    rand = random.Random(seed)
+    colors = 3 if transparent else 2
+    images = []
+    for n in range(frames):
+        img = Image.new('P', (width, height), 0)
+        img.putpalette([0, 0, 0, 255, 255, 255, 255, 0, 255] + [0] * 759)
+        pixels = img.load()
+        for y in range(0, height, 2):
+            for x in range(0, width, 2):
+                c = rand.randrange(colors)
+                for dy in range(min(2, height - y)):
+                    for dx in range(min(2, width - x)):
+                        pixels[x + dx, y + dy] = c
+        images.append(img)
+    out = BytesIO()
+    params = {'transparency': 2} if transparent else {}
+    if frames > 1:
+        params.update(save_all=True, append_images=images[1:])
+    images[0].save(out, 'GIF', **params)
+    return out.getvalue()
+
+
+class Case(object):
+    """ One image to benchmark, with a method for each stage. Each stage
+        starts from data prepared in advance, so only that stage is timed.
+
+        @ivar name: The name of the case.
+        @ivar converter: The converter class (e.g. `gamby.Sprites`).
+        @ivar data: The encoded image.
+        @ivar frames: The number of frames (rows, for splash screens).
+        @ivar size: The number of bytes of generated data.
+        @ivar arrays: The converted data, the input of the 'emit' stage.
+        @ivar code: The generated code, the input of the 'undo' stage.
+        @ivar asset: The converted data as an `Asset`, the input of the
+            'preview' stage.
+        @ivar decoded: The decoded frames, the input of the 'dither', 'pack'
+            and 'mask' stages.
+    """
+
+    def __init__(self, name, mode, width, height, frames=1,
+                 transparent=False, seed=0):
+        self.name = name
+        self.converter = gamby.MODES[mode]
+        self.data = makeImage(width, height, frames, transparent, seed)
+        self.mask = self.converter._useMask and transparent
+        self.arrays, _, self.size = self.convert()
+        if issubclass(self.converter, gamby.Splashscreens):
+            self.frames = height // 8
+        else:
+            self.frames = frames
+        self.code = self.emit()
+        self.asset = gamby.Asset(self.converter, name, *self.convert())
+        self.screen = gamby.Screen()
+
+        self.decoded = []
+        for frame in ImageSequence.Iterator(Image.open(BytesIO(self.data))):
+            frame.load()
+            self.decoded.append(frame.copy())
+
+
+    def decode(self):
+        img = self.converter.openImage(Image.open(BytesIO(self.data)))
+        for frame in ImageSequence.Iterator(img):
+            frame.load()
+        img.seek(0)
+        return img
+
+
+    def dither(self):
+        toBitmap = gamby.Dither('stable')
+        return [toBitmap(frame) for frame in self.decoded]
+
+
+    def pack(self):
+        if issubclass(self.converter, gamby.Tilesets):
+            return self.converter.extractTiles(Image.open(BytesIO(self.data)))
+        if issubclass(self.converter, gamby.Splashscreens):
+            # Packed as createArrays() does: one band per 8-pixel row.
+            return [gamby.packColumns(frame.convert('1'), bandHeight=8)
+                    for frame in self.decoded]
+        return [gamby.packColumns(frame.convert('1'))
+                for frame in self.decoded]
+
+
+    def getMask(self):
+        if not self.mask:
+            return None
+        return [self.converter.getMask(frame) for frame in self.decoded]
+
+
+    def convert(self):
+        return self.converter.createArrays(self.decode(), self.mask)
+
+
+    def emit(self):
+        return ''.join(self.converter.iterArrays(self.name, self.arrays))
+
+
+    def undo(self):
+        return gamby.Sprites.unconvert(self.code)
+
+
+    def preview(self):
+        return self.converter.preview(self.asset, self.screen)
+
+
+    def stages(self):
+        """ Get the function for each stage.
+
+            @return: A list of `(stage, function)` tuples; stages that don't
+                apply to the case (e.g. 'mask', for an image with no
+                transparency) are omitted.
+        """
+        result = [('decode', self.decode), ('dither', self.dither),
+                  ('pack', self.pack)]
+        if self.mask:
+            result.append(('mask', self.getMask))
+        result.extend([('convert', self.convert), ('emit', self.emit),
+                       ('undo', self.undo), ('preview', self.preview)])
+        return result
+
+
+def timeIt(function, repeat=5, minTime=0.05):
+    """ Time a function. It is called enough times to take at least
+        `minTime` seconds, `repeat` times over; the best time is used.
+
+        @return: The time per call, in seconds.
+    """
+    number = 1
+    while True:
+        start = time.time()
+        for i in range(number):
+            function()
+        elapsed = time.time() - start
+        if elapsed >= minTime:
+            break
+        number *= 2
+    best = elapsed
+    for r in range(repeat - 1):
+        start = time.time()
+        for i in range(number):
+            function()
+        best = min(best, time.time() - start)
+    return best / number
+
+
+def run(cases=CASES, repeat=5, minTime=0.05, seed=0, out=None):
+    """ Run the benchmarks.
+
+        @param cases: The cases to run; see `CASES`.
+        @param repeat: The number of times to time each stage.
+        @param minTime: The minimum time for each timing, in seconds.
+        @param seed: The random seed for generating the images.
+        @param out: A stream to which to write each result as it is
+            measured, or `None`.
+        @return: A dictionary of results, keyed by case name. Each result
+            is a dictionary containing the number of frames, the number of
+            bytes generated, and a dictionary of `{stage: seconds}`.
+    """
+    results = {}
+    for name, mode, width, height, frames, transparent in cases:
+        case = Case(name, mode, width, height, frames, transparent, seed)
+        times = {}
+        for stage, function in case.stages():
+            times[stage] = timeIt(function, repeat, minTime)
+            if out is not None:
+                out.write(formatResult(name, stage, times[stage],
+                                       case.frames, case.size))
+        results[name] = {'frames': case.frames, 'bytes': case.size,
+                         'times': times}
+    return results
+
+
+def formatResult(name, stage, seconds, frames, size):
+    """ Format one stage's result as a line of text.
+    """
+    return "%-20s %-8s %10.1f us %12.0f frames/s %14.0f bytes/s\n" % \
+        (name, stage, seconds * 1000000, frames / seconds, size / seconds)
+
+
+def compare(results, baseline, tolerance=0.1):
+    """ Compare results against a baseline.
+
+        @param results: The results, as returned by `run()`.
+        @param baseline: Previous results, in the same form.
+        @param tolerance: How much slower a stage can be before it is
+            considered a regression, as a fraction of the baseline time.
+        @return: A list of `(case, stage, ratio)` tuples, sorted, for every
+            stage in both sets of results; `ratio` is the new time divided
+            by the old one.
+    """
+    result = []
+    for name, r in sorted(results.items()):
+        old = baseline.get(name, {}).get('times', {})
+        for stage in STAGES:
+            if stage in r['times'] and old.get(stage):
+                result.append((name, stage, r['times'][stage] / old[stage]))
+    return result
+
+
+##############################################################################
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="GAMBY Graphics Tool " \
+        "benchmarks. Times each stage of converting synthesized images.")
+    parser.add_argument("--repeat", "-r", type=int, default=5,
+        help="The number of times to time each stage. Defaults to 5.")
+    parser.add_argument("--save", "-s",
+        help="Save the results as JSON, for use as a baseline.")
+    parser.add_argument("--baseline", "-b",
+        help="Compare the results against a baseline saved with --save.")
+    parser.add_argument("--tolerance", "-t", type=float, default=0.1,
+        help="With --baseline, how much slower (as a fraction) a stage can " \
+            "be before it is reported as a regression. Defaults to 0.1.")
+    parser.add_argument("case", nargs="*",
+        help="The names of the cases to run. Defaults to all of them.")
+    args = parser.parse_args()
+
+    cases = [c for c in CASES if not args.case or c[0] in args.case]
+    results = run(cases, args.repeat, out=sys.stdout)
+
+    if args.save:
+        f = open(args.save, 'w')
+        try:
+            json.dump(results, f, indent=1, sort_keys=True)
+        finally:
+            f.close()
+
+    if args.baseline:
+        f = open(args.baseline, 'r')
+        try:
+            baseline = json.load(f)
+        finally:
+            f.close()
+        regressions = 0
+        print()
+        for name, stage, ratio in compare(results, baseline):
+            flag = ""
+            if ratio > 1 + args.tolerance:
+                flag = "  REGRESSION"
+                regressions += 1
+            print("%-20s %-8s %6.2fx%s" % (name, stage, ratio, flag))
+        if regressions:
+            sys.exit(1)
@@ -1,4 +1,4 @@
-#!/usr/bin/env python
+#!/usr/bin/env python3
 
 """
 GAMBY Graphics Tool
@@ -13,71 +13,534 @@ utility which can be run from the command line.
 @todo: Further code cleaning. Too many hacks; full refactoring may be needed.
     Data type in generated code may not be consistent.
 @todo: Sprites.convert() is too big; break into smaller pieces that subclasses
-    can override piecemeal. 
+    can override piecemeal.
 
-@todo: Add option to fill out Icons that are shorter than 8px (including 
+@todo: Add option to fill out Icons that are shorter than 8px (including
     Splashscreens with a short final row), filling extra with 0 or 1.
 @todo: Add option to crop Icons that are not divisible by 8.
-@todo: Get 'undo' working again, if it seems worthwhile.
-@todo: Use regex to parse code when converting back to GIF. This should make it
-    easy to do things like remove comments, parse out names, etc.
 
+@var CACHE_SIZE: The default maximum size of a `ConversionCache`, in bytes.
+@var DITHERS: The names and descriptions of the ways of converting images
+    that aren't 1-bit (see `Dither`).
+@var ENCODINGS: The names of the compressed data encodings.
+@var MODES: The converter classes, keyed by the names of the modes.
+@var OUTPUT_FORMATS: The names and descriptions of the output formats.
+@var PREVIEW_COLUMNS: The default number of screens in each row of a contact
+    sheet (see `contactSheet()`).
 @var SIZE_LIMITS: An set of 'constants' for providing warnings when too much
     memory is being used.
 @type SIZE_LIMITS: A list of tuples containing a size (in bytes) and a
     corresponding warning message.
-    
+
 """
 
 import argparse
+import binascii
+import configparser
+import glob
+import hashlib
+import importlib
+import itertools
+import json
+import mmap
+import multiprocessing
 import os
+import pickle
+import re
+import struct
 import sys
 import string
-import textwrap
+import tempfile
+import time
 
 # Ensure a compatible version of Python is being used
-# (the ternary operator was added in 2.5)
 
-if sys.version[:3] < '2.5':
+if sys.version_info < (3, 6):
    if __name__ == "__main__":
-      print "This script requires Python version 2.5 or greater."
+      print("This script requires Python version 3.6 or greater.")
       exit(1)
-   raise RuntimeError("Python version 2.5 or greater required")
+   raise RuntimeError("Python version 3.6 or greater required")
+
+
+class _LazyModule(object):
+    """ A stand-in for a module that is only imported when one of its
+        attributes is first used, so things that don't need it (`--help`,
+        reading a manifest, cache hits, generating code) don't pay for
+        importing it.
+    """
+
+    def __init__(self, name, message):
+        self._name = name
+        self._message = message
+        self._module = None
+
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            try:
+                self._module = importlib.import_module(self._name)
+            except ImportError as e:
+                raise ImportError("%s (%s)" % (self._message, e))
+        return getattr(self._module, attr)
+
 
+# PIL (or Pillow) is required for anything involving images.
 
-# Ensure PIL (or Pillow, etc.) is installed
+_PIL_REQUIRED = "The Python Imaging Library (PIL) or Pillow is required " \
+    "for this tool to work."
+Image = _LazyModule('PIL.Image', _PIL_REQUIRED)
+ImageSequence = _LazyModule('PIL.ImageSequence', _PIL_REQUIRED)
+ImageChops = _LazyModule('PIL.ImageChops', _PIL_REQUIRED)
 
-try:
-   import Image, ImageSequence
-except ImportError, e:
-   try:
-      from PIL import Image, ImageSequence
-   except ImportError, e:
-      if __name__ == "__main__":
-         print "The Python Imaging Library (PIL) or Pillow is required " \
-          "for this tool to work."
-         exit(1)
-      raise e
+# NumPy is optional; if present, it is used to speed up bit packing. It is
+# imported the first time it could be used (see `_numpy()`).
+
+_NOT_IMPORTED = object()
+numpy = _NOT_IMPORTED
+
+
+def _numpy():
+    """ Import NumPy, if it hasn't been imported already.
+
+        @return: The `numpy` module, or `None` if it isn't installed.
+    """
+    global numpy
+    if numpy is _NOT_IMPORTED:
+        try:
+            import numpy as module
+        except ImportError:
+            module = None
+        numpy = module
+    return numpy
 
 
 ##############################################################################
 
+# Part of every cache key (see `ConversionCache`) and manifest build state,
+# so it must be changed by any change to the converted data; otherwise,
+# stale data is served from existing caches.
+__version__ = "2.1"
+
+CACHE_SIZE = 64 * 1024 * 1024
+
+BUNDLE_MAGIC = b"GMBY"
+BUNDLE_VERSION = 2
+_BUNDLE_HEADER = '<4sBBH'
+_BUNDLE_RECORD = '<HHHBBB'
+_BUNDLE_OFFSETS = '<II'
+
+# Compressed data encodings. An encoding's ID is its index in this list.
+ENCODINGS = ['raw', 'rle', 'delta']
+
+# Output formats: { <format name>: <description>, ... }
+OUTPUT_FORMATS = {
+    'code': "Arduino C source (PROGMEM arrays)",
+    'binary': "A binary bundle of the data, with an index",
+    'incbin': "A binary bundle, plus a C header that embeds it with .incbin",
+}
+
+# Dithering methods: { <method name>: <description>, ... }
+DITHERS = {
+    'threshold': "No dithering: pixels lighter than 50% gray are white",
+    'bayer': "Ordered dithering, with an 8x8 Bayer matrix",
+    'diffusion': "Floyd-Steinberg error diffusion, frame by frame (default)",
+    'stable': "Error diffusion, but pixels that don't change from one " \
+        "frame to the next stay the same, so animations don't flicker",
+}
+
+PREVIEW_COLUMNS = 8
+
 SIZE_LIMITS = [
    (30 * 1024, "All ATMega328 available flash, +/- 1KB"),
    (14 * 1024, "ATMega168 available flash (or half ATMega328), +/- 1KB"),
    (12 * 1024, "a reasonable size"),
 ]
 
+
+def checkSize(size, err=sys.stderr):
+    """ Write a warning if too much data has been generated: the
+        largest of the `SIZE_LIMITS` that the data exceeds, if any.
+
+        @param size: The total number of bytes generated.
+        @param err: The stream to which to write the warning.
+        @return: `True` if a warning was written.
+    """
+    for memory, name in SIZE_LIMITS:
+        if size > memory:
+            err.write("Warning: Generated data is %s bytes; %s is %s bytes\n" \
+                      % (size, name, memory))
+            return True
+    return False
+
 ##############################################################################
 
+def _sourceFiles(path):
+    """ Get the files that make up a source: the file itself, or every file
+        in a directory (e.g. a directory of glyph images; see `Fonts`),
+        sorted by name.
+    """
+    if not os.path.isdir(path):
+        return [path]
+    return sorted(os.path.join(path, name) for name in os.listdir(path)
+                  if os.path.isfile(os.path.join(path, name)))
+
+
+def _sourceStat(path):
+    """ Get a source's modification time and size. For a directory, these
+        are the latest modification time and the total size of its files.
+
+        @rtype: tuple
+    """
+    stats = [os.stat(filename) for filename in _sourceFiles(path)]
+    return (max([st.st_mtime for st in stats] or [0]),
+            sum(st.st_size for st in stats))
+
+
+def _sourceDigest(path, h=None):
+    """ Get the SHA-1 digest of a source's contents. For a directory, the
+        digest covers the name and contents of each of its files.
+
+        @param h: A `hashlib` hash object to update, or `None`.
+        @return: The hex digest.
+    """
+    h = hashlib.sha1() if h is None else h
+    directory = os.path.isdir(path)
+    for filename in _sourceFiles(path):
+        if directory:
+            h.update(os.path.basename(filename).encode('utf-8') + b'\0')
+        with open(filename, 'rb') as f:
+            for chunk in iter(lambda: f.read(65536), b''):
+                h.update(chunk)
+    return h.hexdigest()
+
+
 class ConversionError(Exception):
     """ An exception raised when an image could not be converted to a
-        GAMBY bitmap. Improves exception handling when using gamby.py as a 
+        GAMBY bitmap. Improves exception handling when using gamby.py as a
         library.
     """
     pass
 
 
+##############################################################################
+
+class ConversionCache(object):
+    """ An on-disk cache of converted image data, so unchanged images don't
+        need to be loaded and converted again. Entries are keyed on a hash
+        of the source file's contents, the converter class, the mask and
+        dithering settings, and the tool version. When the cache grows past
+        `maxSize`, the least recently used entries are removed.
+
+        @ivar path: The cache directory. It is created if it does not exist.
+        @ivar maxSize: The maximum total size of the cache, in bytes.
+    """
+
+    def __init__(self, path, maxSize=CACHE_SIZE):
+        self.path = path
+        self.maxSize = maxSize
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+
+    def key(self, cls, filename, mask, dither=None, grid=None):
+        """ Generate the cache key for a source file.
+
+            @param cls: The converter class (`Sprites`, `Icons`, etc.).
+            @param filename: The name of the source image (or directory of
+                images).
+            @param mask: The mask setting used for conversion.
+            @param dither: The dithering method used for conversion.
+            @param grid: The sprite sheet cell size used for conversion.
+            @rtype: string
+        """
+        h = hashlib.sha1()
+        _sourceDigest(filename, h)
+        h.update(("\0%s\0%s\0%s\0%s\0%s" % (cls.__name__, bool(mask),
+                                              dither or 'diffusion',
+                                              cls.cacheSettings(filename,
+                                                                grid),
+                                              __version__)).encode('ascii'))
+        return h.hexdigest()
+
+
+    def _entryPath(self, key):
+        return os.path.join(self.path, key + ".cache")
+
+
+    def get(self, key):
+        """ Retrieve cached data.
+
+            @param key: The entry's key, as generated by `key()`.
+            @return: The cached data, or `None` if there isn't any.
+        """
+        path = self._entryPath(key)
+        try:
+            f = open(path, 'rb')
+            try:
+                data = pickle.load(f)
+            finally:
+                f.close()
+            # Touch the entry, so it counts as recently used.
+            os.utime(path, None)
+        except Exception:
+            # Missing, unreadable or corrupt; treat as a miss.
+            return None
+        return data
+
+
+    def put(self, key, data):
+        """ Store data in the cache. The entry is written to a temporary
+            file first, so other processes never see a partial entry.
+            The cache is not trimmed; call `evict()` to do so.
+
+            @param key: The entry's key, as generated by `key()`.
+            @param data: The data to store. Must be picklable.
+        """
+        fd, temp = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        try:
+            f = os.fdopen(fd, 'wb')
+            try:
+                pickle.dump(data, f, pickle.HIGHEST_PROTOCOL)
+            finally:
+                f.close()
+            os.rename(temp, self._entryPath(key))
+        except OSError:
+            # Most likely written by another process at the same time.
+            if os.path.exists(temp):
+                os.remove(temp)
+
+
+    def evict(self):
+        """ Remove the least recently used entries until the cache is no
+            larger than `maxSize`.
+        """
+        entries = []
+        total = 0
+        for name in os.listdir(self.path):
+            if not name.endswith(".cache"):
+                continue
+            path = os.path.join(self.path, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+        entries.sort()
+        for mtime, entrySize, path in entries:
+            if total <= self.maxSize:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= entrySize
+
+
+##############################################################################
+
+class Profile(object):
+    """ Collects the time spent in each stage of conversion, and how much
+        was processed, per file. While a profile is active (within a `with`
+        statement, or between `start()` and `stop()`), the converters record
+        each stage in it::
+
+            with Profile() as profile:
+                Sprites.convertFiles(filenames, out="sprites.h")
+            profile.report(sys.stderr)
+
+        Profiling is off unless a profile is active; the stages cost
+        little more than a function call when it is.
+
+        @cvar STAGES: The names of the stages, in the order they are
+            reported.
+        @cvar FIELDS: The names of what is counted for each stage. 'bytes'
+            is the number of bytes of data generated; for 'dedup' and
+            'compress', it is the change in size (negative if smaller).
+        @ivar files: A dictionary of each file's counts, keyed by filename.
+            Each file's counts are a dictionary of `{field: value}`
+            dictionaries, keyed by stage.
+        @ivar order: The filenames, in the order they were first counted.
+        @ivar filename: The name of the file currently being converted.
+    """
+
+    STAGES = ('open', 'cache', 'decode', 'mask', 'pack', 'dedup', 'compress',
+              'emit')
+    FIELDS = ('time', 'calls', 'pixels', 'frames', 'bytes')
+
+    _active = None
+
+    def __init__(self):
+        self.files = {}
+        self.order = []
+        self.filename = None
+        self._previous = None
+
+
+    def start(self):
+        """ Make this the active profile. Profiles can be nested; the
+            previously active one is restored by `stop()`.
+
+            @return: The profile itself.
+        """
+        self._previous = Profile._active
+        Profile._active = self
+        return self
+
+
+    def stop(self):
+        """ Stop collecting, making the previously active profile active
+            again.
+        """
+        Profile._active = self._previous
+        self._previous = None
+
+
+    def __enter__(self):
+        return self.start()
+
+
+    def __exit__(self, excType, excValue, tb):
+        self.stop()
+
+
+    @classmethod
+    def active(cls):
+        """ Get the active profile, if there is one.
+
+            @rtype: `Profile` or `None`
+        """
+        return cls._active
+
+
+    def count(self, stage, filename=None, **counts):
+        """ Add to a stage's counts.
+
+            @param stage: The name of the stage.
+            @param filename: The file being converted; defaults to the
+                current one.
+            @keyword time: The number of seconds spent.
+            @keyword calls: The number of times the stage was run.
+            @keyword pixels: The number of pixels processed.
+            @keyword frames: The number of frames processed.
+            @keyword bytes: The number of bytes generated.
+        """
+        if filename is None:
+            filename = self.filename or ''
+        if filename not in self.files:
+            self.files[filename] = {}
+            self.order.append(filename)
+        stats = self.files[filename].setdefault(stage,
+                                                dict.fromkeys(self.FIELDS, 0))
+        for field, value in counts.items():
+            stats[field] += value
+
+
+    def merge(self, files, order=None):
+        """ Add the counts from another profile, e.g. one collected in
+            another process.
+
+            @param files: The other profile's `files`.
+            @param order: The other profile's `order`.
+        """
+        for filename in order or sorted(files):
+            for stage, stats in files[filename].items():
+                self.count(stage, filename, **stats)
+
+
+    def totals(self):
+        """ Get the counts for all files combined.
+
+            @return: A dictionary of `{field: value}` dictionaries, keyed by
+                stage.
+        """
+        result = {}
+        for stages in self.files.values():
+            for stage, stats in stages.items():
+                total = result.setdefault(stage, dict.fromkeys(self.FIELDS, 0))
+                for field, value in stats.items():
+                    total[field] += value
+        return result
+
+
+    def report(self, out=sys.stderr, format='text'):
+        """ Write the counts for each file, and for all of them combined.
+
+            @param out: The stream to which to write.
+            @param format: 'text' (a table) or 'json'.
+        """
+        if format == 'json':
+            json.dump({'files': self.files, 'total': self.totals()}, out,
+                      indent=1, sort_keys=True)
+            out.write("\n")
+            return
+        if format != 'text':
+            raise ValueError("Unknown report format: %r" % format)
+
+        rows = [(filename, self.files[filename]) for filename in self.order]
+        rows.append(("Total", self.totals()))
+        out.write("%-24s %-8s %10s %6s %9s %6s %8s\n" %
+                  ("file", "stage", "time (ms)", "calls", "pixels",
+                   "frames", "bytes"))
+        for filename, stages in rows:
+            if len(filename) > 24:
+                filename = "..." + filename[-21:]
+            for stage in self.STAGES:
+                stats = stages.get(stage)
+                if stats is None:
+                    continue
+                out.write("%-24s %-8s %10.3f %6d %9d %6d %8d\n" %
+                          (filename, stage, stats['time'] * 1000,
+                           stats['calls'], stats['pixels'], stats['frames'],
+                           stats['bytes']))
+                filename = ""
+
+
+class profileStage(object):
+    """ A context manager that times a stage of conversion, and counts it
+        in the active `Profile` (if there is one). The `bytes` attribute
+        can be set within the `with` statement, once the number of bytes
+        generated is known::
+
+            with profileStage('pack', frame) as stage:
+                data = packColumns(frame)
+                stage.bytes = len(data)
+
+        @ivar bytes: The number of bytes generated.
+    """
+
+    __slots__ = ('stage', 'img', 'frames', 'bytes', 'profile', 'start')
+
+    def __init__(self, stage, img=None, frames=1):
+        """ Constructor.
+
+            @param stage: The name of the stage.
+            @param img: The image being processed, if any; its pixels are
+                counted.
+            @param frames: The number of frames being processed.
+        """
+        self.stage = stage
+        self.img = img
+        self.frames = frames
+        self.bytes = 0
+        self.profile = Profile._active
+
+
+    def __enter__(self):
+        if self.profile is not None:
+            self.start = time.time()
+        return self
+
+
+    def __exit__(self, excType, excValue, tb):
+        if self.profile is not None and excType is None:
+            pixels = self.img.size[0] * self.img.size[1] * self.frames \
+                if self.img is not None else 0
+            self.profile.count(self.stage, time=time.time() - self.start,
+                               calls=1, pixels=pixels, frames=self.frames,
+                               bytes=self.bytes)
+
+
 ##############################################################################
 
 def fixName(name):
@@ -93,446 +556,3707 @@ def fixName(name):
    return name.rstrip('_').replace('__', '_')
 
 ##############################################################################
-   
-class Sprites:
+
+# Tokens in generated (or hand-written) code: comments, the start of an
+# array declaration, numbers, and the end of an array. Anything else (commas,
+# whitespace, other code) is skipped.
+_CODE_TOKENS = re.compile(r"""
+      (?P<comment>//[^\n]*|/\*.*?\*/)
+    | (?P<start>(?:\b(?:PROGMEM|const|static)\s+)*(?P<type>\w+)\s+
+        (?:PROGMEM\s+)?(?P<name>\w+)\s*\[\s*\d*\s*\]\s*(?:PROGMEM\s*)?=\s*\{)
+    | (?P<number>\b(?:0[xX][0-9a-fA-F]+|\d+)[uUlL]*\b)
+    | (?P<end>\})
+    """, re.S | re.X)
+
+# The comments that precede each frame's (or row's) data, and the comment
+# that precedes compressed data (e.g. `// Frames (rle)`).
+_FRAME_COMMENT = re.compile(r"//\s*(Frame|Row)\s+\d+")
+_ENCODED_COMMENT = re.compile(r"//\s*(Frame|Row)s\s+\((\w+)\)")
+
+
+def parseCode(data):
+    """ Parse every array in a piece of Arduino code, in a single pass.
+        Values before the first frame comment (e.g. `// Frame 0`) are the
+        array's dimensions; the values after each frame comment are that
+        frame's data. Compressed arrays (see `EncodedData`) are decoded.
+        Other comments are ignored.
+
+        @param data: The code to parse.
+        @type data: string
+        @return: A list of `(dataType, name, label, sizes, frames)` tuples.
+            `label` is the word used in the frame comments ("Frame" or
+            "Row"), or `None` if there were none.
     """
-    A class representing the namespace for all GAMBY sprite conversion code.
-    Do not instantiate; just call the class' methods directly.
-    
-    @cvar _useMask: The default setting for whether GIF image transparency
-        should be used to generate a second 'mask' sprite.
-    @cvar _dataType: The name of the Arduino data type to use when generating
-        code.
-    @cvar _unitSize: The number of bits per unit of data.
-    """ 
+    result = []
+    name = None
+    for m in _CODE_TOKENS.finditer(data):
+        if m.group('start') is not None:
+            dataType, name = m.group('type', 'name')
+            label = encoding = None
+            sizes = values = []
+            frames = []
+        elif name is None:
+            # Not in an array.
+            continue
+        elif m.group('number') is not None:
+            n = m.group('number').rstrip('uUlL')
+            values.append(int(n, 16) if n[:2] in ('0x', '0X') else int(n))
+        elif m.group('comment') is not None:
+            frame = (_FRAME_COMMENT.match(m.group('comment')) or
+                     _ENCODED_COMMENT.match(m.group('comment')))
+            if frame is not None:
+                label = frame.group(1)
+                if frame.re is _ENCODED_COMMENT:
+                    encoding = frame.group(2)
+                values = []
+                frames.append(values)
+        else:
+            if encoding is not None:
+                # The dimensions are followed by the frame count and the
+                # encoding's ID.
+                frames = decodeFrames(encoding, frames[0] if frames else [],
+                                      sizes[-2])
+                sizes = sizes[:-2]
+            result.append((dataType, name, label, sizes, frames))
+            name = None
+    return result
 
-    _useMask = True
-    _dataType = 'prog_uchar'
-    _unitSize = 8
-    
-    
-    @classmethod
-    def openImage(cls, f):
-        """ Load and perform basic validation of an image before conversion. 
-            Can be called with either the filename of an image or an 
-            `Image.Image`; in the latter case, only the validation is
-            performed.
-            
-            @raise ConversionError: The image failed validation.
-            @raise IOError: The image could not be read (or it was neither
-                a filename nor `Image.Image`).
-            
-            @param f: An image, or an image's filename.
-            @type f: `Image.Image` or string.
-            @rtype: `Image.Image`
+
+def converterFor(dataType, label, sizes, name=None):
+    """ Determine which converter generated an array, from the results of
+        `parseCode()`. Arrays of frame indices (see `Sprites.dedupArrays()`)
+        and tile maps (see `TileAtlases.dedupArrays()`) aren't images:
+        they have no frame comments, and their names end with '_index' or
+        '_map'.
+
+        @param name: The array's name. If `None`, the array is assumed to
+            be an image.
+        @return: `Sprites`, `Icons`, `Splashscreens`, `Tilesets` or
+            `Fonts`, or `None` if the array isn't an image.
+    """
+    if label is None and name is not None and \
+            name.endswith(('_index', '_map')):
+        return None
+    if dataType == Fonts._dataType or dataType.endswith('int32_t'):
+        return Fonts
+    if dataType == Tilesets._dataType or dataType.endswith('int16_t'):
+        return Tilesets
+    if label == Splashscreens._frameLabel:
+        return Splashscreens
+    if len(sizes) == 1:
+        return Icons
+    return Sprites
+
+##############################################################################
+
+# Lookup tables for `Dither`: pixels at or above the threshold (or above 0)
+# become white.
+_THRESHOLD = [0] * 128 + [255] * 128
+_NONZERO = [0] + [255] * 255
+
+
+def _bayerMatrix(size):
+    """ Generate an ordered dithering (Bayer) matrix: a list of `size` rows
+        of the numbers from 0 to `size` squared minus 1, arranged so that
+        consecutive numbers are as far apart as possible. `size` must be a
+        power of 2.
+    """
+    m = [[0]]
+    while len(m) < size:
+        n = len(m)
+        m = [[4 * m[y % n][x % n] + (0, 2, 3, 1)[y // n * 2 + x // n]
+              for x in range(n * 2)] for y in range(n * 2)]
+    return m
+
+
+class Dither(object):
+    """ Converts images that aren't 1-bit, or the frames of an animation
+        one after the other, to 1-bit with one of the `DITHERS`. Each
+        method works on whole images with PIL operations, never on
+        individual pixels in Python, so it is practical for long,
+        full-screen animations.
+
+        'threshold' and 'bayer' depend only on each pixel's own value and
+        position, so pixels that don't change between frames never change
+        in the output. Error diffusion spreads each pixel's error to its
+        neighbors, so a change anywhere can make unchanged areas 'crawl';
+        'stable' keeps the previous frame's output wherever the source
+        didn't change. For this, an animation's frames must all be
+        converted by the same `Dither`, in order.
+
+        @ivar method: The name of the method; `None` is the same as
+            'diffusion'.
+        @ivar previous: The previous frame, as a tuple containing its
+            grayscale and 1-bit versions, or `None`.
+    """
+
+    # The ordered dithering thresholds (2 to 254). A pixel is white if it
+    # is lighter than the threshold at its position.
+    _matrix = [[v * 4 + 2 for v in row] for row in _bayerMatrix(8)]
+
+    def __init__(self, method=None):
+        """ Constructor.
+
+            @raise ValueError: The method isn't one of the `DITHERS`.
         """
-        if isinstance(f, basestring):
-            return Image.open(f)
-        elif isinstance(f, Image.Image):
-            return f
-        # Problem.
-        raise IOError, "Can't convert %s (not filename or Image.Image)" % f
-        
-        
-    @classmethod
-    def numFrames(cls, img):
-        """ Return the number of frames in an animated GIF.
+        if method is not None and method not in DITHERS:
+            raise ValueError("Unknown dithering method: %r" % method)
+        self.method = method
+        self.previous = None
+        self._pattern = None
+
+
+    def pattern(self, size):
+        """ Get the ordered dithering thresholds for an image, as a
+            grayscale image of the Bayer matrix tiled to the given size. It
+            is only generated again if the size changes.
+        """
+        if self._pattern is None or self._pattern.size != size:
+            n = len(self._matrix)
+            tile = Image.new('L', (n, n))
+            tile.putdata([v for row in self._matrix for v in row])
+            w, h = size
+            row = Image.new('L', (w, n))
+            for x in range(0, w, n):
+                row.paste(tile, (x, 0))
+            self._pattern = Image.new('L', size)
+            for y in range(0, h, n):
+                self._pattern.paste(row, (0, y))
+        return self._pattern
+
+
+    def __call__(self, img):
+        """ Convert an image (or the next frame of an animation) to 1-bit.
+            Images that are already 1-bit are returned as they are.
 
-            @param img: The image to count
             @type img: `Image.Image`
-            @return: The frame count
+            @return: A 1-bit (mode "1") `Image.Image`
         """
-        i = 1
-        img.seek(0)
-        try:
-            while True:
-                img.seek(img.tell() + 1)
-                i += 1
-        except EOFError:
-            pass
-        img.seek(0)
-        return i
+        if img.mode == '1':
+            return img
+        if self.method in (None, 'diffusion'):
+            return img.convert('1')
+
+        gray = img.convert('L')
+        if self.method == 'threshold':
+            result = gray.point(_THRESHOLD, '1')
+        elif self.method == 'bayer':
+            result = ImageChops.subtract(gray, self.pattern(gray.size))
+            result = result.point(_NONZERO, '1')
+        else:
+            result = gray.convert('1')
+            if self.previous is not None and \
+              self.previous[0].size == gray.size:
+                lastGray, lastResult = self.previous
+                changed = ImageChops.difference(gray, lastGray)
+                result = Image.composite(result, lastResult,
+                                         changed.point(_NONZERO, '1'))
+        self.previous = (gray, result)
+        return result
+
+##############################################################################
+
+# Lookup tables for the pure-Python packing fallback: each byte value as a
+# string of 8 binary digits, and a translation table that inverts every bit.
+_BIT_STRINGS = [bin(b)[2:].rjust(8, '0') for b in range(256)]
+_INVERT = bytes(bytearray(range(255, -1, -1)))
+
+
+def _rowBits(raw, w, h):
+    """ Split a 1-bit image's raw data into a string of '0' and '1' per
+        row, without the padding at the end of each row.
+    """
+    stride = (w + 7) // 8
+    return [''.join(_BIT_STRINGS[b] for b in
+                    bytearray(raw[r * stride:(r + 1) * stride]))[:w]
+            for r in range(h)]
+
+
+def _packBitString(bits, unitSize):
+    """ Pack a string of '0' and '1' (white and black) into inverted
+        bytes, dropping any bits left over after the last whole unit.
+    """
+    n = len(bits) // unitSize * unitSize
+    if n == 0:
+        return b''
+    v = int(bits[:n], 2) ^ ((1 << n) - 1)
+    return binascii.unhexlify('%0*x' % (n // 4, v))
+
+
+def packColumns(img, unitSize=8, bandHeight=None):
+    """ Pack a 1-bit image into a string of bytes, one bit per pixel, in
+        the order the LCD uses: column by column, from left to right, each
+        column from the bottom pixel up. Bits are inverted (1 is black, 0
+        is white) as the LCD expects, and form a continuous stream;
+        columns are not padded. Units are stored big-endian, and any
+        pixels left over after the last whole unit are dropped. It is the
+        same as packing the image rotated 90 degrees clockwise, but the
+        pixels are read straight from the image's own buffer; it is never
+        rotated or cropped.
+
+        @param img: The image to pack.
+        @type img: `Image.Image` (mode "1")
+        @param unitSize: The number of bits per unit of data (8 or 16).
+        @param bandHeight: If not `None`, the image is divided into
+            horizontal bands this many pixels high (e.g. 8, the height of an
+            LCD page), each packed separately, from the top down. The image's
+            height must be a multiple of it.
+        @return: A string, or a list of strings (one per band) if
+            `bandHeight` is specified.
+    """
+    w, h = img.size
+    raw = img.tobytes()
+
+    numpy = _numpy()
+    if numpy is not None:
+        stride = (w + 7) // 8
+        bits = numpy.unpackbits(numpy.frombuffer(raw, dtype=numpy.uint8)
+                                .reshape(h, stride), axis=1)[:, :w]
+        if bandHeight is None:
+            columns = bits[::-1].T.ravel()
+            n = columns.size // unitSize * unitSize
+            return numpy.packbits(columns[:n] ^ 1).tobytes()
+        bands = bits.reshape(h // bandHeight, bandHeight, w)[:, ::-1]
+        bands = bands.transpose(0, 2, 1).reshape(h // bandHeight, -1)
+        n = bands.shape[1] // unitSize * unitSize
+        return [band.tobytes() for band in
+                numpy.packbits(bands[:, :n] ^ 1, axis=1)]
+
+    rows = _rowBits(raw, w, h)
+    if bandHeight is None:
+        return _packBitString(''.join(''.join(c) for c in zip(*rows[::-1])),
+                              unitSize)
+    return [_packBitString(''.join(''.join(c) for c in
+                                   zip(*rows[y:y + bandHeight][::-1])),
+                           unitSize)
+            for y in range(0, h, bandHeight)]
+
+
+def packRegions(img, boxes, unitSize=8):
+    """ Pack several rectangular regions of a 1-bit image, each exactly as
+        `packColumns()` would pack it if it were cropped out on its own.
+        The image is unpacked once, and every region is read from the same
+        buffer; nothing is cropped.
+
+        @param img: The image to pack.
+        @type img: `Image.Image` (mode "1")
+        @param boxes: A list of `(left, top, right, bottom)` tuples.
+        @param unitSize: The number of bits per unit of data (8 or 16).
+        @return: A list of strings, one per box.
+    """
+    w, h = img.size
+    raw = img.tobytes()
+
+    numpy = _numpy()
+    if numpy is not None:
+        stride = (w + 7) // 8
+        bits = numpy.unpackbits(numpy.frombuffer(raw, dtype=numpy.uint8)
+                                .reshape(h, stride), axis=1)[:, :w]
+        result = []
+        for x0, y0, x1, y1 in boxes:
+            columns = bits[y0:y1, x0:x1][::-1].T.ravel()
+            n = columns.size // unitSize * unitSize
+            result.append(numpy.packbits(columns[:n] ^ 1).tobytes())
+        return result
+
+    rows = _rowBits(raw, w, h)
+    result = []
+    for x0, y0, x1, y1 in boxes:
+        region = [row[x0:x1] for row in rows[y0:y1]]
+        result.append(_packBitString(''.join(''.join(c) for c in
+                                             zip(*region[::-1])), unitSize))
+    return result
+
+
+# The `struct` formats of units larger than a byte, keyed by size in bits.
+_UNIT_FORMATS = {16: 'H', 32: 'I'}
+
+
+def unpackUnits(data, unitSize=8):
+    """ Split a string of packed bytes (as generated by `packColumns()`) into
+        a list of integers, each `unitSize` bits.
+
+        @param data: The packed data.
+        @type data: string
+        @param unitSize: The number of bits per unit of data (8, 16 or 32).
+        @rtype: list
+    """
+    if unitSize == 8:
+        return list(bytearray(data))
+    return list(struct.unpack('>%d%s' % (len(data) * 8 // unitSize,
+                                         _UNIT_FORMATS[unitSize]), data))
+
+
+def packUnits(values, unitSize=8, byteOrder='<'):
+    """ Turn a list of integers into bytes. By default, they are stored
+        as in the AVR's flash: 16-bit units are little-endian. Values too
+        large for a unit are truncated, as the compiler would truncate them.
+
+        @param values: The values to pack.
+        @param unitSize: The number of bits per unit of data (8, 16 or 32).
+        @param byteOrder: The `struct` byte order of larger units: '<' for
+            little-endian, '>' for big-endian (the order `packColumns()`
+            uses).
+        @rtype: string
+    """
+    if unitSize == 8:
+        return bytes(bytearray(v & 0xff for v in values))
+    limit = (1 << unitSize) - 1
+    return struct.pack('%s%d%s' % (byteOrder, len(values),
+                                   _UNIT_FORMATS[unitSize]),
+                       *[v & limit for v in values])
+
+
+def _indexType(indices):
+    """ Get the Arduino data type and unit size for an array of frame
+        indices.
+    """
+    if max(indices or [0]) < 256:
+        return 'prog_uchar', 8
+    return 'prog_uint16_t', 16
+
+
+def unpackBits(data, size):
+    """ Turn packed, inverted bitmap data in row order (a continuous
+        stream of bits, row by row, like `packColumns()` data rotated back)
+        into a 1-bit image. The data can be any object supporting the
+        buffer interface, such as a slice of a `Bundle`, so it doesn't need
+        to be turned into a list of integers first. Pixels missing from the
+        end of the data are white.
+
+        @param data: The packed data.
+        @param size: The size of the image.
+        @type size: A tuple containing the width and height.
+        @rtype: `Image.Image`
+    """
+    w, h = size
+    n = w * h
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+
+    numpy = _numpy()
+    if numpy is not None:
+        bits = numpy.unpackbits(numpy.frombuffer(data, dtype=numpy.uint8))
+        bits = bits[:n] ^ 1
+        if bits.size < n:
+            bits = numpy.concatenate((bits, numpy.ones(n - bits.size,
+                                                       dtype=numpy.uint8)))
+        rows = numpy.packbits(bits.reshape(h, w), axis=1)
+        return Image.frombytes('1', size, rows.tobytes())
+
+    raw = bytearray(data)[:(n + 7) // 8].translate(_INVERT)
+    if w % 8 == 0:
+        raw = bytes(raw).ljust(n // 8, b'\xff')
+        return Image.frombytes('1', size, raw)
+    bits = ''.join(_BIT_STRINGS[b] for b in raw)[:n].ljust(n, '1')
+    pad = '0' * (-w % 8)
+    bits = ''.join(bits[r * w:(r + 1) * w] + pad for r in range(h))
+    return Image.frombytes('1', size,
+                           binascii.unhexlify('%0*x' % (len(bits) // 4,
+                                                        int(bits, 2))))
+
+
+def unpackColumns(data, size):
+    """ Turn packed, inverted bitmap data in column order (as generated
+        by `packColumns()`) back into a 1-bit image. Like `unpackBits()`,
+        the data can be any object supporting the buffer interface, and
+        pixels missing from the end of the data are white.
+
+        @param data: The packed data.
+        @param size: The size of the image.
+        @type size: A tuple containing the width and height.
+        @rtype: `Image.Image`
+    """
+    w, h = size
+    numpy = _numpy()
+    if numpy is not None:
+        n = w * h
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+        bits = numpy.unpackbits(numpy.frombuffer(data, dtype=numpy.uint8))
+        bits = bits[:n] ^ 1
+        if bits.size < n:
+            bits = numpy.concatenate((bits, numpy.ones(n - bits.size,
+                                                       dtype=numpy.uint8)))
+        rows = numpy.packbits(bits.reshape(w, h).T[::-1], axis=1)
+        return Image.frombytes('1', size, rows.tobytes())
+    return unpackBits(data, (h, w)).transpose(Image.ROTATE_90)
+
+
+def _columnValues(data, size, unitSize=8):
+    """ Split packed bitmap data in column order, as stored in flash (see
+        `packColumns()`), into one number per column, its bits the column's
+        pixels from the top down (bit 0 is the top pixel; 1 is black). As
+        in `unpackColumns()`, pixels missing from the end of the data are
+        white.
+
+        @param data: The packed data.
+        @param size: The size of the image.
+        @type size: A tuple containing the width and height.
+        @param unitSize: The number of bits per unit of data (8, 16 or 32);
+            larger units are stored little-endian.
+        @rtype: list
+    """
+    w, h = size
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    if unitSize != 8:
+        n = len(data) * 8 // unitSize
+        fmt = '%d%s' % (n, _UNIT_FORMATS[unitSize])
+        data = struct.pack('>' + fmt, *struct.unpack('<' + fmt, data))
+    # As one big number, the first (bottom) pixel of each column is its
+    # most significant bit, so each column's bits are already in order.
+    bits = int.from_bytes(data, 'big')
+    extra = len(data) * 8 - w * h
+    bits = bits >> extra if extra > 0 else bits << -extra
+    column = (1 << h) - 1
+    return [bits >> ((w - 1 - x) * h) & column for x in range(w)]
+
+##############################################################################
+
+def encodeRLE(data):
+    """ Run-length encode a list of bytes. The result is a series of
+        packets, each starting with a control byte: 0-127 is followed by
+        that many plus one literal bytes; 128-255 is followed by a single
+        byte, to be repeated the control byte minus 125 times (3-130).
+
+        @param data: The bytes to encode, as a list of integers.
+        @rtype: list
+    """
+    result = []
+    literal = []
+    for value, group in itertools.groupby(data):
+        run = sum(1 for v in group)
+        if run < 3:
+            literal.extend([value] * run)
+            continue
+        for i in range(0, len(literal), 128):
+            chunk = literal[i:i + 128]
+            result.append(len(chunk) - 1)
+            result.extend(chunk)
+        literal = []
+        while run >= 3:
+            n = min(run, 130)
+            result.extend((n + 125, value))
+            run -= n
+        literal.extend([value] * run)
+    for i in range(0, len(literal), 128):
+        chunk = literal[i:i + 128]
+        result.append(len(chunk) - 1)
+        result.extend(chunk)
+    return result
+
+
+def decodeRLE(data):
+    """ Decode data encoded by `encodeRLE()`.
+
+        @param data: The encoded bytes, as a list of integers.
+        @rtype: list
+    """
+    result = []
+    i = 0
+    while i < len(data):
+        c = data[i]
+        if c < 128:
+            result.extend(data[i + 1:i + c + 2])
+            i += c + 2
+        else:
+            result.extend([data[i + 1]] * (c - 125))
+            i += 2
+    return result
+
+
+def encodeFrames(encoding, frames):
+    """ Encode a list of frames, each a list of bytes, as a single list.
+        The encodings are:
+
+            - 'raw': the frames, one after the other.
+            - 'rle': the frames, run-length encoded (see `encodeRLE()`).
+            - 'delta': each frame is XORed with the previous one (so any
+                pixels that don't change become 0), then run-length encoded.
+
+        @param encoding: The name of the encoding; one of `ENCODINGS`.
+        @param frames: The frames to encode.
+        @rtype: list
+    """
+    if encoding == 'delta':
+        previous = [0] * (len(frames[0]) if frames else 0)
+        deltas = []
+        for frame in frames:
+            deltas.append([a ^ b for a, b in zip(frame, previous)])
+            previous = frame
+        frames = deltas
+    data = list(itertools.chain.from_iterable(frames))
+    if encoding == 'raw':
+        return data
+    return encodeRLE(data)
+
+
+def decodeFrames(encoding, data, frameCount):
+    """ Decode frames encoded by `encodeFrames()`.
+
+        @param encoding: The name of the encoding; one of `ENCODINGS`.
+        @param data: The encoded data.
+        @param frameCount: The number of frames.
+        @return: A list of frames, each a list of bytes.
+    """
+    if encoding not in ENCODINGS:
+        raise ValueError("Unknown encoding: %r" % encoding)
+    if encoding != 'raw':
+        data = decodeRLE(data)
+    frameSize = len(data) // frameCount if frameCount else 0
+    frames = [data[i * frameSize:(i + 1) * frameSize]
+              for i in range(frameCount)]
+    if encoding == 'delta':
+        for i in range(1, frameCount):
+            frames[i] = [a ^ b for a, b in zip(frames[i], frames[i - 1])]
+    return frames
+
+
+class EncodedData(object):
+    """ An array's data, compressed with one of the `ENCODINGS`. In
+        generated code, the array starts with its dimensions, followed by
+        its frame count and the encoding's ID (its index in `ENCODINGS`),
+        then the encoded data.
+
+        @ivar encoding: The name of the encoding.
+        @ivar dims: The width and height of the array's image.
+        @ivar frameCount: The number of frames.
+        @ivar data: The encoded data, a list of bytes.
+        @ivar rawSize: The size of the uncompressed array, in bytes.
+    """
+
+    def __init__(self, encoding, dims, frameCount, data, rawSize):
+        self.encoding = encoding
+        self.dims = dims
+        self.frameCount = frameCount
+        self.data = data
+        self.rawSize = rawSize
+
+
+class Asset(object):
+    """ The result of converting one image: its data, in a form that can be
+        examined, cached or combined with others without parsing generated
+        code, and the data from which code (or a bundle) is generated.
+        Generating the code is a separate step; see `code()`.
+
+        @ivar converter: The converter class that created the asset (e.g.
+            `Sprites`).
+        @ivar filename: The name of the source image.
+        @ivar name: The name of the asset's (first) array in generated code.
+        @ivar width: The width of the source image (or of the first sprite
+            in a sprite sheet), in pixels.
+        @ivar height: The height of the source image (or of the first
+            sprite in a sprite sheet), in pixels.
+        @ivar frames: The packed data of each frame (each row of a splash
+            screen, or each tile of a tileset; for a sprite sheet, each
+            frame of the first sprite), as stored in flash.
+        @type frames: A list of `bytes`
+        @ivar mask: The packed data of each frame's mask, or `None`.
+        @type mask: A list of `bytes`, or `None`
+        @ivar count: The number of converted images.
+        @ivar rawSize: The number of bytes the data consumes as converted.
+        @ivar size: The number of bytes the data consumes after removing
+            duplicate frames and/or compressing it (see `finish()`).
+        @ivar arrays: The `(suffix, data)` pairs from which code is
+            generated (see `Sprites.createArrays()`).
+        @ivar indexes: The `(suffix, indices)` pairs of frame indices (see
+            `Sprites.dedupArrays()`).
+    """
+
+    __slots__ = ('converter', 'filename', 'name', 'width', 'height',
+                 'frames', 'mask', 'count', 'rawSize', 'size', 'arrays',
+                 'indexes')
+
+    def __init__(self, converter, filename, arrays, count, size):
+        """ Constructor.
+
+            @param converter: The converter class that created the data.
+            @param filename: The name of the source image.
+            @param arrays: A list of `(suffix, data)` pairs, as generated
+                by the converter's `createArrays()`.
+            @param count: The number of converted images.
+            @param size: The number of bytes the arrays consume.
+        """
+        self.converter = converter
+        self.filename = filename
+        suffix, data = arrays[0]
+        self.name = fixName(filename) + suffix
+        self.width, self.height, frames = converter.frameData(data)
+        self.frames = [packUnits(f, converter._unitSize) for f in frames]
+        self.mask = None
+        mask = dict(arrays).get(suffix + '_mask')
+        if mask is not None:
+            self.mask = [packUnits(f, converter._unitSize)
+                         for f in converter.frameData(mask)[2]]
+        self.count = count
+        self.rawSize = self.size = size
+        self.arrays = arrays
+        self.indexes = ()
+
+
+    def __repr__(self):
+        return "<%s %s: %dx%d, %d frames, %d bytes>" % \
+            (self.converter.__name__, self.name, self.width, self.height,
+             len(self.frames), self.size)
+
+
+    def finish(self, dedup=None, table=None, compress=None, report=None):
+        """ Remove duplicate frames from and/or compress the data from
+            which code is generated. The `frames` and `mask` are unchanged.
+            Takes the same arguments as `Sprites.finishArrays()`.
+
+            @return: The asset itself.
+        """
+        self.arrays, self.indexes, self.size = self.converter.finishArrays(
+            self.filename, self.arrays, self.size, dedup, table, compress,
+            report)
+        return self
+
+
+    def iterCode(self):
+        """ Generate the asset's Arduino code, one line at a time.
+
+            @return: A generator yielding lines of code, each ending with
+                a newline.
+        """
+        return self.converter.iterArrays(self.filename, self.arrays,
+                                         self.indexes)
+
+
+    def code(self):
+        """ Generate the asset's Arduino code.
+
+            @rtype: string
+        """
+        return ''.join(self.iterCode())
+
+
+    def entries(self):
+        """ Generate the asset's bundle entries (see `writeBundle()`).
+
+            @return: A generator yielding `(name, width, height, frames,
+                unitSize, headerSize, encoding, data)` tuples.
+        """
+        return self.converter.iterEntries(self.filename, self.arrays,
+                                          self.indexes)
+
+##############################################################################
+
+def writeBundle(entries, out):
+    """ Write a binary bundle of GAMBY data. All numbers are little-endian.
+
+        The file starts with a header: the magic string "GMBY", a format
+        version byte, a reserved byte, and a 16-bit entry count. Next is the
+        index, one record per entry: a byte containing the length of the
+        name, the name (ASCII), the 16-bit width, height and frame count, a
+        byte containing the unit size in bits, a byte containing the size
+        of the dimensions at the start of the data (in bytes), a byte
+        containing the data's encoding (its index in `ENCODINGS`; 0 if it
+        isn't compressed), and the 32-bit offset (from the start of the
+        file) and length of the entry's data. The data follows the index;
+        each entry's data is exactly the contents of the array in the
+        equivalent generated code, as stored in flash. Use `Bundle` to
+        read a bundle.
+
+        @param entries: A list of `(name, width, height, frames, unitSize,
+            headerSize, encoding, data)` tuples, as generated by a converter's
+            `iterEntries()`.
+        @param out: The (binary) stream to which to write.
+        @return: A list of each entry's data offset.
+    """
+    index = []
+    for (name, width, height, frames, unitSize, headerSize, encoding,
+         data) in entries:
+        index.append(struct.pack('<B', len(name)) + name.encode('ascii') +
+                     struct.pack(_BUNDLE_RECORD, width, height, frames,
+                                 unitSize, headerSize,
+                                 ENCODINGS.index(encoding)))
+    offset = (struct.calcsize(_BUNDLE_HEADER) + sum(map(len, index)) +
+              struct.calcsize(_BUNDLE_OFFSETS) * len(index))
+    offsets = []
+    out.write(struct.pack(_BUNDLE_HEADER, BUNDLE_MAGIC, BUNDLE_VERSION, 0,
+                          len(entries)))
+    for record, entry in zip(index, entries):
+        offsets.append(offset)
+        out.write(record)
+        out.write(struct.pack(_BUNDLE_OFFSETS, offset, len(entry[-1])))
+        offset += len(entry[-1])
+    for entry in entries:
+        out.write(entry[-1])
+    return offsets
+
+
+def writeIncbinHeader(entries, offsets, bundleName, out):
+    """ Write a C header that embeds a bundle (see `writeBundle()`) in
+        flash with the assembler's `.incbin` directive, and defines a
+        pointer to each entry's data, along with its dimensions.
+
+        Every file that includes the header only gets declarations. The
+        data itself is defined in exactly one file, which must define
+        `<NAME>_IMPLEMENTATION` (e.g. `SPRITES_IMPLEMENTATION` for
+        'sprites.bin') before including it. The assembler looks for the
+        bundle in its working directory and include path (`-I`), not next
+        to the header, so the bundle's directory must be on the include
+        path when that file is compiled.
+
+        @param entries: The entries written to the bundle.
+        @param offsets: The entries' offsets, as returned by `writeBundle()`.
+        @param bundleName: The filename of the bundle.
+        @param out: The stream to which to write.
+    """
+    base = os.path.basename(bundleName)
+    blob = fixName(base) + "_data"
+    guard = fixName(base).upper() + "_H"
+    implementation = fixName(base).upper() + "_IMPLEMENTATION"
+    out.write("// Generated by gamby.py; data is in %s\n" % base)
+    out.write("// Define %s in one (and only one) source file\n"
+              "// before including this, to embed the data there. %s must\n"
+              "// be in a directory on the assembler's include path (-I).\n"
+              % (implementation, base))
+    out.write("#ifndef %s\n#define %s\n\n" % (guard, guard))
+    out.write("#include <avr/pgmspace.h>\n\n")
+    out.write("extern const uint8_t %s[] PROGMEM;\n\n" % blob)
+    out.write("#ifdef %s\n" % implementation)
+    out.write("__asm__(\n"
+              "    \".section .progmem.data\\n\"\n"
+              "    \".global %s\\n\"\n"
+              "    \"%s:\\n\"\n"
+              "    \".incbin \\\"%s\\\"\\n\"\n"
+              "    \".previous\\n\"\n"
+              ");\n" % (blob, blob, base))
+    out.write("#endif\n")
+    for (name, width, height, frames, unitSize, headerSize, encoding,
+         data), offset in zip(entries, offsets):
+        out.write("\n")
+        if unitSize == 8:
+            out.write("#define %s (%s + %d)\n" % (name, blob, offset))
+        else:
+            out.write("#define %s ((const uint%d_t *)(%s + %d))\n" %
+                      (name, unitSize, blob, offset))
+        out.write("#define %s_width %d\n" % (name, width))
+        out.write("#define %s_height %d\n" % (name, height))
+        out.write("#define %s_frames %d\n" % (name, frames))
+    out.write("\n#endif\n")
+
+
+class Bundle(object):
+    """ A reader for binary bundles of GAMBY data (see `writeBundle()`).
+        The file is memory-mapped rather than read, and entries and frames
+        are returned as slices of the mapped file, without copying.
+
+        @ivar index: A dictionary of entries, keyed by name. Each value is
+            a tuple containing the data's offset and length, the width,
+            height and frame count, the unit size in bits, the size of
+            the dimensions at the start of the data (in bytes), and the
+            name of the data's encoding (one of the `ENCODINGS`).
+        @ivar names: The entries' names, in the order they were written.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._file = open(filename, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        except:
+            self._file.close()
+            raise
+        self._view = memoryview(self._map)
+        self.index = {}
+        self.names = []
+        self._decoded = {}
+        try:
+            self._readIndex()
+        except:
+            self.close()
+            raise
+
+
+    def _readIndex(self):
+        headerSize = struct.calcsize(_BUNDLE_HEADER)
+        recordSize = struct.calcsize(_BUNDLE_RECORD)
+        offsetsSize = struct.calcsize(_BUNDLE_OFFSETS)
+        magic, version, reserved, count = struct.unpack_from(_BUNDLE_HEADER,
+                                                             self._map)
+        if magic != BUNDLE_MAGIC or version != BUNDLE_VERSION:
+            raise IOError("%s is not a GAMBY bundle (or an unsupported "
+                          "version)" % self.filename)
+        pos = headerSize
+        for i in range(count):
+            nameLength = ord(self._map[pos:pos + 1])
+            name = self._map[pos + 1:pos + 1 + nameLength].decode('ascii')
+            pos += 1 + nameLength
+            record = struct.unpack_from(_BUNDLE_RECORD, self._map, pos)
+            pos += recordSize
+            offset, length = struct.unpack_from(_BUNDLE_OFFSETS, self._map,
+                                                pos)
+            pos += offsetsSize
+            self.index[name] = (offset, length) + record[:-1] + \
+                (ENCODINGS[record[-1]],)
+            self.names.append(name)
+
+
+    def _slice(self, offset, length):
+        return self._view[offset:offset + length]
+
+
+    def __contains__(self, name):
+        return name in self.index
+
+
+    def __len__(self):
+        return len(self.names)
+
+
+    def __iter__(self):
+        return iter(self.names)
+
+
+    def entry(self, name):
+        """ Get an entry's data, including the dimensions at its start:
+            the same data as the equivalent array in generated code.
+
+            @param name: The entry's name.
+            @rtype: `memoryview`
+        """
+        offset, length = self.index[name][:2]
+        return self._slice(offset, length)
+
+
+    def frame(self, name, n=0):
+        """ Get the data for one frame of an entry. The frames of a
+            compressed entry are decoded (all at once, the first time one
+            is requested) and returned as copies.
+
+            @param name: The entry's name.
+            @param n: The frame number.
+            @rtype: `memoryview`
+        """
+        offset, length, width, height, frames, unitSize, headerSize, \
+            encoding = self.index[name]
+        if n < 0 or n >= frames:
+            raise IndexError("%s has no frame %d" % (name, n))
+        if encoding != 'raw':
+            if name not in self._decoded:
+                data = bytearray(self._slice(offset + headerSize,
+                                             length - headerSize))
+                self._decoded[name] = [memoryview(bytes(f)) for f in
+                                       decodeFrames(encoding, data, frames)]
+            return self._decoded[name][n]
+        frameSize = (length - headerSize) // frames
+        return self._slice(offset + headerSize + n * frameSize, frameSize)
+
+
+    def frames(self, name):
+        """ Get the data for every frame of an entry.
+
+            @param name: The entry's name.
+            @return: A list of `memoryview` objects.
+        """
+        return [self.frame(name, n) for n in range(self.index[name][4])]
+
+
+    def close(self):
+        """ Close the bundle. If slices obtained from it are still in use,
+            the mapping stays open until they are released.
+        """
+        self._view.release()
+        try:
+            self._map.close()
+        except BufferError:
+            pass
+        self._file.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def wrapHex(values, width, toString=hex):
+    """ Format a list of integers as lines of comma-separated hexadecimal
+        values, each line no longer than `width`. The result is the same as
+        `textwrap.wrap()` on the whole list, but lines are generated one at a
+        time.
+
+        @param values: The values to format.
+        @param width: The maximum line length.
+        @param toString: The function used to format each value.
+        @return: A generator yielding lines (without newlines).
+    """
+    line = []
+    length = -1
+    for v in values:
+        token = toString(v) + ","
+        if line and length + len(token) + 1 > width:
+            yield ' '.join(line)
+            line = []
+            length = -1
+        line.append(token)
+        length += len(token) + 1
+    if line:
+        yield ' '.join(line)
+    else:
+        # Matches the lone comma generated for an empty list.
+        yield ","
+
+##############################################################################
+
+class FrameTable(object):
+    """ A table of unique frames, used to remove duplicate frames from
+        animations. Frames are grouped by the dimensions at the start of
+        their arrays; each group can be written as a single array, indexed
+        by the frame indices of the arrays that use it.
+
+        @ivar prefix: The start of the name of each group's array.
+        @ivar groups: A dictionary of frame lists, keyed by dimensions.
+    """
+
+    def __init__(self, prefix="shared_frames"):
+        self.prefix = prefix
+        self.groups = {}
+        self._indices = {}
+
+
+    @classmethod
+    def forOutput(cls, output):
+        """ Make a table whose arrays are named after the file they will be
+            written to (e.g. 'sprites_shared_8x8' for 'sprites.h'), so the
+            tables of different outputs used in the same sketch don't
+            define the same arrays. A table for a stream without a filename
+            (e.g. stdout) gets the default prefix.
+
+            @param output: The output filename or stream.
+        """
+        name = output if isinstance(output, str) else \
+            getattr(output, 'name', None)
+        if not isinstance(name, str) or name.startswith('<'):
+            return cls()
+        return cls(fixName(name) + "_shared")
+
+
+    def add(self, sizes, frame):
+        """ Add a frame to the table, if an identical one isn't already in
+            it.
+
+            @param sizes: The dimensions at the start of the frame's array.
+            @param frame: The frame's data.
+            @return: A tuple containing the frame's index within its group,
+                and whether the frame was new.
+        """
+        sizes = tuple(sizes)
+        key = (sizes, tuple(frame))
+        index = self._indices.get(key)
+        if index is not None:
+            return index, False
+        group = self.groups.setdefault(sizes, [])
+        index = self._indices[key] = len(group)
+        group.append(frame)
+        return index, True
+
+
+    def name(self, sizes):
+        """ Get the name of a group's array.
+        """
+        return "%s_%s" % (self.prefix, "x".join(map(str, sizes)))
+
+
+    def arrays(self):
+        """ Get the data for every group, in the same form as the arrays
+            generated by a converter's `createArrays()`.
+
+            @return: A list of `(name, data)` pairs, sorted by name.
+        """
+        return sorted((self.name(sizes), list(sizes) + frames)
+                      for sizes, frames in self.groups.items())
+
+
+##############################################################################
+
+class Sprites:
+    """
+    A class representing the namespace for all GAMBY sprite conversion code.
+    Do not instantiate; just call the class' methods directly.
+
+    @cvar _useMask: The default setting for whether GIF image transparency
+        should be used to generate a second 'mask' sprite.
+    @cvar _dataType: The name of the Arduino data type to use when generating
+        code.
+    @cvar _unitSize: The number of bits per unit of data.
+    @cvar _frameLabel: The word used in the comment before each frame's data
+        in generated code.
+    @cvar _dedup: The default setting for how duplicate frames are removed
+        (see `convertFiles()`).
+    """
+
+    _useMask = True
+    _dataType = 'prog_uchar'
+    _unitSize = 8
+    _frameLabel = "Frame"
+    _dedup = None
+
+
+    @classmethod
+    def openImage(cls, f):
+        """ Load and perform basic validation of an image before conversion.
+            Can be called with either the filename of an image or an
+            `Image.Image`; in the latter case, only the validation is
+            performed.
+
+            @raise ConversionError: The image failed validation.
+            @raise IOError: The image could not be read (or it was neither
+                a filename nor `Image.Image`).
+
+            @param f: An image, or an image's filename.
+            @type f: `Image.Image` or string.
+            @rtype: `Image.Image`
+        """
+        if isinstance(f, str):
+            return Image.open(f)
+        elif isinstance(f, Image.Image):
+            return f
+        # Problem.
+        raise IOError("Can't convert %s (not filename or Image.Image)" % f)
+
+
+    @classmethod
+    def cacheSettings(cls, filename, grid=None):
+        """ Get the settings that change how a file is converted, other
+            than the mask and dithering (and so must be part of its cache
+            key; see `ConversionCache.key()`). Images are converted the
+            same regardless of their names, and only sprite sheets have a
+            grid.
+
+            @param filename: The name of the source image.
+            @param grid: The sprite sheet cell size, or `None`.
+            @rtype: string
+        """
+        return ""
+
+
+    @classmethod
+    def numFrames(cls, img):
+        """ Return the number of frames in an animated GIF. This may
+            require decoding every frame, so the converters don't use it;
+            the count is only computed if a caller asks for it.
+
+            @param img: The image to count
+            @type img: `Image.Image`
+            @return: The frame count
+        """
+        n = getattr(img, 'n_frames', None)
+        if n is not None:
+            # Pillow counts the frames itself, and remembers the result.
+            return n
+        i = 1
+        img.seek(0)
+        try:
+            while True:
+                img.seek(img.tell() + 1)
+                i += 1
+        except EOFError:
+            pass
+        img.seek(0)
+        return i
+
+
+    @classmethod
+    def getAlpha(cls, img):
+        """ Retrieve an image's alpha.
+
+            @param img: The image, presumably one with an alpha.
+            @type img: `Image.Image`
+            @return: A grayscale (mode "L") `Image.Image`
+        """
+        if img.mode in ('RGBA', 'LA', 'PA'):
+            return img.split()[-1]
+        # Get alpha for mask, using img converted to RGBA
+        return img.convert("RGBA").split()[-1]
+
+
+    @classmethod
+    def getMask(cls, img):
+        """ Retrieve an image's transparency as a 1-bit image, ready for
+            packing: transparent pixels are black, opaque ones are white.
+            Palette images with a single transparent color index (e.g. GIFs)
+            are handled with a palette lookup, without converting to RGBA.
+
+            @param img: The image, presumably one with transparency.
+            @type img: `Image.Image`
+            @return: A 1-bit (mode "1") `Image.Image`
+        """
+        transparency = img.info.get('transparency')
+        if img.mode in ('1', 'L', 'P', 'RGB') and transparency is None:
+            # No transparency at all; completely opaque.
+            return Image.new('1', img.size, 255)
+        if img.mode == 'P' and isinstance(transparency, int):
+            lut = [255] * 256
+            lut[transparency] = 0
+            return img.point(lut, '1')
+        return cls.getAlpha(img).convert('1')
+
+
+    @classmethod
+    def createData(cls, img, ignoreSolid=True, sizes=True):
+        """ Turn an image into an array of bits, stored as a series of bytes.
+            The first two items are the image dimensions. The bits are in
+            the order the LCD uses (see `packColumns()`).
+
+            @param img: The image from which to generate the data
+            @type img: `Image.Image`
+            @param ignoreSolid: If `True`, bitmaps that are all black or
+                all white are ignored; `None` is returned.
+            @return: A list containing [<width>,<height>, [<frame1 bytes...>],
+                ..., [<frameN bytes...>]]
+        """
+        if img is None:
+            return None
+        if img.mode != '1':
+            img = img.convert('1')
+        if ignoreSolid:
+            lo, hi = img.getextrema()
+            if lo == hi:
+                # Totally black or totally white, ignore
+                return None
+
+        result = []
+        if sizes:
+            # Make the data list. The first two elements are the dimension
+            result.extend(img.size)
+
+        # bitmaps on LCD are 'inverse': 1 is black, 0 is not
+        result.extend(unpackUnits(packColumns(img, cls._unitSize),
+                                  cls._unitSize))
+        return result
+
+
+    @classmethod
+    def undo(cls, d, imgSize=None):
+        """ Convert one frame of bitmap data into an image. The frames of
+            a multi-frame array are converted one at a time; see
+            `undoArray()`.
+
+            @param d: A list of bitmap data, or a buffer containing one
+                frame's packed data as stored in flash (e.g. from
+                `Bundle.frame()`).
+            @param imgSize: The size of the image. Required if `d` is a
+                buffer; otherwise, the size is taken from the start of `d`.
+        """
+        if not isinstance(d, list):
+            if cls._unitSize == 16:
+                # Stored little-endian; packColumns() data is big-endian.
+                if isinstance(d, memoryview):
+                    d = d.tobytes()
+                n = len(d) // 2
+                d = struct.pack('>%dH' % n, *struct.unpack('<%dH' % n, d))
+            return unpackColumns(d, imgSize)
+        if imgSize == None:
+            imgSize = d[0:2]
+            d = d[2:]
+        data = packUnits(d, cls._unitSize, '>')
+        return unpackColumns(data, tuple(imgSize))
+
+
+    @classmethod
+    def sizeValues(cls, data):
+        """ Get the dimensions that start an array's data, as they appear
+            in generated code.
+        """
+        return data[:2]
+
+
+    @classmethod
+    def arrayInfo(cls, data):
+        """ Get the dimensions and frame count of a list of bitmap data.
+
+            @return: A tuple containing the width, height and frame count.
+        """
+        return data[0], data[1], len(data) - 2
+
+
+    @classmethod
+    def frameData(cls, data):
+        """ Get the dimensions of the source image and each frame's data
+            from a list of bitmap data, as generated by `createArrays()`.
+
+            @return: A tuple containing the width, height and a list of
+                each frame's data.
+        """
+        return data[0], data[1], data[2:]
+
+
+    @classmethod
+    def arrayUnits(cls, data):
+        """ Flatten a list of bitmap data into a single list of values, in
+            the order they appear in generated code.
+        """
+        return list(cls.sizeValues(data)) + \
+            list(itertools.chain.from_iterable(data[2:]))
+
+
+    @classmethod
+    def iterCode(cls, name, data, sizes=True, width=78, tab="    "):
+        """ Generate Arduino code from a single list of bitmap data, one
+            line at a time, so large images don't need the whole code to be
+            built in memory.
+
+            @return: A generator yielding lines of code, each ending with
+                a newline.
+        """
+        if data == None:
+            return
+        lineWidth = width - tab.count(" ") + tab.count("\t") * 4
+        yield "PROGMEM %s %s[] = {\n" % (cls._dataType, name)
+        if sizes:
+            lines = [[", ".join(map(str, cls.sizeValues(data))) + ","]]
+            frames = data[2:]
+        else:
+            lines = []
+            frames = data
+        for i, frame in enumerate(frames):
+            lines.append(["// %s %d" % (cls._frameLabel, i)])
+            lines.append(wrapHex(frame, lineWidth))
+
+        # The last line's trailing comma is removed, so each line is held
+        # until the next one is known.
+        last = None
+        for line in itertools.chain.from_iterable(lines):
+            if last is not None:
+                yield tab + last + "\n"
+            last = line
+        if last is not None:
+            yield tab + last[:-1] + "\n"
+        yield "};\n"
+
+
+    @classmethod
+    def writeCode(cls, name, data, digits=2, sizes=True, width=78, tab="    "):
+        """ Generate Arduino code from a single list of bitmap data.
+        """
+        return ''.join(cls.iterCode(name, data, sizes, width, tab))
+
+
+    @classmethod
+    def createArrays(cls, img, mask=None, dither=None, grid=None):
+        """ Generate the bitmap data for an image, without generating any
+            code. Any transparency or alpha channel is turned into its own
+            sprite.
+
+            @param img: The image to convert.
+            @type img: `Image.Image`
+            @param mask: If `True` (default), additional sprites are created
+                from the image's transparency information.
+            @param dither: How to convert frames that aren't 1-bit: one of
+                the `DITHERS`, or `None` for the default.
+            @param grid: A sprite sheet's cell size; ignored (see
+                `Sheets.createArrays()`).
+            @return: A tuple containing a list of `(suffix, data)` pairs
+                (one for each array to generate; the suffix is appended to
+                the array's name), the number of converted images, and the
+                total number of bytes they consume.
+        """
+        mask = cls._useMask if mask is None else mask
+        toBitmap = Dither(dither)
+
+        # Frames are decoded once, as they are iterated; there's no separate
+        # pass to count them first.
+        totalSize = 0
+        bits = list(img.size)
+        alphaBits = list(img.size)
+
+        for frame in ImageSequence.Iterator(img):
+            with profileStage('decode', frame):
+                frame.load()
+
+            # Bits are packed by column, the best order for the LCD; the
+            # frame is read as it is, without making a rotated copy.
+            with profileStage('pack', frame) as stage:
+                converted = cls.createData(toBitmap(frame),
+                                           ignoreSolid=False, sizes=False)
+                stage.bytes = len(converted)
+            bits.append(converted)
+            totalSize += len(converted)
+
+            if mask:
+                with profileStage('mask', frame) as stage:
+                    alpha = cls.getMask(frame)
+                    convertedAlpha = cls.createData(alpha, ignoreSolid=False,
+                                                    sizes=False)
+                    stage.bytes = len(convertedAlpha)
+                alphaBits.append(convertedAlpha)
+                totalSize += len(convertedAlpha)
+
+        arrays = [('', bits)]
+        if mask:
+            arrays.append(('_mask', alphaBits))
+        return arrays, len(bits) - 2, totalSize
+
+
+    @classmethod
+    def iterArrays(cls, filename, arrays, indexes=()):
+        """ Generate Arduino code from the data generated by
+            `createArrays()`, one line at a time.
+
+            @param filename: The name of the source image. The arrays'
+                names are derived from it.
+            @param arrays: A list of `(suffix, data)` pairs.
+            @param indexes: A list of `(suffix, indices)` pairs, as
+                generated by `dedupArrays()`.
+            @return: A generator yielding lines of code, each ending with
+                a newline.
+        """
+        name = fixName(filename)
+        code = [cls.iterEncoded(name + suffix, data)
+                if isinstance(data, EncodedData)
+                else cls.iterCode(name + suffix, data)
+                for suffix, data in arrays]
+        code.extend(cls.iterIndex(name + suffix + "_index", indices)
+                    for suffix, indices in indexes)
+        yield "// Converted from %s\n" % filename
+        for i, lines in enumerate(code):
+            if i > 0:
+                yield "\n"
+            for line in lines:
+                yield line
+
+
+    @classmethod
+    def iterEncoded(cls, name, encoded, width=78, tab="    "):
+        """ Generate Arduino code for a compressed array, one line at a
+            time.
+
+            @param encoded: The compressed data.
+            @type encoded: `EncodedData`
+            @return: A generator yielding lines of code, each ending with
+                a newline.
+        """
+        lineWidth = width - tab.count(" ") + tab.count("\t") * 4
+        header = list(cls.sizeValues(encoded.dims)) + \
+            [encoded.frameCount, ENCODINGS.index(encoded.encoding)]
+        yield "// %s: %s, %d -> %d bytes\n" % (name, encoded.encoding,
+                                                 encoded.rawSize,
+                                                 len(header) +
+                                                 len(encoded.data))
+        yield "PROGMEM %s %s[] = {\n" % (cls._dataType, name)
+        yield tab + ", ".join(map(str, header)) + ",\n"
+        yield tab + "// %ss (%s)\n" % (cls._frameLabel, encoded.encoding)
+        last = None
+        for line in wrapHex(encoded.data, lineWidth):
+            if last is not None:
+                yield tab + last + "\n"
+            last = line
+        yield tab + last[:-1] + "\n"
+        yield "};\n"
+
+
+    @classmethod
+    def compressArrays(cls, arrays, masked=False):
+        """ Compress the data generated by `createArrays()`, using
+            whichever of the `ENCODINGS` makes each array smallest. An
+            array that no encoding makes smaller (or has more than 255
+            frames, too many for the encoded header) is left as it was.
+
+            @param arrays: A list of `(suffix, data)` pairs.
+            @param masked: If `True`, pixels hidden by a sprite's mask (i.e.
+                completely transparent) are cleared before compressing,
+                which makes longer runs. The sprite looks the same when
+                drawn with its mask, but not without it.
+            @return: A tuple containing a list of `(suffix, encoded)` pairs
+                (`encoded` being an `EncodedData`, or the original data if
+                it was left uncompressed), the number of bytes saved, and
+                a list of `(suffix, encoding, rawSize, size)` tuples
+                reporting the results for each array (the encoding of an
+                array left as it was is 'uncompressed').
+        """
+        if cls._unitSize != 8:
+            raise ConversionError("Only 8-bit data can be compressed")
+        masks = dict(arrays) if masked else {}
+        result = []
+        report = []
+        saved = 0
+        for suffix, data in arrays:
+            dims, frames = data[:2], data[2:]
+            header = len(cls.sizeValues(data))
+            rawSize = header + sum(len(f) for f in data[2:])
+            if len(frames) > 255:
+                result.append((suffix, data))
+                report.append((suffix, 'uncompressed', rawSize, rawSize))
+                continue
+            mask = masks.get(suffix + '_mask')
+            if mask is not None and len(mask) == len(data):
+                # Mask bits are 1 where the image is transparent.
+                frames = [[b & ~m & 0xff for b, m in zip(frame, maskFrame)]
+                          for frame, maskFrame in zip(frames, mask[2:])]
+            best = None
+            for encoding in ENCODINGS:
+                encoded = encodeFrames(encoding, frames)
+                if best is None or len(encoded) < len(best[1]):
+                    best = encoding, encoded
+            if header + 2 + len(best[1]) >= rawSize:
+                result.append((suffix, data))
+                report.append((suffix, 'uncompressed', rawSize, rawSize))
+                continue
+            encoded = EncodedData(best[0], dims, len(frames), best[1], rawSize)
+            size = header + 2 + len(encoded.data)
+            result.append((suffix, encoded))
+            report.append((suffix, encoded.encoding, rawSize, size))
+            saved += rawSize - size
+        return result, saved, report
+
+
+    @classmethod
+    def iterIndex(cls, name, indices, width=78, tab="    "):
+        """ Generate Arduino code for an array of frame indices, one line
+            at a time.
+
+            @return: A generator yielding lines of code, each ending with
+                a newline.
+        """
+        lineWidth = width - tab.count(" ") + tab.count("\t") * 4
+        yield "PROGMEM %s %s[] = {\n" % (_indexType(indices)[0], name)
+        last = None
+        for line in wrapHex(indices, lineWidth, str):
+            if last is not None:
+                yield tab + last + "\n"
+            last = line
+        yield tab + last[:-1] + "\n"
+        yield "};\n"
+
+
+    @classmethod
+    def finishTable(cls, table, compress=None, report=None):
+        """ Get the arrays of a `FrameTable`, compressing them like the
+            arrays of each image (see `finishArrays()`). The frames of a
+            sprite and its mask may share a table's array, so 'masked'
+            compression can't clear the hidden pixels; it compresses the
+            table the same as 'auto'.
+
+            @param table: The `FrameTable` used for 'batch' deduplication.
+            @param compress: `None`, 'auto' or 'masked'; see `convert()`.
+            @param report: A list for compression results, or `None`; see
+                `convertFiles()`.
+            @return: A tuple containing a list of `(name, data)` pairs
+                (`data` being an `EncodedData` if it was compressed), and
+                the number of bytes saved.
+        """
+        arrays = table.arrays()
+        if not compress:
+            return arrays, 0
+        with profileStage('compress', frames=0) as stage:
+            arrays, saved, compressed = cls.compressArrays(arrays)
+            stage.bytes = -saved
+        if report is not None:
+            report.extend(compressed)
+        return arrays, saved
+
+
+    @classmethod
+    def iterTable(cls, arrays):
+        """ Generate Arduino code for the frames in a `FrameTable`, one
+            line at a time.
+
+            @param arrays: The table's `(name, data)` pairs, as returned
+                by `finishTable()`.
+            @return: A generator yielding lines of code, each ending with
+                a newline.
+        """
+        yield "// Shared frames\n"
+        for i, (name, data) in enumerate(arrays):
+            if i > 0:
+                yield "\n"
+            lines = cls.iterEncoded(name, data) \
+                if isinstance(data, EncodedData) else cls.iterCode(name, data)
+            for line in lines:
+                yield line
+
+
+    @classmethod
+    def dedupArrays(cls, arrays, table=None):
+        """ Remove duplicate frames from the data generated by
+            `createArrays()`. Each array's frames are replaced by an array
+            of frame indices. Without a shared `FrameTable`, each array
+            keeps its own unique frames (arrays with one frame are left
+            alone); with one, the frames go into the table, and only the
+            indices remain.
+
+            @param arrays: A list of `(suffix, data)` pairs.
+            @param table: A `FrameTable` shared by several images, or
+                `None`.
+            @return: A tuple containing the remaining `(suffix, data)`
+                pairs, a list of `(suffix, indices)` pairs, and the number
+                of bytes saved.
+        """
+        unitBytes = cls._unitSize // 8
+        result = []
+        indexes = []
+        saved = 0
+        for suffix, data in arrays:
+            sizes, frames = data[:2], data[2:]
+            if table is None and len(frames) < 2:
+                result.append((suffix, data))
+                continue
+            frameTable = table if table is not None else FrameTable()
+            indices = []
+            for frame in frames:
+                index, new = frameTable.add(sizes, frame)
+                indices.append(index)
+                if not new:
+                    saved += len(frame) * unitBytes
+            if table is None:
+                result.append((suffix, list(sizes) +
+                               frameTable.groups[tuple(sizes)]))
+            indexes.append((suffix, indices))
+            saved -= len(indices) * _indexType(indices)[1] // 8
+        return result, indexes, saved
+
+
+    @classmethod
+    def writeArrays(cls, filename, arrays):
+        """ Generate Arduino code from the data generated by
+            `createArrays()`.
+
+            @param filename: The name of the source image. The arrays'
+                names are derived from it.
+            @param arrays: A list of `(suffix, data)` pairs.
+        """
+        return ''.join(cls.iterArrays(filename, arrays))
+
+
+    @classmethod
+    def iterEntries(cls, filename, arrays, indexes=()):
+        """ Generate bundle entries (see `writeBundle()`) from the data
+            generated by `createArrays()`. Frame indices (see
+            `dedupArrays()`) become entries one frame wide.
+
+            @param filename: The name of the source image. The entries'
+                names are derived from it. If `None`, the suffixes are used
+                as the names.
+            @param arrays: A list of `(suffix, data)` pairs.
+            @param indexes: A list of `(suffix, indices)` pairs.
+            @return: A generator yielding `(name, width, height, frames,
+                unitSize, headerSize, encoding, data)` tuples.
+        """
+        name = fixName(filename) if filename is not None else ''
+        for suffix, data in arrays:
+            if isinstance(data, EncodedData):
+                header = list(cls.sizeValues(data.dims)) + \
+                    [data.frameCount, ENCODINGS.index(data.encoding)]
+                yield (name + suffix, data.dims[0],
+                       cls.arrayInfo(data.dims)[1], data.frameCount,
+                       cls._unitSize, len(header), data.encoding,
+                       packUnits(header + data.data))
+                continue
+            width, height, frames = cls.arrayInfo(data)
+            headerSize = len(cls.sizeValues(data)) * cls._unitSize // 8
+            yield (name + suffix, width, height, frames, cls._unitSize,
+                   headerSize, 'raw',
+                   packUnits(cls.arrayUnits(data), cls._unitSize))
+        for suffix, indices in indexes:
+            unitSize = _indexType(indices)[1]
+            yield (name + suffix + "_index", len(indices), 1, 1, unitSize, 0,
+                   'raw', packUnits(indices, unitSize))
+
+
+    @classmethod
+    def convertArrays(cls, f, mask=None, cache=None, dither=None,
+                      name=None, grid=None):
+        """ Turn an image into GAMBY data, without generating any code.
+            Takes the same arguments as `convert()`, plus `name` (see
+            `convertAsset()`).
+
+            @return: A tuple containing the image's filename, the list of
+                `(suffix, data)` pairs generated by `createArrays()`, the
+                number of converted images, and the total number of bytes
+                they consume.
+        """
+        mask = cls._useMask if mask is None else mask
+
+        profile = Profile.active()
+        if profile is not None:
+            profile.filename = getattr(f, 'filename', f)
+
+        key = result = None
+        if cache is not None and isinstance(f, str):
+            with profileStage('cache', frames=0):
+                key = cache.key(cls, f, mask, dither, grid)
+                result = cache.get(key)
+
+        if result is None:
+            with profileStage('open', frames=0):
+                img = cls.openImage(f)
+            filename = name or getattr(img, 'filename', None) or \
+                (f if isinstance(f, str) else '')
+            result = cls.createArrays(img, mask, dither, grid)
+            if not result[0]:
+                # Nothing returned (empty list or possibly None)
+                raise ConversionError(
+                    "Could not convert %s (no data?)" % filename)
+            if key is not None:
+                cache.put(key, result)
+        else:
+            filename = name or f
+
+        return (filename,) + tuple(result)
+
+
+    @classmethod
+    def convertAsset(cls, f, mask=None, cache=None, dedup=None, table=None,
+                     compress=None, report=None, dither=None, name=None,
+                     grid=None):
+        """ Turn an image into GAMBY data, without generating any code.
+
+            @param f: The image file or filename to convert
+            @param mask: If `True` (default), additional sprites are created
+                from the image's transparency information.
+            @param cache: A `ConversionCache`. If `f` is a filename and its
+                data is in the cache, the image is not loaded at all.
+            @param dedup: `None`, 'sprite' or 'batch'; see `convertFiles()`.
+                Defaults to the converter's own setting.
+            @param table: The `FrameTable` shared by the images converted
+                with 'batch' deduplication.
+            @param compress: `None`, 'auto' or 'masked'; see `convert()`.
+            @param report: A list for compression results, or `None`; see
+                `convertFiles()`.
+            @param dither: How to convert images that aren't 1-bit: one of
+                the `DITHERS`, or `None` for the default. See `Dither`.
+            @param name: The name from which to derive the arrays' names,
+                instead of the image's filename. An image that has no
+                filename (e.g. one created in memory) and no name is named
+                'no_name'.
+            @param grid: A sprite sheet's cell size; see
+                `Sheets.createArrays()`. Ignored by other converters.
+            @rtype: `Asset`
+        """
+        asset = Asset(cls, *cls.convertArrays(f, mask, cache, dither, name,
+                                              grid))
+        return asset.finish(dedup or cls._dedup, table, compress, report)
+
+
+    @classmethod
+    def convert(cls, f, mask=None, size=None, cache=None, dedup=False,
+                compress=None, dither=None, grid=None):
+        """ Turn an image into Arduino code for GAMBY. Any transparency
+            or alpha channel is turned into its own sprite. To get the data
+            itself rather than code, use `convertAsset()`.
+
+            @param f: The image file or filename to convert
+            @param mask: If `True` (default), additional sprites are created
+                from the image's transparency information.
+            @param size: A two element list containing the total number of
+                converted images and the total number of bytes they consume.
+                This is modified 'in place'.
+            @param cache: A `ConversionCache`. If `f` is a filename and its
+                data is in the cache, the image is not loaded at all.
+            @param dedup: If `True`, duplicate frames are removed, and each
+                array gets an array of frame indices (see `dedupArrays()`).
+            @param compress: `None` (no compression), 'auto' (compress each
+                array with the best encoding) or 'masked' (the same, but
+                pixels hidden by the mask are cleared first). See
+                `compressArrays()`.
+            @param dither: How to convert images that aren't 1-bit: one of
+                the `DITHERS`, or `None` for the default. See `Dither`.
+            @param grid: A sprite sheet's cell size; see
+                `Sheets.createArrays()`. Ignored by other converters.
+        """
+        asset = cls.convertAsset(f, mask, cache, dedup and 'sprite' or None,
+                                 compress=compress, dither=dither, grid=grid)
+
+        if size is not None:
+            # Image count and total size (in bytes), modified 'in place'
+            size[0] += asset.count
+            size[1] += asset.size
+
+        with profileStage('emit', frames=0) as stage:
+            code = asset.code()
+            stage.bytes = asset.size
+        return code
+
+
+    @classmethod
+    def finishArrays(cls, filename, arrays, totalSize, dedup=None,
+                     table=None, compress=None, report=None):
+        """ Remove duplicate frames from and/or compress the data
+            generated by `createArrays()`, as `convertFiles()` does.
+
+            @param filename: The name of the source image.
+            @param arrays: A list of `(suffix, data)` pairs.
+            @param totalSize: The number of bytes the arrays consume.
+            @param dedup: `None`, 'sprite' or 'batch'; see `convertFiles()`.
+            @param table: The `FrameTable` used for 'batch' deduplication.
+            @param compress: `None`, 'auto' or 'masked'; see `convert()`.
+            @param report: A list for compression results, or `None`; see
+                `convertFiles()`.
+            @return: A tuple containing the remaining `(suffix, data)`
+                pairs, the `(suffix, indices)` pairs generated by
+                `dedupArrays()`, and the new total size.
+        """
+        indexes = ()
+        if dedup:
+            with profileStage('dedup', frames=0) as stage:
+                arrays, indexes, saved = cls.dedupArrays(arrays, table)
+                stage.bytes = -saved
+            totalSize -= saved
+        if compress:
+            with profileStage('compress', frames=0) as stage:
+                arrays, saved, compressed = cls.compressArrays(
+                    arrays, compress == 'masked')
+                stage.bytes = -saved
+            totalSize -= saved
+            if report is not None:
+                report.extend((fixName(filename) + r[0],) + r[1:]
+                              for r in compressed)
+        return arrays, indexes, totalSize
+
+
+    @classmethod
+    def convertFiles(cls, filenames, size=None, mask=None, out=sys.stdout,
+                     jobs=1, cache=None, format='code', dedup=None,
+                     compress=None, report=None, dither=None, grid=None):
+        """ Convert a set of images, writing the generated code to a file
+            or stream. The output is always in the same order as
+            `filenames`, regardless of the number of jobs.
+
+            @param filenames: The names of the images to convert.
+            @param size: A two element list containing the total number of
+                converted images and the total number of bytes they consume.
+                This is modified 'in place'.
+            @param mask: If `True`, additional sprites are created from the
+                images' transparency information.
+            @param out: A stream or filename to which to write the results.
+            @param jobs: The number of processes to use for conversion.
+            @param cache: A `ConversionCache` for reusing previously
+                converted data.
+            @param format: The output format: one of the keys of
+                `OUTPUT_FORMATS`. Formats other than 'code' are binary;
+                'incbin' also writes a C header next to the output file.
+            @param dedup: How to remove duplicate frames: `None` (don't),
+                'sprite' (within each image's arrays), or 'batch' (across
+                all the images, which share arrays of unique frames). See
+                `dedupArrays()`. Defaults to the converter's own setting.
+            @param compress: `None`, 'auto' or 'masked'; see `convert()`.
+            @param report: A list, to which a `(name, encoding, rawSize,
+                size)` tuple is appended for each compressed array.
+            @param dither: How to convert images that aren't 1-bit: one of
+                the `DITHERS`, or `None` for the default. See `Dither`.
+            @param grid: A sprite sheet's cell size; see
+                `Sheets.createArrays()`. Ignored by other converters.
+        """
+        if format not in OUTPUT_FORMATS:
+            raise ValueError("Unknown output format: %r" % format)
+        if dither is not None and dither not in DITHERS:
+            raise ValueError("Unknown dithering method: %r" % dither)
+        dedup = dedup or cls._dedup
+        table = FrameTable.forOutput(out) if dedup == 'batch' else None
+        if isinstance(out, str):
+            out = open(out, 'w' if format == 'code' else 'wb')
+        entries = []
+        profile = Profile.active()
+        tasks = [(cls, filename, mask, cache, dither, grid,
+                  profile is not None) for filename in filenames]
+        pool = None
+        if jobs > 1 and len(tasks) > 1:
+            pool = multiprocessing.Pool(min(jobs, len(tasks)))
+            results = pool.imap(_convertOne, tasks,
+                                max(1, len(tasks) // (jobs * 4)))
+        else:
+            results = map(_convertOne, tasks)
+        try:
+            # Code is written as it is generated, rather than built in memory.
+            for result, stats in results:
+                if stats is not None:
+                    # Collected separately, in case it was in another process.
+                    profile.merge(*stats)
+                    profile.filename = result[0]
+                asset = Asset(cls, *result).finish(dedup, table, compress,
+                                                   report)
+                with profileStage('emit', frames=0) as stage:
+                    if format == 'code':
+                        out.writelines(asset.iterCode())
+                        out.write('\n')
+                    else:
+                        entries.extend(asset.entries())
+                    stage.bytes = asset.size
+                if size is not None:
+                    size[0] += asset.count
+                    size[1] += asset.size
+            if table is not None and table.groups:
+                arrays, saved = cls.finishTable(table, compress, report)
+                if size is not None:
+                    size[1] -= saved
+                if format == 'code':
+                    out.writelines(cls.iterTable(arrays))
+                    out.write('\n')
+                else:
+                    entries.extend(cls.iterEntries(None, arrays))
+        except:
+            if pool is not None:
+                pool.terminate()
+                pool = None
+            raise
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        if cache is not None:
+            cache.evict()
+        if format != 'code':
+            offsets = writeBundle(entries, out)
+            if format == 'incbin':
+                if not hasattr(out, 'name') or out.name.startswith('<'):
+                    raise ValueError("incbin output requires a filename")
+                header = open(os.path.splitext(out.name)[0] + ".h", 'w')
+                try:
+                    writeIncbinHeader(entries, offsets, out.name, header)
+                finally:
+                    header.close()
+        if out != sys.stdout:
+            out.close()
+
+
+    @classmethod
+    def undoArray(cls, sizes, frames):
+        """ Convert an array's data, as parsed by `parseCode()`, into
+            images.
+
+            @param sizes: The dimensions at the start of the array.
+            @param frames: A list containing each frame's data.
+            @rtype: A list of `Image.Image`, one per frame.
+        """
+        return [cls.undo(frame, sizes[:2]) for frame in frames]
+
+
+    @classmethod
+    def unconvert(cls, data, size=None, out=None):
+        """ Convert Arduino code back into images. Every array in the code
+            that is an image is converted, by whichever converter
+            generated it (see `converterFor()`).
+
+            @param data: The code to convert.
+            @return: A list of `(name, images)` tuples; `images` is a list
+                containing each frame of the array.
+        """
+        # TODO: Put alpha back into GIF?
+        result = []
+        for dataType, name, label, sizes, frames in parseCode(data):
+            converter = converterFor(dataType, label, sizes, name)
+            if converter is None:
+                continue
+            result.append((name, converter.undoArray(sizes, frames)))
+        return result
+
+
+    @classmethod
+    def unconvertFiles(cls, filenames, size=None, out=''):
+        """ Convert code back into images, writing each array to a GIF
+            named after it. Arrays with more than one frame become animated
+            GIFs.
+
+            @param filenames: The names of the code files to convert.
+            @param size: A two element list; the number of images written
+                is added to the first element. This is modified 'in place'.
+            @param out: The directory in which to write the images. It is
+                created if it does not exist.
+            @return: A list of the names of the files written.
+        """
+        if out and not os.path.isdir(out):
+            os.makedirs(out)
+        written = []
+        for filename in filenames:
+            with open(filename, 'r') as f:
+                data = f.read()
+            for name, frames in cls.unconvert(data):
+                if not frames:
+                    continue
+                path = os.path.join(out, name + ".gif")
+                if len(frames) > 1:
+                    # Some versions of Pillow can't write animated 1-bit GIFs
+                    frames = [frame.convert('L') for frame in frames]
+                    frames[0].save(path, save_all=True,
+                                   append_images=frames[1:])
+                else:
+                    frames[0].save(path)
+                written.append(path)
+        if size is not None:
+            size[0] += len(written)
+        return written
+
+
+    @classmethod
+    def preview(cls, asset, screen=None):
+        """ Draw converted data on an emulated GAMBY screen, as a sketch
+            would draw it: each frame of a sprite in the top left corner.
+            Masked sprites are drawn over a checkerboard, so the parts the
+            mask leaves alone can be seen.
+
+            @param asset: The data to draw, as converted by this converter.
+            @type asset: `Asset`
+            @param screen: The `Screen` to draw on, or `None` to use a new
+                one.
+            @return: A list of 1-bit images, one for each screen drawn.
+        """
+        screen = Screen() if screen is None else screen
+        size = (asset.width, asset.height)
+        result = []
+        for i, frame in enumerate(asset.frames):
+            if asset.mask is None:
+                screen.clear()
+                screen.drawSprite(0, 0, frame, size, unitSize=cls._unitSize)
+            else:
+                screen.clear(Screen.CHECKERBOARD)
+                screen.drawSprite(0, 0, frame, size, asset.mask[i],
+                                  cls._unitSize)
+            result.append(screen.image())
+        return result
+
+
+    @classmethod
+    def previewFiles(cls, filenames, out, mask=None, cache=None,
+                     dither=None, columns=PREVIEW_COLUMNS, scale=1,
+                     grid=None):
+        """ Convert a set of images and draw the results on an emulated
+            GAMBY screen (see `preview()`), writing every screen to an image:
+            a contact sheet, or an animated GIF if `out` ends with '.gif'.
+            No code is generated.
+
+            @param filenames: The names of the images to convert.
+            @param out: The name of the image to write.
+            @param mask: If `True`, additional sprites are created from the
+                images' transparency information.
+            @param cache: A `ConversionCache` for reusing previously
+                converted data.
+            @param dither: One of the `DITHERS`, or `None` for the default.
+            @param columns: The number of screens in each row of the
+                contact sheet.
+            @param scale: How much to enlarge each screen.
+            @param grid: A sprite sheet's cell size; see
+                `Sheets.createArrays()`. Ignored by other converters.
+            @return: The number of screens drawn.
+        """
+        screen = Screen()
+        images = []
+        for filename in filenames:
+            asset = Asset(cls, *cls.convertArrays(filename, mask, cache,
+                                                  dither, grid=grid))
+            images.extend(cls.preview(asset, screen))
+        if not images:
+            raise ConversionError("Nothing to preview")
+        if out.lower().endswith('.gif'):
+            frames = [img.convert('L') for img in images]
+            if scale != 1:
+                frames = [img.resize((img.size[0] * scale,
+                                      img.size[1] * scale), Image.NEAREST)
+                          for img in frames]
+            frames[0].save(out, save_all=True, append_images=frames[1:])
+        else:
+            contactSheet(images, columns, scale=scale).save(out)
+        return len(images)
+
+
+##############################################################################
+
+class Tilesets(Sprites):
+    """
+    Methods for generating Gamby tilesets from image data. Tiles are 16-bit
+    integers representing a 4x4 pixel square; a tileset consists of 16 tiles.
+    The source file is expected to be a 16x16 image containing a 4x4 grid of
+    tiles.
+    """
+
+    _useMask = False
+    _dataType = "prog_uint16_t"
+    _unitSize = 16
+
+    @classmethod
+    def openImage(cls, f):
+        """ Perform basic validation of an image before conversion. Raises
+            a `ConversionError` if the validation fails; does nothing if
+            validation passes.
+        """
+        img = Sprites.openImage(f)
+        if img.size[0] != 16 or img.size[1] != 16:
+            raise ConversionError("Tilesets must be 16x16; %s is %s" % \
+                (img.filename, img.size))
+        return img
+
+
+    @classmethod
+    def createArrays(cls, img, mask=None, dither=None, grid=None):
+        """ Generate the tile data for a tileset image. Tilesets have no
+            mask or grid; `mask` and `grid` are ignored.
+        """
+        bits = cls.extractTiles(img, dither)
+        return [('', bits)], 1, len(bits) * 2
+
+
+    @classmethod
+    def extractTiles(cls, img, dither=None):
+        """ Get the data for every 4x4 tile in an image. The image can be
+            any multiple of 4 pixels wide and high. Tiles are ordered as in
+            a tileset: starting at the bottom right, going up each column,
+            from right to left. Each tile's bits are in the same order as
+            any other image's (see `packColumns()`).
+
+            @param img: The image to convert.
+            @type img: `Image.Image`
+            @param dither: One of the `DITHERS`, or `None` for the default.
+            @return: A list of 16-bit tile values.
+        """
+        with profileStage('decode', img):
+            img.load()
+        with profileStage('pack', img) as stage:
+            tiles = cls._packTiles(Dither(dither)(img))
+            stage.bytes = len(tiles) * 2
+        return tiles
+
+
+    @classmethod
+    def _packTiles(cls, img):
+        """ Get the data for every tile in a 1-bit image. See
+            `extractTiles()`.
+        """
+        w, h = img.size
+
+        numpy = _numpy()
+        if numpy is not None:
+            # Unpack the whole image once, then rearrange it into rows of
+            # 16 pixels, one per tile: [tile column][tile row][x][y], with
+            # everything but x reversed.
+            stride = (w + 7) // 8
+            bits = numpy.unpackbits(numpy.frombuffer(img.tobytes(),
+                                                     dtype=numpy.uint8)
+                                    .reshape(h, stride), axis=1)[:, :w]
+            tiles = bits.reshape(h // 4, 4, w // 4, 4)[::-1, ::-1]
+            tiles = tiles.transpose(2, 0, 3, 1)[::-1]
+            packed = numpy.packbits(tiles.reshape(-1, 16) ^ 1, axis=1)
+            return packed.view('>u2').ravel().tolist()
+
+        rows = _rowBits(img.tobytes(), w, h)
+        return [int(''.join(rows[y][x] for x in range(c, c + 4)
+                            for y in range(r + 3, r - 1, -1)), 2) ^ 0xffff
+                for c in range(w - 4, -1, -4) for r in range(h - 4, -1, -4)]
+
+
+    @classmethod
+    def iterArrays(cls, filename, arrays, indexes=()):
+        """ Generate Arduino code from the data generated by
+            `createArrays()`, one line at a time.
+        """
+        suffix, bits = arrays[0]
+        return cls.iterCode(fixName(filename) + suffix, [bits], sizes=False)
+
+
+    @classmethod
+    def dedupArrays(cls, arrays, table=None):
+        """ Tiles are not frames; nothing is removed.
+        """
+        return arrays, [], 0
+
+
+    @classmethod
+    def compressArrays(cls, arrays, masked=False):
+        """ Tilesets are too small to benefit; nothing is compressed.
+        """
+        return arrays, 0, []
+
+
+    @classmethod
+    def sizeValues(cls, data):
+        """ Get the dimensions that start a tileset's data (there are
+            none).
+        """
+        return []
+
+
+    @classmethod
+    def arrayInfo(cls, data):
+        """ Get the dimensions and frame count of a tileset: each tile is
+            a 4x4 'frame'.
+        """
+        return 4, 4, len(data)
+
+
+    @classmethod
+    def frameData(cls, data):
+        """ Get the dimensions of a tileset and its tiles, each a 'frame'
+            of one value.
+        """
+        return 16, 16, [[tile] for tile in data]
+
+
+    @classmethod
+    def arrayUnits(cls, data):
+        """ Flatten a tileset's data into a single list of values (it
+            already is one).
+        """
+        return list(data)
+
+
+    @classmethod
+    def undoArray(cls, sizes, frames):
+        """ Convert a tileset's data, as parsed by `parseCode()`, back
+            into a (single) 16x16 image.
+        """
+        tiles = frames[0] if frames else sizes
+        img = Image.new('1', (16, 16), 255)
+        positions = [(c, r) for c in range(12, -1, -4)
+                     for r in range(12, -1, -4)]
+        for tile, pos in zip(tiles, positions):
+            img.paste(unpackColumns(struct.pack('>H', tile), (4, 4)), pos)
+        return [img]
+
+
+    @classmethod
+    def preview(cls, asset, screen=None):
+        """ Draw a tileset (or tile sheet) on an emulated GAMBY screen,
+            tile by tile, as blocks (see `Screen.drawBlock()`), laid out as
+            in the source image. See `Sprites.preview()`.
+        """
+        screen = Screen() if screen is None else screen
+        columns, rows = asset.width // 4, asset.height // 4
+        screen.clear()
+        for i, tile in enumerate(asset.frames):
+            screen.drawBlock(columns - 1 - i // rows, rows - 1 - i % rows,
+                             tile)
+        return [screen.image()]
+
+
+##############################################################################
+
+class TileAtlases(Tilesets):
+    """
+    Methods for generating Gamby tile atlases from image data. The source
+    files can be any multiple of 4 pixels wide and high; their 4x4 tiles are
+    collected into an array of unique tiles (by default, one shared by every
+    file), and each file becomes a map of indices into it. A map starts with
+    its width and height in tiles, followed by the index of each tile, in
+    the same order as a tileset's tiles (see `Tilesets.extractTiles()`).
+    """
+
+    _dedup = 'batch'
+
+    @classmethod
+    def openImage(cls, f):
+        """ Loads and validates an image.
+
+            @raise ConversionError: The image is not a size compatible with
+                conversion (a width or height that isn't a multiple of 4).
+            @param f: A filename or `Image.Image`
+            @rtype: `Image.Image`
+        """
+        img = Sprites.openImage(f)
+        if img.size[0] % 4 or img.size[1] % 4 or 0 in img.size:
+            raise ConversionError(
+                "Tile sheets must be multiples of 4px; %s is %s" % \
+                (getattr(img, 'filename', img), img.size))
+        return img
+
+
+    @classmethod
+    def createArrays(cls, img, mask=None, dither=None, grid=None):
+        """ Generate the tile data for a tile sheet: its width and height
+            (in tiles), followed by every tile. Tile sheets have no mask or
+            grid; `mask` and `grid` are ignored.
+        """
+        tiles = cls.extractTiles(img, dither)
+        return ([('', [img.size[0] // 4, img.size[1] // 4] + tiles)], 1,
+                len(tiles) * 2)
+
+
+    @classmethod
+    def frameData(cls, data):
+        """ Get the dimensions of a tile sheet (in pixels) and its tiles,
+            each a 'frame' of one value.
+        """
+        return data[0] * 4, data[1] * 4, [[tile] for tile in data[2:]]
+
+
+    @classmethod
+    def dedupArrays(cls, arrays, table=None):
+        """ Remove duplicate tiles from the data generated by
+            `createArrays()`, leaving only the map of tile indices. Without
+            a shared `FrameTable`, each sheet keeps its own unique tiles;
+            with one, the tiles go into the table, as 4x4 frames.
+
+            @return: A tuple containing the remaining `(suffix, tiles)`
+                pairs, a list of `(suffix, map)` pairs, and the number of
+                bytes saved.
+        """
+        result = []
+        indexes = []
+        saved = 0
+        for suffix, data in arrays:
+            dims, tiles = data[:2], data[2:]
+            tileTable = table if table is not None else FrameTable()
+            indices = []
+            for tile in tiles:
+                index, new = tileTable.add((4, 4), [tile])
+                indices.append(index)
+                if not new:
+                    saved += 2
+            if table is None:
+                result.append((suffix, [t[0] for t in
+                                        tileTable.groups.get((4, 4), [])]))
+            indices = list(dims) + indices
+            indexes.append((suffix, indices))
+            saved -= len(indices) * _indexType(indices)[1] // 8
+        return result, indexes, saved
+
+
+    @classmethod
+    def iterArrays(cls, filename, arrays, indexes=()):
+        """ Generate Arduino code from the data generated by
+            `dedupArrays()`, one line at a time: the sheet's unique tiles
+            (unless they are in a shared table), and its map.
+        """
+        name = fixName(filename)
+        code = [cls.iterCode(name + suffix, [tiles], sizes=False)
+                for suffix, tiles in arrays]
+        code.extend(cls.iterIndex(name + suffix + "_map", indices)
+                    for suffix, indices in indexes)
+        yield "// Converted from %s\n" % filename
+        for i, lines in enumerate(code):
+            if i > 0:
+                yield "\n"
+            for line in lines:
+                yield line
+
+
+    @classmethod
+    def iterTable(cls, arrays):
+        """ Generate Arduino code for the tiles in a `FrameTable`, one
+            line at a time. Tiles are never compressed.
+        """
+        yield "// Shared tiles\n"
+        for name, data in arrays:
+            for line in cls.iterCode(name, [[t[0] for t in data[2:]]],
+                                     sizes=False):
+                yield line
+
+
+    @classmethod
+    def iterEntries(cls, filename, arrays, indexes=()):
+        """ Generate bundle entries (see `writeBundle()`) from the data
+            generated by `dedupArrays()`, or the tiles in a `FrameTable`.
+            Each map becomes an entry one 'frame' wide.
+        """
+        name = fixName(filename) if filename is not None else ''
+        for suffix, tiles in arrays:
+            if tiles and isinstance(tiles[-1], list):
+                # From a shared table: dimensions, then single-tile frames.
+                tiles = [t[0] for t in tiles[2:]]
+            yield (name + suffix, 4, 4, len(tiles), cls._unitSize, 0, 'raw',
+                   packUnits(tiles, cls._unitSize))
+        for suffix, indices in indexes:
+            unitSize = _indexType(indices)[1]
+            yield (name + suffix + "_map", len(indices), 1, 1, unitSize, 0,
+                   'raw', packUnits(indices, unitSize))
+
+
+##############################################################################
+
+class Icons(Sprites):
+    """
+    """
+
+    _useMask = False
+
+    @classmethod
+    def openImage(cls, f):
+        """ Loads and validates an image.
+
+            @raise ConversionError: The image is not a size compatible with
+                conversion (height other than 8px).
+            @param f: A filename or `Image.Image`
+            @rtype: `Image.Image`
+        """
+        img = Sprites.openImage(f)
+        if img.size[1] != 8:
+            raise ConversionError("Icons must be 8px high; %s is %d" % \
+                (img.filename, img.size[1]))
+        return img
+
+
+
+    @classmethod
+    def sizeValues(cls, data):
+        """ Get the dimensions that start an icon's data, as they appear
+            in generated code (just the width).
+        """
+        return data[:1]
+
+
+    @classmethod
+    def undoArray(cls, sizes, frames):
+        """ Convert an icon's data, as parsed by `parseCode()`, into
+            images, one per frame.
+        """
+        return [cls.undo(frame, (sizes[0], 8)) for frame in frames]
+
+
+##############################################################################
+
+class Splashscreens(Icons):
+    """ Create 'splash screens,' large images split into multiple 8-pixel-high
+        icons, each row stored as a 'frame.'
+    """
+
+    _frameLabel = "Row"
+
+
+    @classmethod
+    def dedupArrays(cls, arrays, table=None):
+        """ Rows are not frames; nothing is removed.
+        """
+        return arrays, [], 0
+
+    @classmethod
+    def openImage(cls, f):
+        """ Perform basic validation of an image before conversion. Raises
+            a `ConversionError` if the validation fails; does nothing if
+            validation passes.
+        """
+        img = Sprites.openImage(f)
+        if img.size[1] % 8 != 0:
+            raise ConversionError(
+                "Icons must be a multiple of 8px high; %s is %d" % \
+                (img.filename, img.size[1]))
+        return img
+
+
+    @classmethod
+    def createArrays(cls, img, mask=None, dither=None, grid=None):
+        """ Generate the bitmap data for a splash screen, one 'frame' per
+            8-pixel row. Splash screens have no mask or grid; `mask` and
+            `grid` are ignored.
+        """
+        totalSize = 0
+        bits = list(img.size)
+
+        with profileStage('decode', img):
+            img.load()
+        with profileStage('pack', img) as stage:
+            # Each row is one 8-pixel LCD page: a byte per column.
+            rows = packColumns(Dither(dither)(img), bandHeight=8)
+            stage.bytes = sum(len(row) for row in rows)
+        for row in rows:
+            converted = unpackUnits(row)
+            bits.append(converted)
+            totalSize += len(converted)
+
+        return [('', bits)], len(rows), totalSize
+
+
+    @classmethod
+    def undoArray(cls, sizes, frames):
+        """ Convert a splash screen's data, as parsed by `parseCode()`,
+            back into a (single) image, one 8-pixel row at a time. Only the
+            width is stored; the height is 8 pixels per row.
+        """
+        w = sizes[0]
+        img = Image.new('1', (w, len(frames) * 8), 255)
+        for i, row in enumerate(frames):
+            img.paste(unpackColumns(packUnits(row), (w, 8)), (0, i * 8))
+        return [img]
+
+
+    @classmethod
+    def preview(cls, asset, screen=None):
+        """ Draw a splash screen on an emulated GAMBY screen, one row per
+            page (see `Screen.drawIcon()`). See `Sprites.preview()`.
+        """
+        screen = Screen() if screen is None else screen
+        screen.clear()
+        for page, row in enumerate(asset.frames):
+            screen.drawIcon(0, page, row, asset.width)
+        return [screen.image()]
+
+
+##############################################################################
+
+class Fonts(Tilesets):
+    """
+    Methods for generating GAMBY fonts. Each character is a 32-bit value,
+    the same as the CharEdit sketch exports. Counting from the most
+    significant bit (as the README does), bits 0-24 are a 5x5 bitmap (by
+    column, in the same order as any other image's; see `packColumns()`),
+    bits 25-27 are the character's vertical offset (how far it is drawn
+    below the top of the line, so descenders descend), and bits 28-31 are
+    its width.
+
+    The source can be a glyph sheet: an image of 6x8 pixel cells, one
+    character per cell, left to right and top to bottom, starting with the
+    space (character 32). A glyph is drawn in the top left of its cell;
+    the rightmost column of the cell is left blank. The width is the
+    distance to the rightmost black pixel, and the vertical offset is the
+    number of rows the glyph extends below the fifth row. Blank glyphs
+    (e.g. the space) are `_blankWidth` wide.
+
+    The source can also be a directory of glyph images, one per character,
+    each named with the character itself or its (decimal) code, e.g.
+    ``65.gif`` for 'A'; or a CharEdit ``characters.dat`` file, whose widths
+    and offsets are used as they are.
+
+    @cvar _cellSize: The width and height of a glyph sheet's cells.
+    @cvar _sheetColumns: The number of cells in each row of a glyph sheet
+        made from a directory of glyphs (or by `undoArray()`).
+    @cvar _firstCharacter: The code of the first character.
+    @cvar _blankWidth: The width of a blank glyph.
+    """
+
+    _dataType = "prog_uint32_t"
+    _unitSize = 32
+    _cellSize = (6, 8)
+    _sheetColumns = 16
+    _firstCharacter = 32
+    _blankWidth = 2
+
+    @classmethod
+    def openImage(cls, f):
+        """ Load and validate a glyph sheet, or make one from a directory
+            of glyph images (see `openDirectory()`). A CharEdit
+            ``characters.dat`` file is read with `readCharacters()`.
+
+            @raise ConversionError: The image is not a size compatible with
+                conversion (not a multiple of the cell size).
+            @param f: A filename, a directory name, or an `Image.Image`.
+            @return: The glyph sheet, or a list of character values.
+            @rtype: `Image.Image` or list
+        """
+        if isinstance(f, str):
+            if os.path.isdir(f):
+                return cls.openDirectory(f)
+            if os.path.splitext(f)[1].lower() == '.dat':
+                return cls.readCharacters(f)
+        img = Sprites.openImage(f)
+        cw, ch = cls._cellSize
+        if img.size[0] % cw or img.size[1] % ch or 0 in img.size:
+            raise ConversionError(
+                "Glyph sheets must be multiples of %dx%dpx; %s is %s" % \
+                (cw, ch, getattr(img, 'filename', img), img.size))
+        return img
+
+
+    @classmethod
+    def openDirectory(cls, path):
+        """ Make a glyph sheet from a directory of glyph images. Files
+            whose names aren't a character or a character code are
+            ignored; characters without a glyph are blank.
+
+            @raise ConversionError: There are no glyphs, a glyph is larger
+                than a cell, or a character comes before the first one.
+            @param path: The name of the directory.
+            @rtype: `Image.Image`
+        """
+        glyphs = {}
+        for filename in _sourceFiles(path):
+            name = os.path.splitext(os.path.basename(filename))[0]
+            if len(name) == 1:
+                code = ord(name)
+            elif name.isdigit():
+                code = int(name)
+            else:
+                continue
+            if code < cls._firstCharacter:
+                raise ConversionError("%s: character %d comes before %d" %
+                                      (filename, code, cls._firstCharacter))
+            glyphs[code] = filename
+        if not glyphs:
+            raise ConversionError("No glyph images in %s" % path)
+
+        cw, ch = cls._cellSize
+        columns = cls._sheetColumns
+        count = max(glyphs) - cls._firstCharacter + 1
+        sheet = Image.new('1', (columns * cw, -(-count // columns) * ch), 255)
+        for code, filename in glyphs.items():
+            glyph = Image.open(filename)
+            if glyph.size[0] > cw or glyph.size[1] > ch:
+                raise ConversionError(
+                    "Glyphs must be at most %dx%dpx; %s is %s" % \
+                    (cw, ch, filename, glyph.size))
+            i = code - cls._firstCharacter
+            sheet.paste(glyph.convert('1'),
+                        ((i % columns) * cw, (i // columns) * ch))
+        sheet.filename = path
+        return sheet
+
+
+    @classmethod
+    def readCharacters(cls, filename):
+        """ Read a CharEdit ``characters.dat`` file. Each character is 27
+            bytes: 25 pixels, by row (1 is black), then the width
+            (subtracted from 5, as CharEdit stores it) and the vertical
+            offset.
+
+            @param filename: The name of the file.
+            @return: A list of character values.
+        """
+        with open(filename, 'rb') as f:
+            data = bytearray(f.read())
+        values = []
+        for i in range(0, len(data) - 26, 27):
+            pixels = data[i:i + 25]
+            bits = ''.join('1' if pixels[y * 5 + x] else '0'
+                           for x in range(5) for y in range(4, -1, -1))
+            values.append(int(bits, 2) << 7 | (data[i + 26] & 7) << 4 |
+                          (5 - data[i + 25]) & 15)
+        return values
+
+
+    @classmethod
+    def writeCharacters(cls, values, out):
+        """ Write character values as a CharEdit ``characters.dat`` file
+            (see `readCharacters()`).
+
+            @param values: A list of character values.
+            @param out: The (binary) stream to which to write.
+        """
+        data = bytearray()
+        for value in values:
+            bits = bin(value >> 7 | 1 << 25)[3:]
+            data.extend(int(bits[x * 5 + 4 - y])
+                        for y in range(5) for x in range(5))
+            data.append((5 - (value & 15)) & 0xff)
+            data.append(value >> 4 & 7)
+        out.write(bytes(data))
+
+
+    @classmethod
+    def createArrays(cls, img, mask=None, dither=None, grid=None):
+        """ Generate the character values for a glyph sheet (or a list of
+            values read from a ``characters.dat`` file). Fonts have no
+            mask or grid (their cells are fixed); `mask` and `grid` are
+            ignored.
+        """
+        if isinstance(img, list):
+            values = img
+        else:
+            values = cls.extractGlyphs(img, dither)
+        return [('', values)], 1, len(values) * 4
+
+
+    @classmethod
+    def extractGlyphs(cls, img, dither=None):
+        """ Get the character value for every cell in a glyph sheet,
+            working out each glyph's width and vertical offset.
+
+            @raise ConversionError: A glyph is too wide (it uses the last
+                column of its cell) or too tall (over 5 rows).
+            @param img: The glyph sheet.
+            @type img: `Image.Image`
+            @param dither: One of the `DITHERS`, or `None` for the default.
+            @return: A list of character values.
+        """
+        with profileStage('decode', img):
+            img.load()
+        with profileStage('pack', img) as stage:
+            values = cls._packGlyphs(Dither(dither)(img))
+            stage.bytes = len(values) * 4
+        return values
+
+
+    @classmethod
+    def _glyphError(cls, img, index, problem):
+        """ Make the error for a glyph that doesn't fit in a character.
+        """
+        return ConversionError("Character %d in %s is too %s" %
+                               (cls._firstCharacter + index,
+                                getattr(img, 'filename', img), problem))
+
+
+    @classmethod
+    def _packGlyphs(cls, img):
+        """ Get the character values for a 1-bit glyph sheet. See
+            `extractGlyphs()`.
+        """
+        w, h = img.size
+        cw, ch = cls._cellSize
+
+        numpy = _numpy()
+        if numpy is not None:
+            # Every cell is measured at once: [cell][y][x], 1 for black.
+            stride = (w + 7) // 8
+            ink = numpy.unpackbits(numpy.frombuffer(img.tobytes(),
+                                                    dtype=numpy.uint8)
+                                   .reshape(h, stride), axis=1)[:, :w] ^ 1
+            cells = ink.reshape(h // ch, ch, w // cw, cw)
+            cells = cells.transpose(0, 2, 1, 3).reshape(-1, ch, cw)
+            rows = cells[:, :, :5].any(axis=2)
+            blank = ~rows.any(axis=1)
+            wide = numpy.flatnonzero(cells[:, :, 5:].any(axis=(1, 2)))
+            if len(wide):
+                raise cls._glyphError(img, wide[0], "wide")
+            last = ch - 1 - rows[:, ::-1].argmax(axis=1)
+            offsets = numpy.where(blank, 0, numpy.maximum(last - 4, 0))
+            tall = numpy.flatnonzero(rows.argmax(axis=1) < offsets)
+            if len(tall):
+                raise cls._glyphError(img, tall[0], "tall")
+            columns = cells[:, :, :5].any(axis=1)
+            widths = numpy.where(blank, cls._blankWidth,
+                                 5 - columns[:, ::-1].argmax(axis=1))
+            glyphs = cells[numpy.arange(len(cells))[:, None],
+                           offsets[:, None] + numpy.arange(5)][:, :, :5]
+            bits = glyphs[:, ::-1].transpose(0, 2, 1).reshape(-1, 25)
+            bitmaps = bits.astype(numpy.int64).dot(
+                1 << numpy.arange(24, -1, -1, dtype=numpy.int64))
+            return ((bitmaps << 7) | (offsets << 4) | widths).tolist()
+
+        rows = _rowBits(img.tobytes(), w, h)
+        values = []
+        for top in range(0, h, ch):
+            for left in range(0, w, cw):
+                cell = [row[left:left + cw] for row in rows[top:top + ch]]
+                if any('0' in row[5:] for row in cell):
+                    raise cls._glyphError(img, len(values), "wide")
+                inked = [y for y, row in enumerate(cell) if '0' in row[:5]]
+                if not inked:
+                    values.append(cls._blankWidth)
+                    continue
+                offset = max(0, inked[-1] - 4)
+                if inked[0] < offset:
+                    raise cls._glyphError(img, len(values), "tall")
+                width = max(row[:5].rfind('0') for row in cell) + 1
+                bits = ''.join(cell[y][x] for x in range(5)
+                               for y in range(offset + 4, offset - 1, -1))
+                values.append((int(bits, 2) ^ 0x1ffffff) << 7 |
+                              offset << 4 | width)
+        return values
+
+
+    @classmethod
+    def iterCharacters(cls, name, values, tab="    "):
+        """ Generate Arduino code for a font, one line (and character) at a
+            time, each with a comment naming the character.
+
+            @return: A generator yielding lines of code, each ending with
+                a newline.
+        """
+        yield "PROGMEM %s %s[] = {\n" % (cls._dataType, name)
+        for i, value in enumerate(values):
+            code = cls._firstCharacter + i
+            label = "(%d)" % code
+            if 32 < code < 127:
+                label = "'%s' %s" % (chr(code), label)
+            yield "%s0x%08x%s // %s\n" % (tab, value,
+                                         "," if i < len(values) - 1 else "",
+                                         label)
+        yield "};\n"
+
+
+    @classmethod
+    def iterArrays(cls, filename, arrays, indexes=()):
+        """ Generate Arduino code from the data generated by
+            `createArrays()`, one line at a time.
+        """
+        suffix, values = arrays[0]
+        yield "// Converted from %s\n" % filename
+        for line in cls.iterCharacters(fixName(filename) + suffix, values):
+            yield line
+
+
+    @classmethod
+    def arrayInfo(cls, data):
+        """ Get the dimensions and frame count of a font: each character
+            is a 5x5 'frame'.
+        """
+        return 5, 5, len(data)
+
+
+    @classmethod
+    def frameData(cls, data):
+        """ Get the dimensions of a glyph sheet's cells and the font's
+            characters, each a 'frame' of one value.
+        """
+        return cls._cellSize[0], cls._cellSize[1], [[v] for v in data]
+
+
+    @classmethod
+    def undoArray(cls, sizes, frames):
+        """ Convert a font's data, as parsed by `parseCode()`, back into a
+            (single) glyph sheet. Glyphs are drawn at their vertical
+            offsets; any part of a glyph offset past the bottom of its cell
+            is cut off.
+        """
+        values = frames[0] if frames else sizes
+        cw, ch = cls._cellSize
+        columns = cls._sheetColumns
+        img = Image.new('1', (columns * cw,
+                              max(1, -(-len(values) // columns)) * ch), 255)
+        for i, value in enumerate(values):
+            offset = value >> 4 & 7
+            glyph = unpackColumns(struct.pack('>I', value & ~0x7f), (5, 5))
+            img.paste(glyph.crop((0, 0, 5, min(5, ch - offset))),
+                      ((i % columns) * cw, (i // columns) * ch + offset))
+        return [img]
+
+
+    @classmethod
+    def preview(cls, asset, screen=None):
+        """ Draw a font's characters on an emulated GAMBY screen, one per
+            cell (16 rows of 8 fit on a screen), each at its vertical
+            offset. See `Sprites.preview()`.
+        """
+        screen = Screen() if screen is None else screen
+        cw, ch = cls._cellSize
+        columns = screen.WIDTH // cw
+        perScreen = columns * (screen.HEIGHT // ch)
+        values = [struct.unpack('<I', bytes(f))[0] for f in asset.frames]
+        result = []
+        for start in range(0, len(values), perScreen):
+            screen.clear()
+            for i, value in enumerate(values[start:start + perScreen]):
+                screen.drawSprite((i % columns) * cw,
+                                  (i // columns) * ch + (value >> 4 & 7),
+                                  struct.pack('>I', value & ~0x7f), (5, 5))
+            result.append(screen.image())
+        return result
+
 
-    
     @classmethod
-    def getAlpha(cls, img):
-        """ Retrieve an image's alpha.
-        
-            @param img: The image, presumably one with an alpha.
-            @type img: `Image.Image`
-            @return: A grayscale (mode "L") `Image.Image`
+    def unconvertFiles(cls, filenames, size=None, out=''):
+        """ Convert code back into images, as `Sprites.unconvertFiles()`
+            does. Each font is also written as a CharEdit
+            ``characters.dat`` file named after its array.
         """
-        # Get alpha for mask, using img converted to RGBA
-        alpha = Image.new('L', img.size)
-        alpha.putdata([x[-1] for x in img.convert("RGBA").getdata()])
-        return alpha
+        written = super(Fonts, cls).unconvertFiles(filenames, None, out)
+        for filename in filenames:
+            with open(filename, 'r') as f:
+                data = f.read()
+            for dataType, name, label, sizes, frames in parseCode(data):
+                if converterFor(dataType, label, sizes, name) is not Fonts:
+                    continue
+                path = os.path.join(out, name + ".dat")
+                with open(path, 'wb') as f:
+                    cls.writeCharacters(frames[0] if frames else sizes, f)
+                written.append(path)
+        if size is not None:
+            size[0] += len(written)
+        return written
+
+
+##############################################################################
+
+class Sheets(Sprites):
+    """
+    Methods for converting sprite sheets: images containing many sprites,
+    each converted as if it were an image of its own (the frames of an
+    animated sheet are the frames of every sprite). Each frame is decoded
+    once, and every sprite is packed straight from it; nothing is cropped.
+
+    Given a cell size (the ``--grid`` option, or the manifest's ``grid``
+    setting), the sheet is a grid of cells that size, numbered from left to
+    right and top to bottom; cells that are completely transparent in every
+    frame are skipped. Without one, a cell size at the end of the image's
+    name, e.g. ``hero_16x24.gif``, is used. Otherwise, the sprites are
+    found from the sheet's transparency (see `findSprites()`), and numbered
+    in the order they are found.
+
+    Each sprite's arrays are named after the sheet and the sprite's number,
+    e.g. ``hero_16x24_3`` and ``hero_16x24_3_mask``.
+
+    @cvar _gridPattern: The pattern that matches the cell size at the end
+        of a sheet's name.
+    """
 
+    _gridPattern = re.compile(r"[_.-](\d+)x(\d+)$")
 
     @classmethod
-    def createData(cls, img, ignoreSolid=True, sizes=True):
-        """ Turn an image into an array of bits, stored as a series of bytes.
-            The first two items are the image dimensions.
+    def gridSize(cls, filename):
+        """ Get a sprite sheet's cell size from its filename.
 
-            @param img: The image from which to generate the data
-            @type img: `Image.Image`
-            @param ignoreSolid: If `True`, bitmaps that are all black or
-                all white are ignored; `None` is returned.
-            @return: A list containing [<width>,<height>, [<frame1 bytes...>],
-                ..., [<frameN bytes...>]]
+            @return: A `(width, height)` tuple, or `None` if the name
+                doesn't end with a cell size.
         """
-        if img is None:
+        name = os.path.splitext(os.path.basename(filename or ''))[0]
+        m = cls._gridPattern.search(name)
+        if m is None:
             return None
-        if img.mode == '1':
-            data = img.getdata()
-        else:
-            data = img.convert('1').getdata()
-        if ignoreSolid:
-            s = sum(data)
-            if s == 0:
-                # Totally black, ignore
-                return None
-            if s == img.size[0] * img.size[1] * 255:
-                # Totally white, ignore
-                return None
-
-        result = []
-        if sizes:
-            # Make the data list. The first two elements are the dimension
-            result.extend(img.size)
-
-        i = 0
-        b = 0
-        for p in data:  
-            # bitmaps on LCD are 'inverse': 1 is black, 0 is not
-            b = (b << 1) + (0 if p else 1)
-            i += 1
-            if i == cls._unitSize:
-                result.append(b)
-                i = b = 0
-        return result
+        return int(m.group(1)), int(m.group(2))
 
 
     @classmethod
-    def undo(cls, d, imgSize=None):
-        """ Convert an array of bitmap data into an image.
-            Does not (currently) work on multi-frame bitmaps.
+    def parseGrid(cls, text):
+        """ Parse a cell size given as text, e.g. ``16x24``.
+
+            @raise ValueError: The text isn't a width and height, or either
+                is zero.
+            @return: A `(width, height)` tuple.
         """
-        if imgSize == None:
-            imgSize = d[0:2]
-            d = d[2:]
-        img = Image.new('1', imgSize, 255)
-        ar = []
-        for b in d:
-            for c in bin(b)[2:].rjust(cls._unitSize, '0'):
-                if c == '0':
-                    ar.append(255)
-                else:
-                    ar.append(0)
-        img.putdata(ar[:imgSize[0]*imgSize[1]])
-        return img.rotate(90)
+        m = re.match(r"(\d+)x(\d+)$", text.strip())
+        if m is None or 0 in (int(m.group(1)), int(m.group(2))):
+            raise ValueError("Bad grid size %r; expected WIDTHxHEIGHT" %
+                             text)
+        return int(m.group(1)), int(m.group(2))
 
 
     @classmethod
-    def writeCode(cls, name, data, digits=2, sizes=True, width=78, tab="    "):
-        """ Generate Arduino code from a single list of bitmap data.
+    def cacheSettings(cls, filename, grid=None):
+        """ Get the cell size used to slice a sprite sheet: the given one,
+            or the one in its filename. Byte-identical sheets sliced
+            differently are cached separately.
         """
-        if data == None:
-            return ''
-        lineWidth = width - tab.count(" ") + tab.count("\t") * 4
-        result = ["PROGMEM %s %s[] = {" % (cls._dataType, name)]
-        if sizes:
-            result.append("%s, %s," % (data[0], data[1]))
-        for i in xrange(len(data)-2):
-            result.append("// Frame %d" % (i))
-            result.extend(textwrap.wrap(", ".join(map(hex, data[i+2]))+",", 
-                                        lineWidth))
-        
-        return ('\n'+tab).join(result)[:-1]+"\n};\n"
+        grid = grid or cls.gridSize(filename)
+        return "%dx%d" % tuple(grid) if grid is not None else ""
 
 
     @classmethod
-    def convert(cls, f, mask=None, size=[0, 0]):
-        """ Turn an image into Arduino code for GAMBY. Any transparency
-            or alpha channel is turned into its own sprite.
+    def createArrays(cls, img, mask=None, dither=None, grid=None):
+        """ Generate the bitmap data for every sprite in a sheet, without
+            generating any code.
 
-            @param f: The image file or filename to convert
-            @param mask: If `True` (default), additional sprites are created
-                from the image's transparency information.
-            @param size: A two element list containing the total number of
-                converted images and the total number of bytes they consume.
-                This is modified 'in place'.
-            @param out: A stream to which to write the results.
+            @raise ConversionError: No sprites were found, or the sheet is
+                not a multiple of its cell size.
+            @param img: The sheet to convert.
+            @type img: `Image.Image`
+            @param mask: If `True` (default), each sprite gets a mask made
+                from the sheet's transparency information.
+            @param dither: One of the `DITHERS`, or `None` for the default.
+            @param grid: The cell size, as a `(width, height)` tuple. If
+                `None`, the cell size in the sheet's filename (if any) is
+                used; see `gridSize()`.
+            @return: A tuple containing a list of `(suffix, data)` pairs
+                (e.g. '_3' and '_3_mask' for sprite 3), the number of
+                sprites, and the total number of bytes they consume.
         """
         mask = cls._useMask if mask is None else mask
-        
-        img = cls.openImage(f)
-        filename = img.filename
-        
-        numFrames = cls.numFrames(img)
-        totalSize = 0
-        bits = list(img.size)
-        alphaBits = list(img.size)
-        
+        grid = grid or cls.gridSize(getattr(img, 'filename', None))
+        if grid is not None and (0 in grid or img.size[0] % grid[0] or
+                                 img.size[1] % grid[1]):
+            raise ConversionError(
+                "Sheets must be a multiple of their cell size; %s is %s, "
+                "not a multiple of %s" % (getattr(img, 'filename', img),
+                                          img.size, tuple(grid)))
+        toBitmap = Dither(dither)
+
+        # The sprites can't be found until every frame has been seen.
+        frames = []
+        alphas = []
         for frame in ImageSequence.Iterator(img):
-            # image rotated 90 degrees clockwise so bits in best order for LCD
-            # Currently doesn't matter in graphics mode, but bitmaps in text/block mode it helps)
-            frame = frame.rotate(-90)
-            alpha = cls.getAlpha(frame) if mask else None
-            
-            converted = cls.createData(frame, ignoreSolid=False, sizes=False)
-            bits.append(converted)
-            totalSize += len(converted)
-            
-            if mask:
-                convertedAlpha = cls.createData(alpha, ignoreSolid=False, 
-                                                sizes=False)
-                alphaBits.append(convertedAlpha)
-                totalSize += len(convertedAlpha)
+            with profileStage('decode', frame):
+                frame.load()
+                frames.append(toBitmap(frame))
+            with profileStage('mask', frame):
+                alphas.append(cls.getMask(frame))
 
-        if not bits:
-            # Nothing returned (empty list or possibly None)
-            raise ConversionError, "Could not convert %s (no data?)" % filename
+        opaque = cls._opaque(alphas)
+        if grid is None:
+            boxes = list(enumerate(cls.findSprites(opaque)))
+        else:
+            gw, gh = grid
+            columns = img.size[0] // gw
+            boxes = [(r * columns + c, (c * gw, r * gh, (c + 1) * gw,
+                                        (r + 1) * gh))
+                     for r in range(img.size[1] // gh)
+                     for c in range(columns)]
+            boxes = [(n, box) for n, box in boxes
+                     if cls._anyOpaque(opaque, box)]
+        if not boxes:
+            raise ConversionError("No sprites found in %s" %
+                                  getattr(img, 'filename', img))
 
-        name = fixName(filename)
-        result = ["// Converted from %s" % filename,]
-        result.append(cls.writeCode(name, bits))
+        regions = [box for n, box in boxes]
+        packed = []
+        for frame in frames:
+            with profileStage('pack', frame) as stage:
+                packed.append(packRegions(frame, regions, cls._unitSize))
+                stage.bytes = sum(len(p) for p in packed[-1])
+        packedMasks = []
         if mask:
-            result.append(cls.writeCode(name + "_mask", alphaBits))
+            for alpha in alphas:
+                with profileStage('mask', frames=0) as stage:
+                    packedMasks.append(packRegions(alpha, regions,
+                                                   cls._unitSize))
+                    stage.bytes = sum(len(p) for p in packedMasks[-1])
 
-        if size:
-            # Image count and total size (in bytes), modified 'in place'
-            size[0] += len(bits)
-            size[1] += totalSize
+        arrays = []
+        totalSize = 0
+        for i, (n, (x0, y0, x1, y1)) in enumerate(boxes):
+            for suffix, data in (('_%d' % n, packed),
+                                 ('_%d_mask' % n, packedMasks)):
+                if not data:
+                    continue
+                bits = [unpackUnits(p[i], cls._unitSize) for p in data]
+                arrays.append((suffix, [x1 - x0, y1 - y0] + bits))
+                totalSize += sum(len(b) for b in bits)
+        return arrays, len(boxes), totalSize
+
+
+    @classmethod
+    def _opaque(cls, alphas):
+        """ Combine the masks of every frame: the pixels that are opaque in
+            any of them.
 
-        return '\n'.join(result)
+            @param alphas: A list of 1-bit masks (see `getMask()`).
+            @return: A 2D NumPy array of booleans ([y][x]), or a list of
+                rows, each a list of booleans, if NumPy isn't available.
+        """
+        w, h = alphas[0].size
+        numpy = _numpy()
+        if numpy is not None:
+            stride = (w + 7) // 8
+            opaque = numpy.zeros((h, w), dtype=bool)
+            for alpha in alphas:
+                opaque |= numpy.unpackbits(
+                    numpy.frombuffer(alpha.tobytes(), dtype=numpy.uint8)
+                    .reshape(h, stride), axis=1)[:, :w].astype(bool)
+            return opaque
+        rows = [_rowBits(alpha.tobytes(), w, h) for alpha in alphas]
+        return [[any(r[y][x] == '1' for r in rows) for x in range(w)]
+                for y in range(h)]
 
 
     @classmethod
-    def convertFiles(cls, filenames, size=None, mask=None, out=sys.stdout):
+    def _anyOpaque(cls, opaque, box):
+        """ Determine whether any pixel in a box is opaque.
         """
+        x0, y0, x1, y1 = box
+        if isinstance(opaque, list):
+            return any(any(row[x0:x1]) for row in opaque[y0:y1])
+        return bool(opaque[y0:y1, x0:x1].any())
+
+
+    @classmethod
+    def findSprites(cls, opaque):
+        """ Find the sprites in a sheet from its transparency. The sheet is
+            split wherever a row of pixels is completely transparent, then
+            each piece is split wherever a column is, and so on, until no
+            piece can be split. Each sprite is the bounding box of a piece;
+            they are ordered from top to bottom, then left to right.
+
+            @param opaque: The sheet's opaque pixels, as returned by
+                `_opaque()`.
+            @return: A list of `(left, top, right, bottom)` tuples.
         """
-        if isinstance(out, basestring):
-            out = file(out, 'w')
-        for filename in filenames:
-            out.write(cls.convert(filename, mask=mask, size=size))
-            out.write('\n')
-        if out != sys.stdout:
-            out.close()
-         
+        if isinstance(opaque, list):
+            h, w = len(opaque), len(opaque[0]) if opaque else 0
+            def rows(x0, y0, x1, y1):
+                return [any(row[x0:x1]) for row in opaque[y0:y1]]
+            def columns(x0, y0, x1, y1):
+                return [any(row[x] for row in opaque[y0:y1])
+                        for x in range(x0, x1)]
+        else:
+            h, w = opaque.shape
+            def rows(x0, y0, x1, y1):
+                return opaque[y0:y1, x0:x1].any(axis=1).tolist()
+            def columns(x0, y0, x1, y1):
+                return opaque[y0:y1, x0:x1].any(axis=0).tolist()
+
+        boxes = []
+        def split(x0, y0, x1, y1):
+            spans = cls._spans(rows(x0, y0, x1, y1))
+            if len(spans) > 1:
+                for start, end in spans:
+                    split(x0, y0 + start, x1, y0 + end)
+                return
+            if not spans:
+                return
+            y0, y1 = y0 + spans[0][0], y0 + spans[0][1]
+            spans = cls._spans(columns(x0, y0, x1, y1))
+            if len(spans) > 1:
+                for start, end in spans:
+                    split(x0 + start, y0, x0 + end, y1)
+                return
+            boxes.append((x0 + spans[0][0], y0, x0 + spans[0][1], y1))
+
+        split(0, 0, w, h)
+        return boxes
+
 
     @classmethod
-    def unconvert(cls, data, size=None, out=None):
-        """ Convert Arduino code back into images.
+    def _spans(cls, values):
+        """ Find the runs of true values in a list.
+
+            @return: A list of `(start, end)` tuples.
         """
-        # TODO: Put alpha back into GIF?
-        # TODO: Remove comments?
         result = []
-        start, end = (data.find('prog_uchar'), data.find('}'))
-        # Why am I doing this? It was probably modified for a test, but what?
-        while start > -1 and start > -1:
-            name = data[start + 10:data.find('[]', start)].strip()
-            bytes = [b.strip(',') for b in data[data.find('{', start) + 1:end].split()]
-            bits = [int(bytes[0]), int(bytes[1])]
-            for b in bytes[2:]:
-                bits.append(int(b, 16))
-            result.append((name, cls.undo(bits)))
-            end += 1
-            start, end = (data.find('prog_uchar', end), data.find('}', end))
-
+        start = None
+        for i, v in enumerate(values):
+            if v and start is None:
+                start = i
+            elif not v and start is not None:
+                result.append((start, i))
+                start = None
+        if start is not None:
+            result.append((start, len(values)))
         return result
 
 
     @classmethod
-    def unconvertFiles(cls, filenames, size=None, out=''):
+    def preview(cls, asset, screen=None):
+        """ Draw every sprite from a sheet on an emulated GAMBY screen,
+            side by side in the order they are numbered, one screen per
+            frame. The sprites are taken from the asset's arrays, so it
+            must not have been deduplicated or compressed (see
+            `Asset.finish()`). See `Sprites.preview()`.
         """
-        """
-        images = []
-        for filename in filenames:
-            f = file(filename, 'r')
-            images.append(cls.unconvert(f.read()))
-            f.close()
-        # do the write here.
-        # XXX: Write this!
+        screen = Screen() if screen is None else screen
+        arrays = dict(asset.arrays)
+        sprites = []
+        x = y = rowHeight = 0
+        for suffix, data in asset.arrays:
+            if suffix.endswith('_mask'):
+                continue
+            w, h, frames = cls.frameData(data)
+            if x and x + w > screen.WIDTH:
+                x, y, rowHeight = 0, y + rowHeight + 1, 0
+            masks = arrays.get(suffix + '_mask')
+            if masks is not None:
+                masks = cls.frameData(masks)[2]
+            sprites.append((x, y, (w, h), frames, masks))
+            x += w + 1
+            rowHeight = max(rowHeight, h)
+
+        masked = any(s[4] is not None for s in sprites)
+        result = []
+        for n in range(max(len(s[3]) for s in sprites)):
+            screen.clear(Screen.CHECKERBOARD if masked else (0,))
+            for x, y, size, frames, masks in sprites:
+                mask = masks and packUnits(masks[n], cls._unitSize)
+                screen.drawSprite(x, y, packUnits(frames[n], cls._unitSize),
+                                  size, mask, cls._unitSize)
+            result.append(screen.image())
+        return result
 
 
 ##############################################################################
 
-class Tilesets(Sprites):
-    """
-    Methods for generating Gamby tilesets from image data. Tiles are 16-bit
-    integers representing a 4x4 pixel square; a tileset consists of 16 tiles.
-    The source file is expected to be a 16x16 image containing a 4x4 grid of
-    tiles.
+class Screen(object):
+    """ A headless emulation of the GAMBY's 96x64 pixel LCD, for seeing
+        how converted data will look without flashing it to the hardware,
+        e.g. to make contact sheets for visual regression checks (see
+        `Sprites.preview()`). Drawing methods take packed data as it is
+        stored in flash, such as the frames of an `Asset` or a `Bundle`.
+
+        The LCD's memory is 8 pages (rows 8 pixels high), each a byte per
+        column, with the top pixel in bit 0 and 1 for black. Here, the
+        whole screen is one number: the 8 page bytes of each column, from
+        left to right, so each column is 64 bits, top pixel first. Bitmap
+        data is decoded into the same form (see `decode()`), so drawing a
+        sprite anywhere, at any height, is a shift and a few bitwise
+        operations on the whole screen; no pixel or column is handled on
+        its own. Decoded data is kept, so drawing the same frame again
+        doesn't decode it again.
+
+        @cvar WIDTH: The width of the screen, in pixels.
+        @cvar HEIGHT: The height of the screen, in pixels.
+        @cvar CHECKERBOARD: A pattern for `clear()`: a 1-pixel checkerboard.
+        @ivar bits: The contents of the screen, as one number (see above).
     """
 
-    _useMask = False
-    _dataType = "prog_uint16_t"
-    _unitSize = 16
+    WIDTH = 96
+    HEIGHT = 64
+    CHECKERBOARD = (0x5555555555555555, 0xaaaaaaaaaaaaaaaa)
+    _allBits = (1 << (WIDTH * HEIGHT)) - 1
 
-    def openImage(cls, f):
-        """ Perform basic validation of an image before conversion. Raises
-            a `ConversionError` if the validation fails; does nothing if 
-            validation passes.
+    def __init__(self):
+        self.bits = 0
+        self._decoded = {}
+        self._repeats = {}
+
+
+    def _join(self, columns):
+        """ Put a list of column values (each at most `HEIGHT` bits)
+            together into one number, like `bits`.
         """
-        img = Sprites.openImage(f)
-        if img.size[0] != 16 or img.size[1] != 16:
-            raise ConversionError, "Tilesets must be 16x16; %s is %s" % \
-                (img.filename, img.size)
-        return img
-                
-
-    @classmethod
-    def convert(cls, f, mask=None, size=None):
-        img = cls.openImage(f)
-        filename = img.filename
-                
-        # image rotated 90 degrees clockwise so bits in best order for LCD
-        # (doesn't matter in graphics mode, but in text/block mode it helps)
-        img = img.rotate(-90)
-        img = img.convert('1')
-      
-        totalSize = 0
-        bits = []
-        for c in range(12, -1, -4):
-            for r in range(0, 16, 4):
-                tile = img.crop((r, c, r + 4, c + 4))
-                data = cls.createData(tile)
-                bits.append(data[2])
-            
-        name = fixName(filename)
+        return int.from_bytes(struct.pack('<%dQ' % len(columns), *columns),
+                              'little')
 
-        if not bits:
-            # Nothing returned (empty list or possibly None)
-            raise ConversionError, "Could not convert %s (no data?)" % filename
-        
-        if size:
-            # Image count and total size (in bytes), modified 'in place'
-            size[0] += 1
-            size[1] += len(bits) * 2
-         
-        return cls.writeCode(name, bits, digits=cls._unitSize, sizes=False)
+
+    def _repeat(self, width):
+        """ Get the number that repeats a column value across `width`
+            columns, when multiplied by it.
+        """
+        result = self._repeats.get(width)
+        if result is None:
+            result = self._repeats[width] = self._join([1] * width)
+        return result
 
 
-    @classmethod
-    def unconvert(*args, **kwargs):
-        raise NotImplementedError, "unconvert for Tilesets not yet implemented."
+    def clear(self, pattern=(0,)):
+        """ Fill the screen with a repeating pattern of columns (by
+            default, white).
+
+            @param pattern: A sequence of column values: numbers whose bits
+                are a column's pixels, from the top down.
+        """
+        self.bits = self._join([pattern[x % len(pattern)]
+                                for x in range(self.WIDTH)])
+
+
+    def decode(self, data, size, unitSize=8):
+        """ Turn packed data into a form that can be drawn, if it hasn't
+            been already. The image is split into bands no higher than the
+            screen (usually just one), each put together like `bits`.
+
+            @param data: The packed data, as stored in flash.
+            @param size: The size of the image.
+            @type size: A tuple containing the width and height.
+            @param unitSize: The number of bits per unit of data.
+            @return: A list of `(top, height, bits)` tuples, one per band.
+        """
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+        key = (data, tuple(size), unitSize)
+        result = self._decoded.get(key)
+        if result is None:
+            w, h = size
+            columns = _columnValues(data, size, unitSize)
+            result = []
+            for top in range(0, h, self.HEIGHT):
+                height = min(self.HEIGHT, h - top)
+                rows = (1 << height) - 1
+                result.append((top, height,
+                               self._join([c >> top & rows for c in columns])))
+            self._decoded[key] = result
+        return result
+
+
+    def drawSprite(self, x, y, data, size, mask=None, unitSize=8):
+        """ Draw one frame of a sprite, or of any other bitmap data in
+            column order (see `packColumns()`). Anything off the screen is
+            clipped.
+
+            @param x: The horizontal position of the sprite's left edge.
+            @param y: The vertical position of the sprite's top edge; it
+                does not need to be a multiple of 8.
+            @param data: The frame's packed data.
+            @param size: The size of the sprite.
+            @type size: A tuple containing the width and height.
+            @param mask: The packed data of the frame's mask, or `None`.
+                Pixels that are black in the mask (transparent in the
+                source image) are left as they are. Without a mask, the
+                whole of the sprite's rectangle is drawn.
+            @param unitSize: The number of bits per unit of data.
+        """
+        w, h = size
+        if x >= self.WIDTH or x + w <= 0:
+            return
+        bands = self.decode(data, size, unitSize)
+        masks = None if mask is None else self.decode(mask, size, unitSize)
+        for i, (top, height, value) in enumerate(bands):
+            bandY = y + top
+            first, last = max(0, -bandY), min(height, self.HEIGHT - bandY)
+            if first >= last:
+                continue
+            # Only the rows that end up on the screen are drawn, so nothing
+            # spills into the next column when it is shifted into place.
+            draw = ((1 << last) - (1 << first)) * self._repeat(w)
+            if masks is not None:
+                draw &= ~masks[i][2]
+            value &= draw
+            shift = x * self.HEIGHT + bandY
+            if shift < 0:
+                draw, value = draw >> -shift, value >> -shift
+            else:
+                draw, value = draw << shift, value << shift
+            self.bits = (self.bits & ~draw | value) & self._allBits
+
+
+    def drawIcon(self, x, page, data, width):
+        """ Draw one frame of an icon (or a row of a splash screen): 8
+            pixels high, written straight into a page.
+
+            @param x: The horizontal position of the icon's left edge.
+            @param page: The page (row of 8 pixels) in which to draw it.
+            @param data: The frame's packed data.
+            @param width: The width of the icon.
+        """
+        self.drawSprite(x, page * 8, data, (width, 8))
+
+
+    def drawBlock(self, column, row, data):
+        """ Draw a tile, as a 4x4 block: the screen is a grid of 24 by 16
+            blocks.
+
+            @param column: The block's column.
+            @param row: The block's row.
+            @param data: The tile's packed data (a 16-bit value, stored
+                little-endian).
+        """
+        self.drawSprite(column * 4, row * 4, data, (4, 4), unitSize=16)
+
+
+    def pages(self):
+        """ Get the contents of the screen as the LCD's memory holds it:
+            each page (from the top), a byte per column.
+
+            @rtype: bytes
+        """
+        data = self.bits.to_bytes(self.WIDTH * self.HEIGHT // 8, 'little')
+        return b''.join(data[page::self.HEIGHT // 8]
+                        for page in range(self.HEIGHT // 8))
+
+
+    def image(self):
+        """ Get the contents of the screen as an image.
+
+            @return: A 1-bit (mode "1") `Image.Image`
+        """
+        # Each column, as a big-endian number, is already in the order
+        # packColumns() uses: bottom pixel first, 1 for black.
+        fmt = '%dQ' % self.WIDTH
+        data = self.bits.to_bytes(self.WIDTH * self.HEIGHT // 8, 'little')
+        return unpackColumns(struct.pack('>' + fmt,
+                                         *struct.unpack('<' + fmt, data)),
+                             (self.WIDTH, self.HEIGHT))
+
+
+def contactSheet(images, columns=PREVIEW_COLUMNS, spacing=2, scale=1):
+    """ Arrange images (e.g. of `Screen` contents) in a grid, left to
+        right and top to bottom, with gray space between them, so they can
+        be checked at a glance or compared against previous results.
+
+        @param images: The images; they should all be the same size.
+        @param columns: The number of images in each row.
+        @param spacing: The space around each image, in pixels.
+        @param scale: How much to enlarge each image.
+        @return: A grayscale (mode "L") `Image.Image`
+    """
+    w = max(img.size[0] for img in images) * scale
+    h = max(img.size[1] for img in images) * scale
+    columns = min(columns, len(images))
+    rows = -(-len(images) // columns)
+    sheet = Image.new('L', (columns * (w + spacing) + spacing,
+                            rows * (h + spacing) + spacing), 128)
+    for i, img in enumerate(images):
+        if scale != 1:
+            img = img.resize((img.size[0] * scale, img.size[1] * scale),
+                             Image.NEAREST)
+        x = spacing + (i % columns) * (w + spacing)
+        y = spacing + (i // columns) * (h + spacing)
+        sheet.paste(img.convert('L'), (x, y))
+    return sheet
 
 
 ##############################################################################
 
-class Icons(Sprites):
+def _convertOne(task):
+    """ Convert one file's data, returning it with its own size counts.
+        This is a module-level function so that it can be used by a process
+        pool.
+
+        @param task: A tuple containing the converter class, the filename,
+            the mask setting, the `ConversionCache` (or `None`), the
+            dithering method, the sprite sheet cell size, and whether to
+            profile the conversion.
+        @return: A tuple containing the result of the converter's
+            `convertArrays()`, and the profile's `files` and `order` (or
+            `None`).
     """
+    cls, filename, mask, cache, dither, grid, profiling = task
+    if not profiling:
+        return cls.convertArrays(filename, mask, cache, dither,
+                                 grid=grid), None
+    with Profile() as profile:
+        result = cls.convertArrays(filename, mask, cache, dither, grid=grid)
+    return result, (profile.files, profile.order)
+
+
+class Watcher(object):
+    """ Keeps the code generated from a set of images up to date. The
+        files are polled for changes; only the ones that have changed are
+        converted again, and their sections of the output are replaced.
+        Generating the code from the unchanged files' data is cheap
+        compared to converting them, so the time it takes to update the
+        output depends on what changed rather than the number of files.
+
+        @ivar converter: The converter class (e.g. `Sprites`).
+        @ivar filenames: The names of the images to watch.
+        @ivar output: The name of the file to write.
+        @ivar records: A dictionary of each file's modification time, size,
+            SHA-1 digest, and conversion results (see `convertArrays()`),
+            keyed by filename.
+        @ivar sections: A dictionary of each file's generated code, keyed
+            by filename.
+        @ivar sizes: A dictionary of the number of bytes each file's code
+            consumes, keyed by filename.
+        @ivar size: The number of converted images and the total number of
+            bytes they consume, as of the last update.
     """
 
-    _useMask = False
-    
-    @classmethod
-    def openImage(cls, f):
-        """ Loads and validates an image. 
+    def __init__(self, converter, filenames, output, mask=None, cache=None,
+                 dedup=None, compress=None, err=sys.stderr, dither=None,
+                 grid=None):
+        """ Constructor. The arguments are the same as the corresponding
+            ones of `Sprites.convertFiles()`; `err` is the stream to which
+            progress and errors are written.
+        """
+        self.converter = converter
+        self.filenames = list(filenames)
+        self.output = output
+        self.mask = mask
+        self.cache = cache
+        self.dedup = dedup or converter._dedup
+        self.compress = compress
+        self.dither = dither
+        self.grid = grid
+        self.err = err
+        self.records = {}
+        self.sections = {}
+        self.sizes = {}
+        self.size = [0, 0]
 
-            @raise ConversionError: The image is not a size compatible with
-                conversion (height other than 8px).
-            @param f: A filename or `Image.Image`
-            @rtype: `Image.Image`
+
+    def changed(self):
+        """ Find the files that have changed since they were last
+            converted. A file whose modification time or size differs is
+            only considered changed if its contents differ, too.
+
+            @return: A list of filenames, in the order they were given.
         """
-        img = Sprites.openImage(f)
-        if img.size[1] != 8:
-            raise ConversionError, "Icons must be 8px high; %s is %d" % \
-                (img.filename, img.size[1])
-        return img
-                
-        
-    
-    @classmethod
-    def writeCode(cls, name, data, digits=2, sizes=True, width=78, tab="    "):
-        """ Generate Arduino code from a single list of bitmap data.
+        result = []
+        for filename in self.filenames:
+            try:
+                stat = _sourceStat(filename)
+            except OSError:
+                continue
+            record = self.records.get(filename)
+            if record is not None and record[:2] == stat:
+                continue
+            digest = _sourceDigest(filename)
+            if record is not None and record[2] == digest:
+                self.records[filename] = stat + record[2:]
+                continue
+            self.records[filename] = stat + (digest,
+                                             record[3] if record else None)
+            result.append(filename)
+        return result
+
+
+    def update(self):
+        """ Convert any files that have changed, and rewrite the output if
+            anything did. A file that fails to convert (e.g. because it is
+            only partially saved) is reported, and its previous code is
+            kept.
+
+            @return: The names of the files that were converted.
         """
-        if data == None:
-            return ''
-        lineWidth = width - tab.count(" ") + tab.count("\t") * 4
-        result = ["PROGMEM %s %s[] = {" % (cls._dataType, name)]
-        if sizes:
-            result.append("%s," % data[0])
-        for i in xrange(len(data)-2):
-            result.append("// Frame %d" % (i))
-            result.extend(textwrap.wrap(", ".join(map(hex, data[i+2]))+",", 
-                                        lineWidth))
-        
-        return ('\n'+tab).join(result)[:-1]+"\n};\n"
+        cls = self.converter
+        changed = []
+        for filename in self.changed():
+            try:
+                result = cls.convertArrays(filename, self.mask, self.cache,
+                                           self.dither, grid=self.grid)
+            except (ConversionError, IOError) as e:
+                self.err.write("%s: %s\n" % (filename, e))
+                continue
+            self.records[filename] = self.records[filename][:3] + (result,)
+            changed.append(filename)
+        if not changed:
+            return changed
 
-    @classmethod
-    def unconvert(*args, **kwargs):
-        raise NotImplementedError, "unconvert for Icons not yet implemented."
+        # With a shared table, every file's indices may change.
+        table = FrameTable.forOutput(self.output) \
+            if self.dedup == 'batch' else None
+        self.size = [0, 0]
+        for filename in self.filenames:
+            record = self.records.get(filename)
+            if record is None or record[3] is None:
+                continue
+            name, arrays, count, totalSize = record[3]
+            if table is not None or filename in changed or \
+                    filename not in self.sections:
+                arrays, indexes, totalSize = cls.finishArrays(
+                    name, arrays, totalSize, self.dedup, table,
+                    self.compress)
+                self.sections[filename] = \
+                    ''.join(cls.iterArrays(name, arrays, indexes)) + '\n'
+            else:
+                totalSize = self.sizes[filename]
+            self.sizes[filename] = totalSize
+            self.size[0] += count
+            self.size[1] += totalSize
+        tableCode = ''
+        if table is not None and table.groups:
+            arrays, saved = cls.finishTable(table, self.compress)
+            self.size[1] -= saved
+            tableCode = ''.join(cls.iterTable(arrays)) + '\n'
+        self.write(tableCode)
+        if self.cache is not None:
+            self.cache.evict()
+        return changed
+
+
+    def write(self, tableCode=''):
+        """ Write the output file from the sections. The file is replaced
+            in one step, so anything reading it never sees it half-written.
+        """
+        path = os.path.dirname(os.path.abspath(self.output))
+        fd, tmp = tempfile.mkstemp(dir=path)
+        try:
+            f = os.fdopen(fd, 'w')
+            try:
+                f.writelines(self.sections[filename]
+                             for filename in self.filenames
+                             if filename in self.sections)
+                f.write(tableCode)
+            finally:
+                f.close()
+            if os.path.exists(self.output):
+                os.remove(self.output)
+            os.rename(tmp, self.output)
+        except:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+
+    def run(self, interval=0.5):
+        """ Poll for changes until interrupted (e.g. by Ctrl-C).
+
+            @param interval: The time between polls, in seconds.
+        """
+        while True:
+            changed = self.update()
+            if changed:
+                self.err.write("Updated %s (%s): %d images, %d bytes\n" %
+                               (self.output, ", ".join(changed),
+                                self.size[0], self.size[1]))
+            time.sleep(interval)
 
 
 ##############################################################################
 
-class Splashscreens(Icons):
-    """ Create 'splash screens,' large images split into multiple 8-pixel-high 
-        icons, each row stored as a 'frame.' 
+MODES = {
+         'sprite': Sprites,
+         'icon': Icons,
+         'splash': Splashscreens,
+         'tileset': Tilesets,
+         'atlas': TileAtlases,
+         'font': Fonts,
+         'sheet': Sheets,
+}
+
+
+class Manifest(object):
+    """ A set of outputs to build, each from its own source images, with
+        its own mode and settings, read from a JSON or INI file. Building
+        them all in one process avoids starting Python (and loading PIL)
+        for each one, and outputs whose inputs haven't changed since the
+        last build are skipped.
+
+        In JSON, the file contains an object, keyed by output filename, of
+        objects containing the settings. In INI, each section is named
+        after an output, and its sources are separated by whitespace::
+
+            {"sprites.h": {"mode": "sprite", "sources": ["sprites/*.gif"],
+                           "dedup": "batch"},
+             "title.h": {"mode": "splash", "sources": ["title.gif"]}}
+
+            [sprites.h]
+            mode = sprite
+            sources = sprites/*.gif
+            dedup = batch
+
+        The settings are 'mode' and 'sources' (required; sources can be
+        wildcards), plus 'mask', 'format', 'dedup', 'compress', 'dither'
+        and 'grid' (a sprite sheet's cell size, e.g. "16x24"), which work
+        like the command line options. Paths are relative to the manifest.
+        The state of the last build is kept in a file next to it, named
+        after it plus '.state' (e.g. 'build.json.state').
+
+        @ivar filename: The name of the manifest file.
+        @ivar targets: A list of `(output, settings)` tuples, in the order
+            they appear in the file (for JSON, sorted by output).
     """
 
-    @classmethod
-    def openImage(cls, f):
-        """ Perform basic validation of an image before conversion. Raises
-            a `ConversionError` if the validation fails; does nothing if 
-            validation passes.
+    SETTINGS = ('mode', 'sources', 'mask', 'format', 'dedup', 'compress',
+                'dither', 'grid')
+
+    def __init__(self, filename):
+        """ Constructor.
+
+            @raise ValueError: The manifest is not valid.
+            @param filename: The name of the manifest file (JSON if it
+                ends with '.json', INI otherwise).
         """
-        img = Sprites.openImage(f)
-        if img.size[1] % 8 != 0:
-            raise ConversionError, \
-                "Icons must be a multiple of 8px high; %s is %d" % \
-                (img.filename, img.size[1])
-        return img
+        self.filename = filename
+        self.root = os.path.dirname(filename)
+        self.statePath = filename + ".state"
+        if filename.lower().endswith('.json'):
+            f = open(filename, 'r')
+            try:
+                targets = sorted(json.load(f).items())
+            finally:
+                f.close()
+        else:
+            config = configparser.RawConfigParser()
+            if not config.read(filename):
+                raise IOError("Could not read manifest %s" % filename)
+            targets = []
+            for section in config.sections():
+                settings = dict(config.items(section))
+                settings['sources'] = settings.get('sources', '').split()
+                if 'mask' in settings:
+                    settings['mask'] = config.getboolean(section, 'mask')
+                targets.append((section, settings))
+        self.targets = []
+        for output, settings in targets:
+            for key in settings:
+                if key not in self.SETTINGS:
+                    raise ValueError("%s: unknown setting %r" % (output, key))
+            if settings.get('mode') not in MODES:
+                raise ValueError("%s: unknown mode %r" %
+                                 (output, settings.get('mode')))
+            if settings.get('format', 'code') not in OUTPUT_FORMATS:
+                raise ValueError("%s: unknown format %r" %
+                                 (output, settings['format']))
+            if settings.get('dither', 'diffusion') not in DITHERS:
+                raise ValueError("%s: unknown dithering method %r" %
+                                 (output, settings['dither']))
+            if 'grid' in settings:
+                if settings['mode'] != 'sheet':
+                    raise ValueError("%s: only sheets have a grid" % output)
+                try:
+                    Sheets.parseGrid(settings['grid'])
+                except (ValueError, AttributeError):
+                    raise ValueError("%s: bad grid %r" %
+                                     (output, settings['grid']))
+            if not settings.get('sources'):
+                raise ValueError("%s: no sources" % output)
+            self.targets.append((output, settings))
 
 
-    @classmethod
-    def convert(cls, f, mask=None, size=[0, 0]):
-        """ Turn an image into Arduino code for GAMBY. Any transparency
-            or alpha channel is turned into its own sprite.
+    def path(self, filename):
+        """ Get the path of a file named in the manifest.
+        """
+        return os.path.join(self.root, filename)
 
-            @param f: The image file or filename to convert
-            @param mask: If `True` (default), additional sprites are created
-                from the image's transparency information.
-            @param size: A two element list containing the total number of
-                converted images and the total number of bytes they consume.
-                This is modified 'in place'.
-            @param out: A stream to which to write the results.
+
+    def outputs(self, output, settings):
+        """ Get the paths of the files written for an output: the output
+            itself and, in the 'incbin' format, the C header next to it.
         """
-        img = cls.openImage(f)
-        filename = img.filename
-        
-        numFrames = cls.numFrames(img)
-        totalSize = 0
-        bits = list(img.size)
-        
-        img = img.rotate(-90)
-        for r in xrange(img.size[0]-8, -1, -8):
-            thisRow = img.crop((r, 0, r + 8, img.size[1]))
-            converted = cls.createData(thisRow, ignoreSolid=False, sizes=False)
-            bits.append(converted)
-            totalSize += len(converted)
-            
-        if not bits:
-            # Nothing returned (empty list or possibly None)
-            raise ConversionError, "Could not convert %s (no data?)" % filename
+        path = self.path(output)
+        if settings.get('format') == 'incbin':
+            return [path, os.path.splitext(path)[0] + ".h"]
+        return [path]
 
-        name = fixName(filename)
-        result = ["// Converted from %s" % filename,]
-        result.append(cls.writeCode(name, bits))
 
-        if size:
-            # Image count and total size (in bytes), modified 'in place'
-            size[0] += len(bits)
-            size[1] += totalSize
+    def sources(self, settings):
+        """ Get the source files for an output, expanding wildcards. The
+            files matched by each wildcard are sorted.
+
+            @raise ConversionError: A source with no wildcards doesn't
+                exist.
+        """
+        result = []
+        for pattern in settings['sources']:
+            path = self.path(pattern)
+            if glob.has_magic(path):
+                result.extend(sorted(glob.glob(path)))
+            elif not os.path.exists(path):
+                raise ConversionError("%s does not exist" % path)
+            else:
+                result.append(path)
+        return result
+
 
-        return '\n'.join(result).replace("// Frame ", "// Row ")
+    def loadState(self):
+        """ Read the state of the last build, if there was one.
+
+            @return: A dictionary of each output's state, keyed by output.
+        """
+        try:
+            f = open(self.statePath, 'r')
+            try:
+                return json.load(f)
+            finally:
+                f.close()
+        except (IOError, ValueError):
+            return {}
+
+
+    def saveState(self, state):
+        """ Write the state of the build.
+        """
+        f = open(self.statePath, 'w')
+        try:
+            json.dump(state, f, indent=1, sort_keys=True)
+        finally:
+            f.close()
 
 
     @classmethod
-    def unconvert(*args, **kwargs):
-        raise NotImplementedError, \
-            "unconvert for Splashscreens not yet implemented."
+    def fileState(cls, filename, previous=None):
+        """ Get the state of a source file: its modification time, size,
+            and SHA-1 digest. The file is only read if its modification
+            time or size differ from its previous state.
+
+            @param previous: The file's state in the last build, or `None`.
+            @return: A list containing the modification time, size and
+                digest.
+        """
+        stat = list(_sourceStat(filename))
+        if previous and previous[:2] == stat:
+            return previous
+        return stat + [_sourceDigest(filename)]
+
+
+    def build(self, force=False, jobs=1, cache=None, err=sys.stderr):
+        """ Build every output whose sources or settings have changed
+            since the last build, or any of whose files (see `outputs()`)
+            is missing or older than its sources.
+
+            @param force: If `True`, build everything.
+            @param jobs: The number of processes to use for conversion.
+            @param cache: A `ConversionCache`, or `None`.
+            @param err: The stream to which progress is written.
+            @return: A two element list containing the total number of
+                converted images and the total number of bytes they
+                consume, for all the outputs (built or not).
+        """
+        previous = self.loadState()
+        state = {}
+        total = [0, 0]
+        try:
+            for output, settings in self.targets:
+                sources = self.sources(settings)
+                old = previous.get(output, {})
+                oldFiles = old.get('sources', {})
+                files = dict((f, self.fileState(f, oldFiles.get(f)))
+                             for f in sources)
+                config = dict(settings, version=__version__,
+                              sources=sources)
+                outputs = self.outputs(output, settings)
+                newest = max([files[f][0] for f in sources] or [0])
+                upToDate = (not force
+                            and all(os.path.exists(p) and
+                                    os.path.getmtime(p) >= newest
+                                    for p in outputs)
+                            and old.get('settings') == config
+                            and [oldFiles.get(f, [None])[-1:] for f in sources]
+                                == [files[f][-1:] for f in sources])
+                if upToDate:
+                    size = old['size']
+                    err.write("%s is up to date\n" % output)
+                else:
+                    size = [0, 0]
+                    cls = MODES[settings['mode']]
+                    grid = settings.get('grid')
+                    cls.convertFiles(sources, size=size,
+                        mask=settings.get('mask'), out=self.path(output),
+                        jobs=jobs, cache=cache,
+                        format=settings.get('format', 'code'),
+                        dedup=settings.get('dedup'),
+                        compress=settings.get('compress'),
+                        dither=settings.get('dither'),
+                        grid=grid and Sheets.parseGrid(grid))
+                    err.write("Built %s: %d images, %d bytes\n" %
+                              (output, size[0], size[1]))
+                state[output] = {'settings': config, 'sources': files,
+                                 'size': size}
+                total[0] += size[0]
+                total[1] += size[1]
+        finally:
+            # Whatever was built is recorded, even if a later output fails.
+            for output, s in previous.items():
+                state.setdefault(output, s)
+            self.saveState(state)
+        return total
 
 
 ##############################################################################
@@ -543,30 +4267,79 @@ if __name__ == '__main__':
     # { <mode name>: (<converter method>, <unconverter method>), ... }
     # <converter> and <unconverter> are functions/methods for generating data from
     # from images and regenerating images from data, respectively. If one is None,
-    # the process is one-way. 
-    modes = {
-             'sprite': Sprites,
-             'icon': Icons,
-             'splash': Splashscreens,
-             'tileset': Tilesets,
-    }
+    # the process is one-way.
+    modes = MODES
 
     parser = argparse.ArgumentParser(description="GAMBY Graphics Tool.\n"\
         "Converts images into GAMBY data. For best results, images should be" \
         "1-bit (black and white); GIF or PNG8 are recommended.")
-    parser.add_argument("mode",
-        help="The name of the mode.", choices=modes.keys())
-    parser.add_argument("--output", "-o", 
-        help="The output filename. Defaults to stdout.")
+    parser.add_argument("mode", nargs="?",
+        help="The name of the mode.", choices=sorted(modes.keys()))
+    parser.add_argument("--output", "-o",
+        help="The output filename. Defaults to stdout. With --undo, the " \
+            "directory in which to write the images.")
 #    parser.add_argument("--crop", "-c", action="store_true",
 #        help="Crop an Icon or Splashscreen's vertical size to a multiple of " \
 #            "8 (or just 8 for Icons).")
 #    parser.add_argument("--fill", "-f", type=int,
 #        help="Fill an Icon or Splashscreen's vertical size to the next " \
 #            "multiple of 8, using the specified value (0 or 1).")
+    parser.add_argument("--format", default="code",
+        choices=sorted(OUTPUT_FORMATS.keys()),
+        help="The output format. 'binary' and 'incbin' require --output. " \
+            "Defaults to 'code'.")
+    parser.add_argument("--dedup", choices=["sprite", "batch"],
+        help="Remove duplicate frames, replacing them with arrays of frame " \
+            "indices: within each image ('sprite'), or across all images " \
+            "('batch'), which then share arrays of unique frames. The " \
+            "'atlas' mode always removes duplicate tiles, by default " \
+            "across all images.")
+    parser.add_argument("--compress", choices=["auto", "masked"],
+        help="Compress each array with whichever encoding makes it " \
+            "smallest. 'masked' also clears pixels hidden by a sprite's " \
+            "mask first, which only works if it is drawn with the mask.")
+    parser.add_argument("--dither", choices=sorted(DITHERS.keys()),
+        help="How to convert images that aren't black and white: " \
+            "'threshold' (no dithering), 'bayer' (ordered dithering), " \
+            "'diffusion' (error diffusion) or 'stable' (error diffusion " \
+            "that leaves unchanged parts of animations alone, so they " \
+            "don't flicker). Defaults to 'diffusion'.")
+    parser.add_argument("--grid", type=Sheets.parseGrid, metavar="WxH",
+        help="In sheet mode, the size of each cell of the sheet, e.g. " \
+            "'16x24'. Defaults to the size at the end of the sheet's name " \
+            "(e.g. 'hero_16x24.gif'), if any; otherwise, sprites are " \
+            "found from the sheet's transparency.")
+    parser.add_argument("--watch", "-w", action="store_true",
+        help="After converting, keep watching the source files, updating "\
+            "the output whenever they change (until interrupted).")
+    parser.add_argument("--profile", "-p", action="store_true",
+        help="Report the time spent in each stage of conversion, and how " \
+            "much was processed, for each file and in total.")
+    parser.add_argument("--profile-format", choices=["text", "json"],
+        default="text", help="The format of the --profile report. " \
+            "Defaults to 'text'.")
+    parser.add_argument("--jobs", "-j", type=int, default=1,
+        help="The number of files to convert in parallel. Defaults to 1.")
+    parser.add_argument("--cache-dir",
+        help="A directory in which to cache converted data, so unchanged " \
+            "images are not converted again.")
+    parser.add_argument("--manifest", "-m",
+        help="Build the outputs listed in a manifest (JSON or INI), each " \
+            "with its own mode, sources and settings, skipping any whose " \
+            "sources haven't changed. No mode or sources are given.")
+    parser.add_argument("--force", action="store_true",
+        help="With --manifest, build every output, changed or not.")
+    parser.add_argument("--preview", action="store_true",
+        help="Instead of generating code, draw the converted data on an " \
+            "emulated GAMBY screen, and write the screens to --output: " \
+            "a contact sheet (e.g. PNG), or an animated GIF if the name " \
+            "ends with '.gif'.")
+    parser.add_argument("--preview-scale", type=int, default=1,
+        help="With --preview, how much to enlarge each screen. Defaults " \
+            "to 1.")
     parser.add_argument("--undo", "-u", action="store_true",
-        help="Convert code back into an image. Not implemented for all " \
-            "formats.")
+        help="Convert code back into images (GIFs, named after the arrays). " \
+            "Every array is converted, regardless of mode.")
 #    parser.add_argument("--nomask", "-n", action="store_true", default=False,
 #        help="Do not generate a 'mask' Sprite from the image's transparency " \
 #            "(Sprites only).")
@@ -576,32 +4349,78 @@ if __name__ == '__main__':
     err = sys.stderr
 
     # Process universally-applicable parameters
-    out = file.open(args.output,"wb") if args.output else sys.stdout
-   
+    if args.format != 'code' and not args.output:
+        parser.error("--format %s requires --output" % args.format)
+    if args.manifest:
+        if args.mode or args.source or args.undo or args.watch:
+            parser.error("--manifest takes no mode or sources")
+    elif not args.mode:
+        parser.error("a mode is required")
+    if args.watch and (args.undo or args.format != 'code' or
+                       not args.output):
+        parser.error("--watch requires --output, and only generates code")
+    if args.manifest and args.output:
+        parser.error("--manifest outputs are named in the manifest")
+    if args.preview and (args.manifest or args.undo or args.watch or
+                         not args.output):
+        parser.error("--preview requires --output, and can't be used with " \
+                     "--manifest, --undo or --watch")
+    if args.output and not (args.undo or args.watch or args.preview):
+        # Opened by convertFiles(), as text or binary depending on format.
+        out = args.output
+    else:
+        out = sys.stdout
+    cache = ConversionCache(args.cache_dir) if args.cache_dir else None
+
     # List to keep track of number of converted items and total size in bytes
     # This gets passed to conversion methods and is changed 'in place'.
     size = [0, 0]
+    report = []
+
+    profile = Profile().start() if args.profile else None
 
     # Do the conversion!
-    if args.undo:
+    if args.manifest:
+        size = Manifest(args.manifest).build(force=args.force,
+                                             jobs=args.jobs, cache=cache,
+                                             err=err)
+    elif args.undo:
+        modes[args.mode].unconvertFiles(args.source, out=args.output or '')
+    elif args.preview:
+        modes[args.mode].previewFiles(args.source, args.output, cache=cache,
+                                      dither=args.dither,
+                                      scale=args.preview_scale,
+                                      grid=args.grid)
+    elif args.watch:
+        watcher = Watcher(modes[args.mode], args.source, args.output,
+                          cache=cache, dedup=args.dedup,
+                          compress=args.compress, err=err,
+                          dither=args.dither, grid=args.grid)
         try:
-            modes[args.mode].unconvertFiles(args.source, out=out)
-        except NotImplementedError:
-            err.write("Error: undo not implemented for mode '%s'\n" % args.mode)
+            watcher.run()
+        except KeyboardInterrupt:
+            pass
+        size = watcher.size
     else:
-        modes[args.mode].convertFiles(args.source, size=size, out=out)
+        modes[args.mode].convertFiles(args.source, size=size, out=out,
+                                      jobs=args.jobs, cache=cache,
+                                      format=args.format, dedup=args.dedup,
+                                      compress=args.compress, report=report,
+                                      dither=args.dither, grid=args.grid)
+
+    if profile is not None:
+        profile.stop()
+        profile.report(err, args.profile_format)
+
+    for name, encoding, rawSize, compressed in report:
+        err.write("%s: %s, %d -> %d bytes\n" % (name, encoding, rawSize,
+                                                 compressed))
 
 
     # Give warning if too much data generated.
-    for memory, name in SIZE_LIMITS:
-        if size[1] > memory:
-            err.write("Warning: Generated data is %s bytes; %s is %s bytes\n" \
-                      % (size[1], name, memory))
-        break
+    checkSize(size[1], err)
 
 
     # shut things down.
-    if out != sys.stdout:
-        out.close()
     if err != sys.stderr:
         err.close()
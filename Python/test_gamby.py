@@ -0,0 +1,1316 @@
+#!/usr/bin/env python3
+
+"""
+GAMBY Graphics Tool Tests
+~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Part of the GAMBY toolset: https://github.com/logicalzero/gamby.tools
+
+Checks the converted data of small, hand-made images against known bytes,
+converts it back into images, and checks that the NumPy and pure-Python
+versions of the packing functions produce the same data. Run with
+`python -m unittest test_gamby` (or pytest) from this directory.
+"""
+
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+
+from io import BytesIO, StringIO
+
+import gamby
+from gamby import Image
+
+
+def randomImage(width, height, seed=0):
+    """ Make a 1-bit image of random black and white pixels. The same
+        arguments always produce the same image.
+    """
+    rand = random.Random(seed)
+    img = Image.new('1', (width, height), 255)
+    img.putdata([rand.choice((0, 255)) for i in range(width * height)])
+    return img
+
+
+def pixels(img):
+    """ Get a 1-bit image's pixels (0 or 255), row by row.
+    """
+    w, h = img.size
+    return [img.getpixel((x, y)) for y in range(h) for x in range(w)]
+
+
+def animation(frames):
+    """ Make an animated GIF from a list of images, and open it. (GIFs
+        merge identical consecutive frames; avoid them.)
+    """
+    out = BytesIO()
+    frames[0].save(out, 'GIF', save_all=True, append_images=frames[1:])
+    return Image.open(BytesIO(out.getvalue()))
+
+
+class withoutNumpy(object):
+    """ Context manager that makes `gamby` use its pure-Python code, as if
+        NumPy weren't installed.
+    """
+
+    def __enter__(self):
+        self.numpy = gamby._numpy()
+        gamby.numpy = None
+        return self
+
+
+    def __exit__(self, excType, excValue, tb):
+        gamby.numpy = self.numpy
+
+##############################################################################
+
+class KnownDataTest(unittest.TestCase):
+    """ Converted data checked against bytes worked out by hand: column
+        by column, each column from the bottom up, 1 for black.
+    """
+
+    def testSprite(self):
+        # A black diagonal, from the top left.
+        img = Image.new('1', (8, 8), 255)
+        for i in range(8):
+            img.putpixel((i, i), 0)
+        asset = gamby.Sprites.convertAsset(img, mask=False, name="diagonal")
+        self.assertEqual(asset.arrays,
+                         [('', [8, 8, [1, 2, 4, 8, 16, 32, 64, 128]])])
+        self.assertEqual(asset.count, 1)
+        self.assertEqual(asset.name, "diagonal")
+
+
+    def testTileset(self):
+        # The bottom right tile is black, plus the top left pixel.
+        img = Image.new('1', (16, 16), 255)
+        img.paste(0, (12, 12, 16, 16))
+        img.putpixel((0, 0), 0)
+        asset = gamby.Tilesets.convertAsset(img)
+        self.assertEqual(asset.arrays,
+                         [('', [0xffff] + [0] * 14 + [0x1000])])
+
+
+    def testSplashscreen(self):
+        # The top left and bottom right pixels: the lowest bit of the first
+        # row's first byte, and the highest bit of the last row's last.
+        img = Image.new('1', (96, 64), 255)
+        img.putpixel((0, 0), 0)
+        img.putpixel((95, 63), 0)
+        asset = gamby.Splashscreens.convertAsset(img)
+        rows = [[0] * 96 for i in range(8)]
+        rows[0][0] = 0x01
+        rows[7][95] = 0x80
+        self.assertEqual(asset.arrays, [('', [96, 64] + rows)])
+        self.assertEqual(asset.count, 8)
+
+
+    def testRoundTrip(self):
+        # Converting code back into images gives the original image. (The
+        # sprite's pixel count is a multiple of 8, so none are dropped.)
+        for cls, size in [(gamby.Sprites, (12, 10)),
+                          (gamby.Tilesets, (16, 16)),
+                          (gamby.Splashscreens, (96, 64))]:
+            img = randomImage(*size)
+            code = cls.convertAsset(img, mask=False, name="test").code()
+            (name, images), = gamby.Sprites.unconvert(code)
+            self.assertEqual(name, "test")
+            self.assertEqual(pixels(images[0].convert('1')), pixels(img),
+                             cls.__name__)
+
+
+class UndoTest(unittest.TestCase):
+    """ Converting data back into images.
+    """
+
+    def testFrame(self):
+        img = randomImage(16, 8)
+        data = gamby.packColumns(img)
+        self.assertEqual(pixels(gamby.Sprites.undo(
+            [16, 8] + gamby.unpackUnits(data))), pixels(img))
+        self.assertEqual(pixels(gamby.Sprites.undo(memoryview(data),
+                                                   (16, 8))), pixels(img))
+
+
+    def testAnimation(self):
+        frames = [randomImage(8, 8, seed) for seed in range(3)]
+        code = gamby.Sprites.convertAsset(animation(frames), mask=False,
+                                          name="walk").code()
+        path = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(path, "walk.h"), 'w') as f:
+                f.write(code)
+            written = gamby.Sprites.unconvertFiles(
+                [os.path.join(path, "walk.h")], out=path)
+            self.assertEqual(written, [os.path.join(path, "walk.gif")])
+            img = Image.open(written[0])
+            self.assertEqual(img.n_frames, 3)
+            for n, frame in enumerate(frames):
+                img.seek(n)
+                self.assertEqual(pixels(img.convert('1')), pixels(frame))
+            img.close()
+        finally:
+            shutil.rmtree(path)
+
+
+class ParseCodeTest(unittest.TestCase):
+    """ Parsing generated (or hand-edited) code, and finding the converter
+        that generated each array.
+    """
+
+    def testParse(self):
+        code = """
+            // A comment, with a { brace.
+            PROGMEM prog_uchar walk[] = {
+                8, 2, /* width, height */
+                // Frame 0
+                0x1, 0x2, 0x3, 0x4, 0x5, 0x6, 0x7, 0x8,
+                // Frame 1
+                9, 10, 11, 12, 13, 14, 15, 16
+            };
+            PROGMEM prog_uint16_t tiles[] = { 0xffff, 0x1000 };
+            """
+        self.assertEqual(gamby.parseCode(code), [
+            ('prog_uchar', 'walk', 'Frame', [8, 2],
+             [list(range(1, 9)), list(range(9, 17))]),
+            ('prog_uint16_t', 'tiles', None, [0xffff, 0x1000], [])])
+
+
+    def testConverters(self):
+        assets = [gamby.Sprites.convertAsset(randomImage(8, 8),
+                                             name="sprite"),
+                  gamby.Icons.convertAsset(randomImage(8, 8), name="icon"),
+                  gamby.Splashscreens.convertAsset(randomImage(96, 64),
+                                                   name="splash"),
+                  gamby.Tilesets.convertAsset(randomImage(16, 16),
+                                              name="tileset")]
+        code = ''.join(asset.code() for asset in assets)
+        found = [(name, gamby.converterFor(dataType, label, sizes, name))
+                 for dataType, name, label, sizes, frames
+                 in gamby.parseCode(code)]
+        self.assertEqual(found, [('sprite', gamby.Sprites),
+                                 ('sprite_mask', gamby.Sprites),
+                                 ('icon', gamby.Icons),
+                                 ('splash', gamby.Splashscreens),
+                                 ('tileset', gamby.Tilesets)])
+
+
+    def testNotImages(self):
+        # Frame indices (16-bit, with over 255 frames) and tile maps are
+        # skipped; the atlas's own tiles are a tileset.
+        code = ''.join(gamby.Sprites.iterIndex("walk_index",
+                                               list(range(300))))
+        code += gamby.TileAtlases.convertAsset(randomImage(16, 16),
+                                               name="level").code()
+        parsed = gamby.parseCode(code)
+        self.assertEqual([(name, gamby.converterFor(t, label, sizes, name))
+                          for t, name, label, sizes, frames in parsed],
+                         [('walk_index', None), ('level', gamby.Tilesets),
+                          ('level_map', None)])
+        self.assertEqual([name for name, images
+                          in gamby.Sprites.unconvert(code)], ['level'])
+
+
+class ConvertFilesTest(unittest.TestCase):
+    """ Converting several files at once, in one process or several.
+    """
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.filenames = []
+        for seed in range(5):
+            filename = os.path.join(self.path, "sprite%d.gif" % seed)
+            randomImage(8 + seed * 4, 8, seed).save(filename)
+            self.filenames.append(filename)
+
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+
+    def convert(self, jobs):
+        out = os.path.join(self.path, "sprites.h")
+        size = [0, 0]
+        gamby.Sprites.convertFiles(self.filenames, size=size, mask=False,
+                                   out=out, jobs=jobs)
+        with open(out) as f:
+            return f.read(), size
+
+
+    def testJobs(self):
+        # The output is in the order given, however many jobs there are.
+        code, size = self.convert(1)
+        self.assertEqual(size, [5, sum(8 + seed * 4 for seed in range(5))])
+        self.assertEqual(self.convert(3), (code, size))
+        self.assertEqual([name for name, images
+                          in gamby.Sprites.unconvert(code)],
+                         ["sprite%d" % seed for seed in range(5)])
+
+
+class CacheTest(unittest.TestCase):
+    """ Caching converted data, keyed on the source's contents and the
+        conversion settings.
+    """
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.cache = gamby.ConversionCache(os.path.join(self.path, "cache"))
+        self.filename = os.path.join(self.path, "sprite.gif")
+        randomImage(8, 8).save(self.filename)
+
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+
+    def testKey(self):
+        key = self.cache.key(gamby.Sprites, self.filename, True)
+        self.assertEqual(self.cache.key(gamby.Sprites, self.filename, True),
+                         key)
+        others = [self.cache.key(gamby.Icons, self.filename, True),
+                  self.cache.key(gamby.Sprites, self.filename, False),
+                  self.cache.key(gamby.Sprites, self.filename, True,
+                                 'bayer')]
+        randomImage(8, 8, 1).save(self.filename)
+        others.append(self.cache.key(gamby.Sprites, self.filename, True))
+        self.assertEqual(len(set(others + [key])), 5)
+
+
+    def testHit(self):
+        converted = []
+
+        class Counted(gamby.Sprites):
+            @classmethod
+            def createArrays(cls, *args):
+                converted.append(args)
+                return gamby.Sprites.createArrays.__func__(cls, *args)
+
+        first = Counted.convertArrays(self.filename, cache=self.cache)
+        self.assertEqual(Counted.convertArrays(self.filename,
+                                               cache=self.cache), first)
+        self.assertEqual(len(converted), 1)
+        Counted.convertArrays(self.filename, mask=False, cache=self.cache)
+        self.assertEqual(len(converted), 2)
+
+
+    def testMiss(self):
+        self.assertIsNone(self.cache.get("missing"))
+        with open(self.cache._entryPath("corrupt"), 'wb') as f:
+            f.write(b"not a pickle")
+        self.assertIsNone(self.cache.get("corrupt"))
+        self.cache.put("data", ([('', [8, 8, [1] * 8])], 1, 8))
+        self.assertEqual(self.cache.get("data"),
+                         ([('', [8, 8, [1] * 8])], 1, 8))
+
+
+    def testEviction(self):
+        # The least recently used entries go first; reading an entry
+        # counts as using it.
+        for n, key in enumerate("abc"):
+            self.cache.put(key, list(range(1000)))
+            os.utime(self.cache._entryPath(key), (n, n))
+        self.cache.get("a")
+        self.cache.maxSize = os.path.getsize(self.cache._entryPath("a")) * 2
+        self.cache.evict()
+        self.assertEqual([self.cache.get(key) is not None for key in "abc"],
+                         [True, False, True])
+
+
+class BundleTest(unittest.TestCase):
+    """ Writing binary bundles, and reading them back without copying.
+    """
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.frames = [randomImage(16, 8, seed) for seed in range(3)]
+        self.sprite = os.path.join(self.path, "walk.gif")
+        animation(self.frames).save(self.sprite, save_all=True)
+        self.tiles = os.path.join(self.path, "tiles.gif")
+        randomImage(16, 16).save(self.tiles)
+
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+
+    def convert(self, cls, filename):
+        out = os.path.join(self.path, "out.bin")
+        cls.convertFiles([filename], mask=False, out=out, format='binary')
+        return gamby.Bundle(out)
+
+
+    def testSprite(self):
+        with self.convert(gamby.Sprites, self.sprite) as bundle:
+            self.assertEqual(list(bundle), ["walk"])
+            self.assertIn("walk", bundle)
+            self.assertEqual(bundle.index["walk"][2:],
+                             (16, 8, 3, 8, 2, 'raw'))
+            # The entry is the same as the array in generated code.
+            code = gamby.Sprites.convertAsset(self.sprite, mask=False).code()
+            (dataType, name, label, sizes, frames), = gamby.parseCode(code)
+            self.assertEqual(list(bytearray(bundle.entry("walk"))),
+                             sizes + sum(frames, []))
+            frame = bundle.frame("walk", 1)
+            self.assertIsInstance(frame, memoryview)
+            self.assertEqual(pixels(gamby.Sprites.undo(frame, (16, 8))),
+                             pixels(self.frames[1]))
+            self.assertEqual(len(bundle.frames("walk")), 3)
+            self.assertRaises(IndexError, bundle.frame, "walk", 3)
+
+
+    def testTiles(self):
+        # 16-bit units are stored little-endian, as in flash.
+        tiles = gamby.Tilesets.convertAsset(self.tiles).arrays[0][1]
+        with self.convert(gamby.Tilesets, self.tiles) as bundle:
+            self.assertEqual(bundle.index["tiles"][2:],
+                             (4, 4, 16, 16, 0, 'raw'))
+            self.assertEqual(bytes(bundle.frame("tiles", 5)),
+                             gamby.packUnits([tiles[5]], 16))
+
+
+    def testNotBundle(self):
+        filename = os.path.join(self.path, "out.bin")
+        with open(filename, 'wb') as f:
+            f.write(b"GIF89a" + b"\0" * 10)
+        self.assertRaises(IOError, gamby.Bundle, filename)
+
+
+class AtlasTest(unittest.TestCase):
+    """ Extracting the tiles of sheets of any size, and collecting them
+        into tile atlases.
+    """
+
+    def sheet(self, pattern):
+        """ Make a sheet of black and white tiles, one character per tile:
+            '#' for black.
+        """
+        img = Image.new('1', (len(pattern[0]) * 4, len(pattern) * 4), 255)
+        for y, row in enumerate(pattern):
+            for x, c in enumerate(row):
+                if c == '#':
+                    img.paste(0, (x * 4, y * 4, x * 4 + 4, y * 4 + 4))
+        return img
+
+
+    def testExtract(self):
+        # From the bottom right, up each column, from right to left; each
+        # tile is the same as the data of a 4x4 image.
+        img = randomImage(32, 16)
+        expected = [gamby.unpackUnits(gamby.packColumns(
+                        img.crop((x, y, x + 4, y + 4))), 16)[0]
+                    for x in range(28, -4, -4) for y in range(12, -4, -4)]
+        self.assertEqual(gamby.Tilesets.extractTiles(img), expected)
+        with withoutNumpy():
+            self.assertEqual(gamby.Tilesets.extractTiles(img), expected)
+
+
+    def testSheet(self):
+        asset = gamby.TileAtlases.convertAsset(
+            self.sheet(["#.#", ".#."]), dedup='sprite', name="level")
+        self.assertEqual(asset.arrays, [('', [0, 0xffff])])
+        self.assertEqual(asset.indexes, [('', [3, 2, 0, 1, 1, 0, 0, 1])])
+        self.assertEqual(asset.size, 2 * 2 + 8)
+        self.assertIn("level_map[]", asset.code())
+
+
+    def testShared(self):
+        table = gamby.FrameTable()
+        first, second = [gamby.TileAtlases.convertAsset(
+                             self.sheet(pattern), table=table, name=name)
+                         for pattern, name in [(["##"], "first"),
+                                               (["#.", ".."], "second")]]
+        self.assertEqual((first.arrays, second.arrays), ([], []))
+        self.assertEqual(first.indexes, [('', [2, 1, 0, 0])])
+        self.assertEqual(second.indexes, [('', [2, 2, 1, 1, 1, 0])])
+        self.assertEqual(table.arrays(),
+                         [("shared_frames_4x4", [4, 4, [0xffff], [0]])])
+        code = ''.join(gamby.TileAtlases.iterTable(table.arrays()))
+        self.assertEqual(gamby.parseCode(code),
+                         [('prog_uint16_t', 'shared_frames_4x4', 'Frame',
+                           [], [[0xffff, 0]])])
+
+
+    def testSize(self):
+        self.assertRaises(gamby.ConversionError,
+                          gamby.TileAtlases.convertAsset, randomImage(6, 4))
+
+
+class DedupTest(unittest.TestCase):
+    """ Removing duplicate frames, within an image and across several, and
+        the sizes reported afterwards. Sizes count frame data and indices;
+        like the sizes of converted images, they don't count dimensions.
+    """
+
+    def setUp(self):
+        self.frames = [randomImage(8, 8, seed) for seed in range(3)]
+        self.data = [gamby.unpackUnits(gamby.packColumns(f))
+                     for f in self.frames]
+
+
+    def testSprite(self):
+        a, b, c = self.frames
+        asset = gamby.Sprites.convertAsset(animation([a, b, a, b, c]),
+                                           mask=False, dedup='sprite',
+                                           name="walk")
+        self.assertEqual(asset.arrays, [('', [8, 8] + self.data)])
+        self.assertEqual(asset.indexes, [('', [0, 1, 0, 1, 2])])
+        self.assertEqual(asset.count, 5)
+        self.assertEqual(asset.size, 3 * 8 + 5)
+        self.assertIn("walk_index[]", asset.code())
+
+
+    def testBatch(self):
+        a, b, c = self.frames
+        table = gamby.FrameTable()
+        first = gamby.Sprites.convertAsset(animation([a, b]), mask=False,
+                                           dedup='batch', table=table,
+                                           name="first")
+        second = gamby.Sprites.convertAsset(animation([b, a, c]),
+                                            mask=False, dedup='batch',
+                                            table=table, name="second")
+        self.assertEqual(first.arrays, [])
+        self.assertEqual(first.indexes, [('', [0, 1])])
+        self.assertEqual(second.indexes, [('', [1, 0, 2])])
+        self.assertEqual(first.size, 2 * 8 + 2)
+        self.assertEqual(second.size, 8 + 3)
+        self.assertEqual(table.arrays(),
+                         [("shared_frames_8x8", [8, 8] + self.data)])
+
+
+    def testCompressedTable(self):
+        # The shared table is compressed, too: white frames compress well.
+        white = Image.new('1', (8, 8), 255)
+        table = gamby.FrameTable()
+        gamby.Sprites.convertAsset(animation([white, self.frames[0]]),
+                                   mask=False, dedup='batch', table=table)
+        report = []
+        arrays, saved = gamby.Sprites.finishTable(table, 'auto', report)
+        (name, encoded), = arrays
+        self.assertIsInstance(encoded, gamby.EncodedData)
+        self.assertEqual(gamby.decodeFrames(encoded.encoding, encoded.data,
+                                            encoded.frameCount),
+                         [[0] * 8, self.data[0]])
+        self.assertEqual(report, [(name, encoded.encoding, 18, 18 - saved)])
+        self.assertEqual(gamby.Sprites.finishTable(table),
+                         (table.arrays(), 0))
+
+
+    def testTableNames(self):
+        self.assertEqual(gamby.FrameTable.forOutput("out/sprites.h").prefix,
+                         "sprites_shared")
+        self.assertEqual(gamby.FrameTable.forOutput(sys.stdout).prefix,
+                         "shared_frames")
+
+
+class CompressionTest(unittest.TestCase):
+    """ Compressed data, decoded again from the frame lists, from generated
+        code, and from bundles.
+    """
+
+    def setUp(self):
+        # Mostly white frames, which compress well.
+        self.frames = []
+        for seed in range(3):
+            rand = random.Random(seed)
+            img = Image.new('1', (16, 16), 255)
+            for i in range(4):
+                img.putpixel((rand.randrange(16), rand.randrange(16)), 0)
+            self.frames.append(img)
+
+
+    def testRLE(self):
+        # Runs and literals longer than one packet can hold.
+        rand = random.Random(0)
+        data = [0] * 300 + [rand.randrange(256) for i in range(200)] + \
+            [1, 1, 2, 2, 2, 3]
+        self.assertEqual(gamby.decodeRLE(gamby.encodeRLE(data)), data)
+        self.assertEqual(gamby.encodeRLE([7] * 130), [255, 7])
+
+
+    def testEncodings(self):
+        frames = [gamby.unpackUnits(gamby.packColumns(f))
+                  for f in self.frames]
+        for encoding in gamby.ENCODINGS:
+            encoded = gamby.encodeFrames(encoding, frames)
+            self.assertEqual(gamby.decodeFrames(encoding, encoded, 3),
+                             frames, encoding)
+        self.assertEqual(gamby.encodeFrames('raw', frames),
+                         sum(frames, []))
+        self.assertEqual(gamby.decodeFrames('delta', [], 0), [])
+        self.assertRaises(ValueError, gamby.decodeFrames, 'zip', [], 0)
+
+
+    def testMasked(self):
+        # Pixels hidden by the mask (1 where transparent) are cleared.
+        frame = [0x5a] * 16 + [0] * 16
+        mask = [0xf0] * 16 + [0] * 16
+        for masked, expected in [(False, frame),
+                                 (True, [0x0a] * 16 + [0] * 16)]:
+            arrays, saved, report = gamby.Sprites.compressArrays(
+                [('', [16, 16, frame]), ('_mask', [16, 16, mask])], masked)
+            encoded = arrays[0][1]
+            self.assertIsInstance(encoded, gamby.EncodedData)
+            self.assertEqual(gamby.decodeFrames(encoded.encoding,
+                                                encoded.data, 1), [expected])
+            self.assertEqual(report[0][2:], (34, 4 + len(encoded.data)))
+
+
+    def unconvert(self, code):
+        """ Convert code back into images, expanding any frame indices.
+        """
+        # Indices have no frame comments; they are all 'dimensions'.
+        indexes = dict((name, sizes)
+                       for t, name, label, sizes, frames
+                       in gamby.parseCode(code) if name.endswith('_index'))
+        result = {}
+        for name, images in gamby.Sprites.unconvert(code):
+            images = [pixels(img.convert('1')) for img in images]
+            if name + '_index' in indexes:
+                images = [images[i] for i in indexes[name + '_index']]
+            result[name] = images
+        return result
+
+
+    def testCode(self):
+        a, b, c = self.frames
+        expected = [pixels(f) for f in (a, b, a, b, c)]
+        for dedup in (None, 'sprite'):
+            asset = gamby.Sprites.convertAsset(animation([a, b, a, b, c]),
+                                               mask=False, dedup=dedup,
+                                               compress='auto', name="walk")
+            self.assertIsInstance(asset.arrays[0][1], gamby.EncodedData)
+            self.assertEqual(self.unconvert(asset.code()),
+                             {"walk": expected}, dedup)
+
+
+    def testBundle(self):
+        a, b, c = self.frames
+        expected = [bytes(gamby.packColumns(f)) for f in (a, b, a, b, c)]
+        path = tempfile.mkdtemp()
+        try:
+            for dedup in (None, 'sprite'):
+                asset = gamby.Sprites.convertAsset(
+                    animation([a, b, a, b, c]), mask=False, dedup=dedup,
+                    compress='auto', name="walk")
+                filename = os.path.join(path, "walk.bin")
+                with open(filename, 'wb') as f:
+                    gamby.writeBundle(list(asset.entries()), f)
+                bundle = gamby.Bundle(filename)
+                frames = [bytes(f) for f in bundle.frames("walk")]
+                if dedup:
+                    frames = [frames[i] for i in bundle.entry("walk_index")]
+                self.assertNotEqual(bundle.index["walk"][-1], 'raw')
+                self.assertEqual(frames, expected, dedup)
+                bundle.close()
+        finally:
+            shutil.rmtree(path)
+
+
+class FontsTest(unittest.TestCase):
+    """ Converting glyph sheets, directories of glyphs and CharEdit
+        ``characters.dat`` files into characters, and back.
+    """
+
+    def sheet(self, *glyphs):
+        """ Make a glyph sheet, one cell per glyph; each glyph is a list of
+            the (x, y) positions of its black pixels.
+        """
+        img = Image.new('1', (len(glyphs) * 6, 8), 255)
+        for i, glyph in enumerate(glyphs):
+            for x, y in glyph:
+                img.putpixel((i * 6 + x, y), 0)
+        return img
+
+
+    def glyphs(self, img):
+        """ Get a sheet's characters, checking NumPy makes no difference.
+        """
+        values = gamby.Fonts.extractGlyphs(img)
+        with withoutNumpy():
+            self.assertEqual(gamby.Fonts.extractGlyphs(img), values)
+        return values
+
+
+    def testGlyphs(self):
+        # A space, a bar in the first column, and a 'j'-like descender two
+        # rows below the line (drawn two rows down).
+        bar = [(0, y) for y in range(5)]
+        hook = [(2, y) for y in range(2, 7)] + [(1, 6)]
+        self.assertEqual(self.glyphs(self.sheet([], bar, hook)),
+                         [2, 0x1f << 27 | 1,
+                          (0x1 << 19 | 0x1f << 10) << 7 | 2 << 4 | 3])
+
+
+    def testRandom(self):
+        rand = random.Random(0)
+        values = [rand.getrandbits(25) << 7 | rand.randrange(4) << 4
+                  for i in range(96)]
+        sheet = gamby.Fonts.undoArray(values, [])[0].convert('1')
+        self.assertEqual(len(self.glyphs(sheet)), 96)
+
+
+    def assertTooBig(self, img, problem):
+        with self.assertRaises(gamby.ConversionError) as e:
+            gamby.Fonts.extractGlyphs(img)
+        self.assertIn("Character 33 in", str(e.exception))
+        self.assertIn("too " + problem, str(e.exception))
+
+
+    def testTooBig(self):
+        # Ink in a cell's last column, or over 5 rows.
+        for glyph, problem in [([(5, 0)], "wide"),
+                               ([(0, 0), (0, 6)], "tall")]:
+            img = self.sheet([], glyph)
+            self.assertTooBig(img, problem)
+            with withoutNumpy():
+                self.assertTooBig(img, problem)
+
+
+    def testDirectory(self):
+        path = tempfile.mkdtemp()
+        try:
+            self.sheet([(0, 0)]).save(os.path.join(path, "65.gif"))
+            self.sheet([(1, 1)]).save(os.path.join(path, "B.gif"))
+            self.sheet([(2, 2)]).save(os.path.join(path, "notes.gif"))
+            values = gamby.Fonts.convertArrays(path)[1][0][1]
+        finally:
+            shutil.rmtree(path)
+        # The sheet is whole rows of 16 cells; the rest are blank.
+        a = ord('A') - 32
+        self.assertEqual(len(values), 48)
+        # Top left pixels: the top of the first and second columns.
+        self.assertEqual(values[a:a + 2], [1 << 27 | 1, 1 << 23 | 2])
+        self.assertEqual(values[:a] + values[a + 2:], [2] * 46)
+
+
+    def testCharacters(self):
+        # CharEdit's own file is read and written unchanged.
+        filename = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, "Processing", "CharEdit",
+                                "characters.dat")
+        if not os.path.exists(filename):
+            self.skipTest("characters.dat is not available")
+        with open(filename, 'rb') as f:
+            data = f.read()
+        values = gamby.Fonts.readCharacters(filename)
+        self.assertEqual(len(values), len(data) // 27)
+        out = BytesIO()
+        gamby.Fonts.writeCharacters(values, out)
+        self.assertEqual(out.getvalue(), data)
+        self.assertEqual(gamby.Fonts.convertArrays(filename)[1],
+                         [('', values)])
+
+
+class SheetsTest(unittest.TestCase):
+    """ Slicing sprite sheets: by a given cell size, by the cell size in
+        the sheet's name, or by finding the sprites.
+    """
+
+    def setUp(self):
+        # Three 8x8 sprites on a transparent 24x16 sheet: two on the top
+        # row, one in the middle of the bottom row.
+        self.sprites = [randomImage(8, 8, seed) for seed in range(3)]
+        self.sheet = Image.new('LA', (24, 16), (255, 0))
+        for sprite, pos in zip(self.sprites, [(0, 0), (8, 0), (8, 8)]):
+            self.sheet.paste(sprite.convert('LA'), pos)
+        self.path = tempfile.mkdtemp()
+
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+
+    def save(self, name):
+        filename = os.path.join(self.path, name)
+        self.sheet.save(filename)
+        return filename
+
+
+    def spriteData(self, *numbers):
+        return [('_%d' % n, [8, 8, gamby.unpackUnits(
+                    gamby.packColumns(self.sprites[i]))])
+                for i, n in enumerate(numbers)]
+
+
+    def testGrid(self):
+        # Empty cells are skipped, but still numbered.
+        filename, arrays, count, size = gamby.Sheets.convertArrays(
+            self.save("sheet.png"), mask=False, grid=(8, 8))
+        self.assertEqual(arrays, self.spriteData(0, 1, 4))
+        self.assertEqual((count, size), (3, 24))
+
+
+    def testFilename(self):
+        filename = self.save("sheet_8x8.png")
+        self.assertEqual(gamby.Sheets.gridSize(filename), (8, 8))
+        arrays = gamby.Sheets.convertArrays(filename, mask=False)[1]
+        self.assertEqual(arrays, self.spriteData(0, 1, 4))
+        # A given cell size overrides the one in the name.
+        arrays = gamby.Sheets.convertArrays(filename, mask=False,
+                                            grid=(24, 8))[1]
+        self.assertEqual([(suffix, data[:2]) for suffix, data in arrays],
+                         [('_0', [24, 8]), ('_1', [24, 8])])
+
+
+    def testFound(self):
+        # Without a cell size, touching sprites are found as one.
+        arrays = gamby.Sheets.convertArrays(self.save("sheet.png"),
+                                            mask=False)[1]
+        self.assertEqual([(suffix, data[:2]) for suffix, data in arrays],
+                         [('_0', [16, 16])])
+
+
+    def testBadGrid(self):
+        self.assertEqual(gamby.Sheets.parseGrid("16x24"), (16, 24))
+        for text in ("16", "0x8", "8x8x8", "wide"):
+            self.assertRaises(ValueError, gamby.Sheets.parseGrid, text)
+        self.assertRaises(gamby.ConversionError,
+                          gamby.Sheets.convertArrays, self.save("sheet.png"),
+                          grid=(16, 16))
+
+
+    def testCacheKey(self):
+        cache = gamby.ConversionCache(self.path)
+        filename = self.save("sheet_8x8.png")
+        keys = set(cache.key(gamby.Sheets, filename, False, grid=grid)
+                   for grid in (None, (8, 8), (24, 8)))
+        self.assertEqual(len(keys), 2)
+        self.assertEqual(cache.key(gamby.Sprites, filename, False),
+                         cache.key(gamby.Sprites, filename, False,
+                                   grid=(24, 8)))
+
+
+class ProfileTest(unittest.TestCase):
+    """ Counting the time spent in each stage of conversion, and how much
+        each processed.
+    """
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.filenames = []
+        for seed in range(2):
+            filename = os.path.join(self.path, "walk%d.gif" % seed)
+            frames = [randomImage(16, 8, seed * 3 + n) for n in range(3)]
+            animation(frames).save(filename, save_all=True)
+            self.filenames.append(filename)
+
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+
+    def profile(self, jobs=1):
+        with gamby.Profile() as profile:
+            gamby.Sprites.convertFiles(self.filenames, mask=False, jobs=jobs,
+                                       out=os.path.join(self.path, "out.h"))
+        return profile
+
+
+    def counts(self, profile):
+        """ Get a profile's counts, without the times.
+        """
+        return dict((filename, dict((stage, dict(stats, time=0))
+                                    for stage, stats in stages.items()))
+                    for filename, stages in profile.files.items())
+
+
+    def testStages(self):
+        profile = self.profile()
+        self.assertEqual(profile.order, self.filenames)
+        stages = profile.files[self.filenames[0]]
+        self.assertEqual(set(stages), set(['open', 'decode', 'pack', 'emit']))
+        self.assertEqual(stages['decode']['frames'], 3)
+        self.assertEqual(stages['pack']['pixels'], 16 * 8 * 3)
+        self.assertEqual(stages['pack']['bytes'], 16 * 3)
+        totals = profile.totals()
+        self.assertEqual(totals['pack']['calls'], 6)
+        self.assertIsNone(gamby.Profile.active())
+
+
+    def testJobs(self):
+        # Counts made in other processes are merged.
+        self.assertEqual(self.counts(self.profile(jobs=2)),
+                         self.counts(self.profile()))
+
+
+    def testNested(self):
+        with gamby.Profile() as outer:
+            with gamby.Profile() as inner:
+                with gamby.profileStage('pack', randomImage(8, 8)):
+                    pass
+            self.assertIs(gamby.Profile.active(), outer)
+        self.assertEqual(inner.totals()['pack']['pixels'], 64)
+        self.assertEqual(outer.files, {})
+
+
+    def testReport(self):
+        profile = self.profile()
+        out = StringIO()
+        profile.report(out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[0].split()[:2], ["file", "stage"])
+        self.assertIn("Total", [line.split()[0] for line in lines])
+        out = StringIO()
+        profile.report(out, 'json')
+        report = json.loads(out.getvalue())
+        self.assertEqual(sorted(report['files']), sorted(self.filenames))
+        self.assertEqual(report['total']['pack']['calls'], 6)
+        self.assertRaises(ValueError, profile.report, out, 'xml')
+
+
+class WatcherTest(unittest.TestCase):
+    """ Keeping an output up to date by converting only the files that
+        changed.
+    """
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.filenames = [os.path.join(self.path, "sprite%d.gif" % seed)
+                          for seed in range(3)]
+        for seed, filename in enumerate(self.filenames):
+            randomImage(8, 8, seed).save(filename)
+        self.output = os.path.join(self.path, "sprites.h")
+        os.mkdir(os.path.join(self.path, "expected"))
+        self.err = StringIO()
+
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+
+    def save(self, filename, img):
+        """ Replace a file, making sure its modification time changes.
+        """
+        mtime = os.path.getmtime(filename) + 10
+        img.save(filename)
+        os.utime(filename, (mtime, mtime))
+
+
+    def expected(self, **kwargs):
+        """ Get the code and size `convertFiles()` generates, for an output
+            of the same name (which names any shared table).
+        """
+        out = os.path.join(self.path, "expected", "sprites.h")
+        size = [0, 0]
+        gamby.Sprites.convertFiles(self.filenames, size=size, out=out,
+                                   **kwargs)
+        with open(out) as f:
+            return f.read(), size
+
+
+    def written(self, watcher):
+        with open(self.output) as f:
+            return f.read(), watcher.size
+
+
+    def testUpdate(self):
+        watcher = gamby.Watcher(gamby.Sprites, self.filenames, self.output,
+                                err=self.err)
+        self.assertEqual(watcher.update(), self.filenames)
+        self.assertEqual(self.written(watcher), self.expected())
+        self.assertEqual(watcher.update(), [])
+        # Only files whose contents changed are converted again.
+        self.save(self.filenames[1], randomImage(16, 8, 5))
+        mtime = os.path.getmtime(self.filenames[2]) + 10
+        os.utime(self.filenames[2], (mtime, mtime))
+        self.assertEqual(watcher.update(), [self.filenames[1]])
+        self.assertEqual(self.written(watcher), self.expected())
+
+
+    def testBatch(self):
+        # With a shared table, every file's indices are regenerated.
+        watcher = gamby.Watcher(gamby.Sprites, self.filenames, self.output,
+                                dedup='batch', err=self.err)
+        watcher.update()
+        self.save(self.filenames[0], randomImage(8, 8, 2))
+        self.assertEqual(watcher.update(), [self.filenames[0]])
+        self.assertEqual(self.written(watcher), self.expected(dedup='batch'))
+
+
+    def testBroken(self):
+        # A file that can't be converted keeps its previous code.
+        watcher = gamby.Watcher(gamby.Sprites, self.filenames, self.output,
+                                err=self.err)
+        watcher.update()
+        code = self.written(watcher)
+        with open(self.filenames[1], 'wb') as f:
+            f.write(b"GIF89a")
+        self.assertEqual(watcher.update(), [])
+        self.assertIn(self.filenames[1], self.err.getvalue())
+        self.assertEqual(self.written(watcher), code)
+
+
+class ManifestTest(unittest.TestCase):
+    """ Building the outputs listed in a manifest, skipping those that are
+        up to date.
+    """
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        for seed in range(2):
+            randomImage(8, 8, seed).save(
+                os.path.join(self.path, "sprite%d.gif" % seed))
+        self.filename = self.write({
+            "sprites.bin": {"mode": "sprite", "sources": ["*.gif"],
+                            "format": "incbin"},
+            "walk.h": {"mode": "sprite", "sources": ["sprite0.gif"]}})
+
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+
+    def write(self, targets):
+        filename = os.path.join(self.path, "build.json")
+        with open(filename, 'w') as f:
+            json.dump(targets, f)
+        return filename
+
+
+    def build(self):
+        """ Build the manifest, returning the names of the outputs built.
+        """
+        err = StringIO()
+        gamby.Manifest(self.filename).build(err=err)
+        return [line.split()[1].rstrip(':')
+                for line in err.getvalue().splitlines()
+                if line.startswith("Built")]
+
+
+    def testBuild(self):
+        self.assertEqual(self.build(), ["sprites.bin", "walk.h"])
+        for name in ("sprites.bin", "sprites.h", "walk.h"):
+            self.assertTrue(os.path.exists(os.path.join(self.path, name)))
+        self.assertEqual(self.build(), [])
+
+
+    def testChanged(self):
+        self.build()
+        randomImage(8, 8, 2).save(os.path.join(self.path, "sprite1.gif"))
+        self.assertEqual(self.build(), ["sprites.bin"])
+        self.write({"walk.h": {"mode": "sprite", "sources": ["sprite0.gif"],
+                               "dither": "bayer"}})
+        self.assertEqual(self.build(), ["walk.h"])
+
+
+    def testOutputs(self):
+        # Every file written for an output must exist, and be newer than
+        # the sources.
+        self.build()
+        os.remove(os.path.join(self.path, "sprites.h"))
+        self.assertEqual(self.build(), ["sprites.bin"])
+        source = os.path.join(self.path, "sprite0.gif")
+        future = os.path.getmtime(source) + 60
+        os.utime(source, (future, future))
+        self.assertEqual(self.build(), ["sprites.bin", "walk.h"])
+
+
+    def testInvalid(self):
+        for settings in [{"mode": "sprite"},
+                         {"mode": "movie", "sources": ["*.gif"]},
+                         {"mode": "sprite", "sources": ["*.gif"],
+                          "colors": 2},
+                         {"mode": "sprite", "sources": ["*.gif"],
+                          "grid": "8x8"},
+                         {"mode": "sheet", "sources": ["*.gif"],
+                          "grid": "8"}]:
+            self.write({"out.h": settings})
+            self.assertRaises(ValueError, gamby.Manifest, self.filename)
+
+
+class DitherTest(unittest.TestCase):
+    """ Converting images that aren't 1-bit, and animations, with each of
+        the dithering methods.
+    """
+
+    def gradient(self, width=16, height=8):
+        """ Make a grayscale image that goes from black on the left to
+            white on the right.
+        """
+        img = Image.new('L', (width, height))
+        img.putdata([x * 256 // width + 256 // width // 2
+                     for y in range(height) for x in range(width)])
+        return img
+
+
+    def testOneBit(self):
+        img = randomImage(16, 8)
+        for method in list(gamby.DITHERS) + [None]:
+            self.assertIs(gamby.Dither(method)(img), img)
+
+
+    def testThreshold(self):
+        result = gamby.Dither('threshold')(self.gradient())
+        self.assertEqual(result.mode, '1')
+        self.assertEqual(pixels(result),
+                         ([0] * 8 + [255] * 8) * 8)
+
+
+    def testBayer(self):
+        # Each 8x8 block of a flat gray has as many white pixels as the
+        # gray is light.
+        dither = gamby.Dither('bayer')
+        for level, white in [(0, 0), (64, 16), (128, 32), (255, 64)]:
+            result = dither(Image.new('L', (16, 8), level))
+            for x in (0, 8):
+                block = result.crop((x, 0, x + 8, 8))
+                self.assertEqual(pixels(block).count(255), white)
+        self.assertIs(dither.pattern((16, 8)), dither.pattern((16, 8)))
+
+
+    def testDiffusion(self):
+        img = self.gradient()
+        expected = pixels(img.convert('1'))
+        for method in ('diffusion', None):
+            self.assertEqual(pixels(gamby.Dither(method)(img)), expected)
+
+
+    def testStable(self):
+        # Only the pixels that change from one frame to the next are
+        # dithered again; the rest are kept from the previous frame.
+        first = self.gradient(32, 16)
+        second = first.copy()
+        changed = (4, 4, 12, 12)
+        second.paste(100, changed)
+        dither = gamby.Dither('stable')
+        before = dither(first)
+        after = dither(second)
+        fresh = second.convert('1')
+        for y in range(16):
+            for x in range(32):
+                inside = 4 <= x < 12 and 4 <= y < 12
+                expected = (fresh if inside else before).getpixel((x, y))
+                self.assertEqual(after.getpixel((x, y)), expected)
+        # A frame of a different size starts over.
+        other = self.gradient(8, 8)
+        self.assertEqual(pixels(dither(other)), pixels(other.convert('1')))
+
+
+    def testSprites(self):
+        img = self.gradient()
+        for method in gamby.DITHERS:
+            expected = gamby.unpackUnits(
+                gamby.packColumns(gamby.Dither(method)(img)))
+            arrays = gamby.Sprites.createArrays(img, mask=False,
+                                                dither=method)[0]
+            self.assertEqual(arrays, [('', [16, 8, expected])])
+            with withoutNumpy():
+                self.assertEqual(gamby.Sprites.createArrays(
+                    img, mask=False, dither=method)[0], arrays)
+
+
+    def testUnknown(self):
+        self.assertRaises(ValueError, gamby.Dither, 'fancy')
+        out = StringIO()
+        self.assertRaises(ValueError, gamby.Sprites.convertFiles, [],
+                          out=out, dither='fancy')
+
+
+class ScreenTest(unittest.TestCase):
+    """ Drawing converted data on the emulated LCD.
+    """
+
+    def setUp(self):
+        self.screen = gamby.Screen()
+        self.screen.clear()
+
+
+    def region(self, box):
+        return pixels(self.screen.image().crop(box))
+
+
+    def assertBlank(self, box):
+        """ Check that everything outside of the box is white.
+        """
+        img = self.screen.image()
+        img.paste(255, box)
+        self.assertEqual(pixels(img), [255] * (96 * 64))
+
+
+    def testSprite(self):
+        # Sizes are multiples of 8 pixels, so none are dropped by packing.
+        sprite = randomImage(12, 10)
+        asset = gamby.Sprites.convertAsset(sprite, mask=False)
+        self.screen.drawSprite(5, 3, asset.frames[0], (12, 10))
+        self.assertEqual(self.region((5, 3, 17, 13)), pixels(sprite))
+        self.assertBlank((5, 3, 17, 13))
+
+
+    def testClipping(self):
+        sprite = randomImage(12, 10)
+        frame = gamby.Sprites.convertAsset(sprite, mask=False).frames[0]
+        self.screen.drawSprite(-3, 60, frame, (12, 10))
+        self.screen.drawSprite(90, -6, frame, (12, 10))
+        self.assertEqual(self.region((0, 60, 9, 64)),
+                         pixels(sprite.crop((3, 0, 12, 4))))
+        self.assertEqual(self.region((90, 0, 96, 4)),
+                         pixels(sprite.crop((0, 6, 6, 10))))
+        img = self.screen.image()
+        img.paste(255, (0, 60, 9, 64))
+        img.paste(255, (90, 0, 96, 4))
+        self.assertEqual(pixels(img), [255] * (96 * 64))
+
+
+    def testTall(self):
+        # Sprites taller than the screen are drawn in bands.
+        sprite = randomImage(8, 80)
+        frame = gamby.Sprites.convertAsset(sprite, mask=False).frames[0]
+        self.assertEqual([band[:2] for band in
+                          self.screen.decode(frame, (8, 80))],
+                         [(0, 64), (64, 16)])
+        self.screen.drawSprite(0, -8, frame, (8, 80))
+        self.assertEqual(self.region((0, 0, 8, 64)),
+                         pixels(sprite.crop((0, 8, 8, 72))))
+
+
+    def testMask(self):
+        # The sprite's transparent left half leaves the checkerboard alone.
+        sprite = randomImage(8, 8).convert('LA')
+        sprite.paste((255, 0), (0, 0, 4, 8))
+        asset = gamby.Sprites.convertAsset(sprite, mask=True)
+        self.screen.clear(gamby.Screen.CHECKERBOARD)
+        background = self.screen.image()
+        self.screen.drawSprite(2, 3, asset.frames[0], (8, 8), asset.mask[0])
+        expected = background.copy()
+        expected.paste(sprite.convert('1').crop((4, 0, 8, 8)), (6, 3))
+        self.assertEqual(pixels(self.screen.image()), pixels(expected))
+        self.assertNotEqual(pixels(background.crop((2, 3, 6, 11))),
+                            [255] * 32)
+
+
+    def testIcon(self):
+        # An icon's bytes are written straight into a page.
+        icon = randomImage(8, 8)
+        frame = gamby.Icons.convertAsset(icon, mask=False).frames[0]
+        self.screen.drawIcon(10, 3, frame, 8)
+        self.assertEqual(self.region((10, 24, 18, 32)), pixels(icon))
+        pages = self.screen.pages()
+        self.assertEqual(len(pages), 8 * 96)
+        self.assertEqual(pages[3 * 96 + 10:3 * 96 + 18], frame)
+        self.assertEqual(pages.count(b'\0'), 8 * 96 - 8 + frame.count(b'\0'))
+
+
+class PreviewTest(unittest.TestCase):
+    """ Previewing converted images on the emulated LCD, and writing the
+        screens to contact sheets and animated GIFs.
+    """
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+
+    def testSprites(self):
+        frames = [randomImage(16, 8, seed) for seed in range(3)]
+        asset = gamby.Sprites.convertAsset(animation(frames), mask=False)
+        screens = gamby.Sprites.preview(asset)
+        self.assertEqual(len(screens), 3)
+        for frame, img in zip(frames, screens):
+            self.assertEqual(img.size, (96, 64))
+            self.assertEqual(pixels(img.crop((0, 0, 16, 8))), pixels(frame))
+
+
+    def testSplashscreen(self):
+        img = randomImage(96, 64)
+        asset = gamby.Splashscreens.convertAsset(img)
+        screen, = gamby.Splashscreens.preview(asset)
+        self.assertEqual(pixels(screen), pixels(img))
+
+
+    def testTileset(self):
+        # The tiles are laid out as in the source image.
+        img = randomImage(16, 16)
+        screen, = gamby.Tilesets.preview(gamby.Tilesets.convertAsset(img))
+        self.assertEqual(pixels(screen.crop((0, 0, 16, 16))), pixels(img))
+
+
+    def testContactSheet(self):
+        images = [Image.new('1', (96, 64), 0) for i in range(3)]
+        sheet = gamby.contactSheet(images, columns=2, spacing=2, scale=2)
+        self.assertEqual(sheet.mode, 'L')
+        self.assertEqual(sheet.size, (2 * 194 + 2, 2 * 130 + 2))
+        self.assertEqual(sheet.getpixel((1, 1)), 128)
+        self.assertEqual(sheet.getpixel((2, 2)), 0)
+        self.assertEqual(sheet.getpixel((196, 2)), 0)
+        self.assertEqual(sheet.getpixel((2, 132)), 0)
+        self.assertEqual(sheet.getpixel((196, 132)), 128)
+
+
+    def testPreviewFiles(self):
+        filenames = []
+        for seed in range(2):
+            filename = os.path.join(self.path, "sprite%d.gif" % seed)
+            animation([randomImage(8, 8, seed),
+                       randomImage(8, 8, seed + 2)]).save(filename,
+                                                           save_all=True)
+            filenames.append(filename)
+        out = os.path.join(self.path, "preview.png")
+        self.assertEqual(gamby.Sprites.previewFiles(filenames, out,
+                                                    mask=False), 4)
+        with Image.open(out) as img:
+            self.assertEqual(img.size, (4 * 98 + 2, 68))
+        out = os.path.join(self.path, "preview.gif")
+        self.assertEqual(gamby.Sprites.previewFiles(filenames, out,
+                                                    mask=False, scale=2), 4)
+        with Image.open(out) as img:
+            self.assertEqual((img.size, img.n_frames), ((192, 128), 4))
+        self.assertRaises(gamby.ConversionError,
+                          gamby.Sprites.previewFiles, [], out)
+
+
+class NumpyEquivalenceTest(unittest.TestCase):
+    """ The NumPy and pure-Python versions of each function give the same
+        results. Sizes are chosen so rows and columns aren't byte-aligned.
+    """
+
+    def setUp(self):
+        if gamby._numpy() is None:
+            self.skipTest("NumPy is not installed")
+
+
+    def assertSame(self, function, *args, **kwargs):
+        withNumpy = function(*args, **kwargs)
+        with withoutNumpy():
+            self.assertEqual(withNumpy, function(*args, **kwargs))
+
+
+    def testPacking(self):
+        for size in [(8, 8), (13, 11), (16, 16), (24, 16), (96, 64)]:
+            img = randomImage(*size, seed=size[0])
+            for unitSize in (8, 16):
+                self.assertSame(gamby.packColumns, img, unitSize)
+            if size[1] % 8 == 0:
+                self.assertSame(gamby.packColumns, img, bandHeight=8)
+            self.assertSame(gamby.packRegions, img,
+                            [(0, 0, 4, 4), (1, 2, size[0], size[1] - 1)])
+
+
+    def testUnpacking(self):
+        # The 7 pixels left over after the last whole byte are dropped when
+        # packing, and come back white: the top of the last column.
+        img = randomImage(13, 11)
+        unpack = lambda data: pixels(gamby.unpackColumns(data, img.size))
+        data = gamby.packColumns(img)
+        self.assertSame(unpack, data)
+        expected = pixels(img)
+        for i in range(12, 13 * 7, 13):
+            expected[i] = 255
+        self.assertEqual(unpack(data), expected)
+        # In row order, missing pixels are the end of the last row.
+        data = bytes(bytearray(random.Random(0).getrandbits(8)
+                               for i in range(17)))
+        self.assertSame(lambda data: pixels(gamby.unpackBits(data, (13, 11))),
+                        data)
+        self.assertEqual(pixels(gamby.unpackBits(data, (13, 11)))[136:],
+                         [255] * 7)
+
+
+if __name__ == "__main__":
+    unittest.main()